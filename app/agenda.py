@@ -0,0 +1,58 @@
+# app/agenda.py
+
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import subqueryload
+
+from . import models
+
+# Estratégia de carregamento do grafo de um agendamento, escolhida por relação:
+# - customer/service/professional são muitos-para-um repetidos entre agendamentos:
+#   subquery faz um único SELECT juntando a consulta dos agendamentos como subconsulta.
+#   (selectin manda os ids em lotes de 500, então períodos longos custavam mais consultas.)
+# - Customer.tags é muitos-para-muitos: subquery carrega todas as tags de uma vez.
+# - Professional.user é um-para-um: joined dentro do SELECT dos profissionais.
+# Total: 5 consultas, independente do tamanho do período (ver benchmarks/calendar_queries.py).
+CALENDAR_LOAD_OPTIONS = (
+    subqueryload(models.Appointment.customer).subqueryload(models.Customer.tags),
+    subqueryload(models.Appointment.service),
+    subqueryload(models.Appointment.professional).joinedload(models.Professional.user),
+)
+
+
+async def list_calendar(
+    db: AsyncSession,
+    start: date,
+    end: date,
+    professional_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+) -> dict:
+    """Carrega os agendamentos de [start, end] com todo o grafo relacionado, sem N+1."""
+    query = (
+        select(models.Appointment)
+        .where(models.Appointment.date >= start, models.Appointment.date <= end)
+        .options(*CALENDAR_LOAD_OPTIONS)
+        .order_by(models.Appointment.date, models.Appointment.start_time, models.Appointment.id)
+    )
+    if professional_id is not None:
+        query = query.where(models.Appointment.professional_id == professional_id)
+    if customer_id is not None:
+        query = query.where(models.Appointment.customer_id == customer_id)
+    appointments = (await db.execute(query)).scalars().all()
+
+    # O identity map já garante uma instância por linha; aqui só removemos as repetições do payload
+    customers, services, professionals = {}, {}, {}
+    for appointment in appointments:
+        customers.setdefault(appointment.customer_id, appointment.customer)
+        services.setdefault(appointment.service_id, appointment.service)
+        professionals.setdefault(appointment.professional_id, appointment.professional)
+
+    return {
+        "appointments": appointments,
+        "customers": list(customers.values()),
+        "services": list(services.values()),
+        "professionals": list(professionals.values()),
+    }
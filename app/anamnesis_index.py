@@ -0,0 +1,197 @@
+# app/anamnesis_index.py
+
+import argparse
+import math
+import os
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, delete, event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .customer_search import fold
+from .database import SessionLocal
+from .events import on_commit
+
+# Tempo máximo que a lista de campos indexados fica em cache (mudanças feitas por outros workers)
+INDEXED_KEYS_TTL = float(os.getenv("ANAMNESIS_INDEXED_KEYS_TTL", "60"))
+BACKFILL_BATCH_SIZE = 1000
+MAX_TEXT_LENGTH = 255
+
+answers = models.AnamnesisAnswerIndex.__table__
+records = models.AnamnesisRecord.__table__
+fields = models.AnamnesisTemplateField.__table__
+
+
+class AnamnesisFilterError(ValueError):
+    """Filtro inválido (campo não indexado, operador incompatível com o valor, etc.)."""
+
+
+# --- Campos Indexados ---
+_indexed_keys: Optional[Set[str]] = None
+_indexed_keys_loaded_at = 0.0
+_indexed_keys_lock = threading.Lock()
+
+def indexed_keys(connection) -> Set[str]:
+    """Chaves dos campos de anamnese marcados como `indexed` (em cache por alguns segundos)."""
+    global _indexed_keys, _indexed_keys_loaded_at
+    with _indexed_keys_lock:
+        if _indexed_keys is not None and time.monotonic() - _indexed_keys_loaded_at < INDEXED_KEYS_TTL:
+            return _indexed_keys
+    keys = {row[0] for row in connection.execute(select(fields.c.key).where(fields.c.indexed.is_(True)))}
+    with _indexed_keys_lock:
+        _indexed_keys, _indexed_keys_loaded_at = keys, time.monotonic()
+    return keys
+
+@on_commit(models.AnamnesisTemplateField)
+def _forget_indexed_keys(changes):
+    global _indexed_keys
+    with _indexed_keys_lock:
+        _indexed_keys = None
+
+
+# --- Normalização das Respostas ---
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value) if isinstance(value, (int, float)) else float(str(value).strip().replace(",", "."))
+    except (ValueError, OverflowError):
+        return None
+    # "nan", "inf" e inteiros enormes não são comparáveis nem cabem na coluna numérica
+    return number if math.isfinite(number) else None
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, bool):
+        value = "sim" if value else "não"
+    return fold(str(value)).strip()[:MAX_TEXT_LENGTH]
+
+def answer_rows(record_id: int, customer_id: int, data: Optional[dict], keys: Set[str]) -> List[dict]:
+    """Linhas do índice para as respostas de `data` nos campos `keys`. Listas geram uma linha por item."""
+    rows = []
+    for key in keys.intersection(data or {}):
+        value = data[key]
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or item == "":
+                continue
+            rows.append({
+                "record_id": record_id,
+                "customer_id": customer_id,
+                "field_key": key,
+                "value_text": _as_text(item),
+                "value_number": _as_number(item),
+            })
+    return rows
+
+
+# --- Manutenção do Índice ---
+def index_records(connection, items: Iterable[tuple], keys: Optional[Set[str]] = None):
+    """(Re)indexa registros dados como (id, customer_id, data)."""
+    items = list(items)
+    if not items:
+        return
+    keys = indexed_keys(connection) if keys is None else keys
+    connection.execute(delete(answers).where(answers.c.record_id.in_([item[0] for item in items])))
+    rows = [row for record_id, customer_id, data in items for row in answer_rows(record_id, customer_id, data, keys)]
+    if rows:
+        connection.execute(answers.insert(), rows)
+
+
+@event.listens_for(models.AnamnesisRecord, "after_insert")
+def _index_new_record(mapper, connection, target):
+    index_records(connection, [(target.id, target.customer_id, target.data)])
+
+@event.listens_for(models.AnamnesisRecord, "after_update")
+def _reindex_record(mapper, connection, target):
+    # Obs: alterações "in place" no dict de `data` não são detectadas pelo ORM; reatribua o dict.
+    state = inspect(target)
+    if state.attrs.data.history.has_changes() or state.attrs.customer_id.history.has_changes():
+        index_records(connection, [(target.id, target.customer_id, target.data)])
+
+@event.listens_for(models.AnamnesisRecord, "before_delete")
+def _unindex_record(mapper, connection, target):
+    connection.execute(delete(answers).where(answers.c.record_id == target.id))
+
+
+def backfill(batch_size: int = BACKFILL_BATCH_SIZE, bind=None) -> int:
+    """
+    Reindexa todas as fichas de anamnese com os campos indexados atuais.
+    Necessário depois de marcar um campo existente como `indexed`. Retorna o total processado.
+    `bind`: outra conexão/motor (ex: o bootstrap); por padrão, o banco principal.
+    """
+    db = Session(bind=bind) if bind is not None else SessionLocal()
+    total, last_id = 0, 0
+    try:
+        connection = db.connection()
+        keys = indexed_keys(connection)
+        connection.execute(delete(answers).where(answers.c.field_key.notin_(keys)) if keys else delete(answers))
+        query = select(records.c.id, records.c.customer_id, records.c.data).order_by(records.c.id)
+        while True:
+            page = connection.execute(query.where(records.c.id > last_id).limit(batch_size)).all()
+            if not page:
+                break
+            index_records(connection, page, keys)
+            total += len(page)
+            last_id = page[-1][0]
+            db.commit()
+            connection = db.connection()
+    finally:
+        db.close()
+    return total
+
+
+# --- Filtro ---
+def _condition(op: str, value: Any):
+    """Condição sobre as colunas do índice, com comparação tipada conforme o valor."""
+    if op in ("lt", "lte", "gt", "gte"):
+        number = _as_number(value)
+        if number is None:
+            raise AnamnesisFilterError(f"O operador '{op}' exige um valor numérico")
+        column = answers.c.value_number
+        return {"lt": column < number, "lte": column <= number, "gt": column > number, "gte": column >= number}[op]
+    if op == "in":
+        if not isinstance(value, list) or not value:
+            raise AnamnesisFilterError("O operador 'in' exige uma lista não vazia")
+        return answers.c.value_text.in_([_as_text(v) for v in value])
+    if op == "contains":
+        pattern = _as_text(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return answers.c.value_text.like(f"%{pattern}%", escape="\\")
+    number = _as_number(value) if not isinstance(value, str) else None
+    column, target = (answers.c.value_number, number) if number is not None else (answers.c.value_text, _as_text(value))
+    return column == target if op == "eq" else column != target
+
+
+async def search_records(db: AsyncSession, filters: List[dict], limit: int = 100, after_id: Optional[int] = None):
+    """
+    Fichas de anamnese que satisfazem todos os filtros. Cada filtro vira uma subconsulta
+    sobre o índice (field_key, valor), sem abrir o JSON de nenhuma ficha.
+    """
+    keys = await db.run_sync(lambda session: indexed_keys(session.connection()))
+    query = select(models.AnamnesisRecord)
+    for item in filters:
+        if item["key"] not in keys:
+            raise AnamnesisFilterError(f"O campo '{item['key']}' não está indexado")
+        matching = select(answers.c.record_id).where(and_(answers.c.field_key == item["key"], _condition(item["op"], item["value"])))
+        query = query.where(models.AnamnesisRecord.id.in_(matching))
+    if after_id is not None:
+        query = query.where(models.AnamnesisRecord.id > after_id)
+    query = query.order_by(models.AnamnesisRecord.id).limit(limit)
+    return list((await db.execute(query)).scalars().all())
+
+
+# Uso: python -m app.anamnesis_index backfill
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do índice de respostas de anamnese.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    total = backfill(batch_size=args.batch_size)
+    print(f"Índice de anamnese reconstruído: {total} fichas em {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
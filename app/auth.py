@@ -1,17 +1,27 @@
 # app/auth.py
 
 import os
+import hmac
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .database import get_db
 from . import models, schemas # Importa modelos e schemas
+from . import tenancy
+from .database import AsyncSessionLocal
+from .instrumentation import METRICS_TOKEN
+from .tenancy import get_tenant_db
+from .principal_cache import Principal, principal_cache
 
 # --- Configurações de Segurança ---
 # Chave secreta para assinar os tokens JWT.
@@ -20,6 +30,9 @@ from . import models, schemas # Importa modelos e schemas
 SECRET_KEY = os.getenv("SECRET_KEY", "sua_super_chave_secreta_e_complexa_aqui_nao_usar_em_producao")
 ALGORITHM = os.getenv("ALGORITHM", "HS256") # Algoritmo de hashing
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")) # Tempo de expiração do token
+# Modo "claims-only": confia no id/nome/role gravados no token e não consulta o banco.
+# Mudanças de role só passam a valer quando o token expirar.
+AUTH_CLAIMS_ONLY = os.getenv("AUTH_CLAIMS_ONLY", "false").lower() in ("1", "true", "yes")
 
 # Contexto para hashing de senhas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -36,6 +49,61 @@ def get_password_hash(password: str) -> str:
     """Gera o hash de uma senha."""
     return pwd_context.hash(password)
 
+# --- Pool Dedicado para Hashing ---
+# bcrypt consome ~200 ms de CPU por verificação. Executar isso direto numa rota
+# `async def` congela o event loop inteiro, então o hashing roda num executor
+# próprio, com tamanho fixo e uma fila limitada.
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread") # "thread" ou "process"
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32")) # Pedidos aguardando além dos que já estão executando
+
+_hash_executor = None
+_hash_pending = 0 # Só é alterado a partir do event loop, não precisa de lock
+
+def get_hash_executor():
+    """Retorna (criando sob demanda) o executor usado para o hashing de senhas."""
+    global _hash_executor
+    if _hash_executor is None:
+        if HASH_POOL_KIND == "process":
+            _hash_executor = ProcessPoolExecutor(max_workers=HASH_POOL_SIZE)
+        else:
+            _hash_executor = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="hashing")
+    return _hash_executor
+
+def shutdown_hash_executor():
+    """Encerra o executor de hashing (chamado no shutdown da aplicação)."""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+async def _run_in_hash_pool(func, *args):
+    """
+    Executa `func` no pool de hashing sem bloquear o event loop.
+    Se a fila estiver cheia, responde 503 imediatamente em vez de acumular pedidos.
+    """
+    global _hash_pending
+    if _hash_pending >= HASH_POOL_SIZE + HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado processando logins, tente novamente em instantes",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_executor(), func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Versão de `verify_password` que roda no pool de hashing."""
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Versão de `get_password_hash` que roda no pool de hashing."""
+    return await _run_in_hash_pool(get_password_hash, password)
+
 # --- Funções de JWT ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Cria um token de acesso JWT."""
@@ -45,6 +113,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex) # Identificador do token, usado como chave do cache
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -61,10 +130,17 @@ def get_user_by_email(db: Session, email: str):
     """Busca um usuário pelo email no banco de dados."""
     return db.query(models.User).filter(models.User.email == email).first()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    """Versão assíncrona de `get_user_by_email`, para uso com AsyncSession."""
+    result = await db.execute(select(models.User).where(models.User.email == email).limit(1))
+    return result.scalars().first()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_tenant_db)) -> Principal:
     """
     Dependência que retorna o usuário atualmente logado.
     Levanta HTTPException se o token for inválido ou o usuário não for encontrado.
+    O usuário vem do cache de principals (ou das próprias claims, no modo claims-only);
+    o banco (o da clínica do token, no modo multi-clínica) só é consultado em caso de miss.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -82,12 +158,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = get_user_by_email(db, email=token_data.email)
+    if AUTH_CLAIMS_ONLY and payload.get("uid") is not None and payload.get("role"):
+        return Principal(id=payload["uid"], email=email, name=payload.get("name", ""), role=payload["role"])
+
+    token_id = payload.get("jti")
+    principal = principal_cache.get(email, token_id)
+    if principal is not None:
+        return principal
+
+    user = await get_user_by_email_async(db, email=token_data.email)
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put(email, token_id, principal, token_exp=payload.get("exp"))
+    return principal
 
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+def get_current_admin_user(current_user: Principal = Depends(get_current_user)):
     """
     Dependência para proteger rotas apenas para usuários com role 'admin'.
     """
@@ -97,3 +183,24 @@ def get_current_admin_user(current_user: models.User = Depends(get_current_user)
             detail="Você não tem permissão para acessar este recurso"
         )
     return current_user
+
+async def get_current_operator(request: Request) -> Optional[Principal]:
+    """
+    Dependência das rotas com dados do worker inteiro (métricas internas).
+    Com uma clínica só, basta ser admin. No modo multi-clínica, o admin de uma clínica veria
+    dados das outras (nomes, motores abertos, rotas): exige o token de operador, o mesmo
+    METRICS_TOKEN do /metrics, que não pertence a nenhuma clínica. Sem ele configurado,
+    essas rotas ficam fechadas no modo multi-clínica.
+    Devolve o admin autenticado, ou None quando o acesso foi pelo token de operador.
+    """
+    authorization = request.headers.get("authorization") or ""
+    if METRICS_TOKEN and hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return None
+    if tenancy.TENANCY_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No modo multi-clínica, as métricas do worker exigem o token de operador"
+        )
+    token = await oauth2_scheme(request)
+    async with AsyncSessionLocal() as db:
+        return get_current_admin_user(await get_current_user(token, db))
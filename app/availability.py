@@ -0,0 +1,234 @@
+# app/availability.py
+
+import bisect
+import os
+import re
+import threading
+import time as _time
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .events import on_commit
+
+# --- Configurações da Agenda ---
+DEFAULT_WORKING_HOURS = os.getenv("AVAILABILITY_DEFAULT_HOURS", "08:00-18:00")
+# Dias de atendimento (0 = segunda ... 6 = domingo)
+WORKING_WEEKDAYS = {int(d) for d in os.getenv("AVAILABILITY_WORKING_WEEKDAYS", "0,1,2,3,4,5").split(",") if d.strip()}
+# Tempo máximo que um dia carregado fica no índice sem ser relido do banco.
+# Protege contra mudanças feitas por outros workers/processos.
+INDEX_TTL = float(os.getenv("AVAILABILITY_INDEX_TTL", "60"))
+# Status que não ocupam a agenda
+FREE_STATUSES = ("Cancelado",)
+
+_HOURS_RE = re.compile(r"(\d{1,2})(?:[:h](\d{2})?)?\s*(?:-|–|às|as|a|até)\s*(\d{1,2})(?:[:h](\d{2})?)?", re.IGNORECASE)
+
+
+def parse_working_hours(text: Optional[str]) -> Tuple[int, int]:
+    """
+    Extrai o expediente de `ClinicInfo.working_hours` como (início, fim) em minutos.
+    Aceita formatos como "08:00-18:00", "Seg a Sex, 8h às 18h". Usa o padrão em caso de falha.
+    """
+    for candidate in (text, DEFAULT_WORKING_HOURS):
+        match = _HOURS_RE.search(candidate or "")
+        if match:
+            start = int(match.group(1)) * 60 + int(match.group(2) or 0)
+            end = int(match.group(3)) * 60 + int(match.group(4) or 0)
+            if 0 <= start < end <= 24 * 60:
+                return start, end
+    return 8 * 60, 18 * 60
+
+
+def _minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+class AvailabilityIndex:
+    """
+    Índice em memória dos horários ocupados, por (profissional, dia).
+    Cada dia é uma lista ordenada de intervalos (início, fim, appointment_id) em minutos.
+    Dias ausentes são carregados em lote, numa única consulta para todo o intervalo pedido,
+    e depois mantidos incrementalmente a partir dos commits de `Appointment`.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._days: Dict[Tuple[int, date], List[Tuple[int, int, int]]] = {}
+        self._loaded_at: Dict[Tuple[int, date], float] = {}
+        self._key_by_appointment: Dict[int, Tuple[int, date]] = {}
+        self._durations: Dict[int, int] = {} # service_id -> duração em minutos
+        self._lock = threading.Lock()
+
+    def _missing(self, keys: Iterable[Tuple[int, date]]) -> List[Tuple[int, date]]:
+        now = _time.monotonic()
+        with self._lock:
+            return [k for k in keys if now - self._loaded_at.get(k, -self.ttl - 1) > self.ttl]
+
+    async def ensure_loaded(self, db: AsyncSession, professional_ids: List[int], days: List[date]):
+        """Garante que todos os (profissional, dia) pedidos estão no índice, com no máximo 2 consultas."""
+        missing = self._missing((p, d) for p in professional_ids for d in days)
+        if not missing:
+            return
+        prof_ids = sorted({k[0] for k in missing})
+        first, last = min(k[1] for k in missing), max(k[1] for k in missing)
+
+        durations = await db.execute(select(models.Service.id, models.Service.duration))
+        rows = await db.execute(
+            select(
+                models.Appointment.id,
+                models.Appointment.professional_id,
+                models.Appointment.date,
+                models.Appointment.start_time,
+                models.Appointment.service_id,
+            ).where(
+                models.Appointment.professional_id.in_(prof_ids),
+                models.Appointment.date >= first,
+                models.Appointment.date <= last,
+                models.Appointment.status.notin_(FREE_STATUSES),
+            )
+        )
+        self.load(missing, durations.all(), rows.all())
+
+    def load(self, keys, durations, rows):
+        """Substitui os dias `keys` pelos agendamentos em `rows` (id, profissional, dia, início, serviço)."""
+        fresh = {k: [] for k in keys}
+        with self._lock:
+            self._durations.update(durations)
+            for appointment_id, professional_id, day, start_time, service_id in rows:
+                key = (professional_id, day)
+                if key not in fresh:
+                    continue
+                start = _minutes(start_time)
+                fresh[key].append((start, start + self._durations.get(service_id, 0), appointment_id))
+            now = _time.monotonic()
+            for key, intervals in fresh.items():
+                for old in self._days.get(key, ()):
+                    self._key_by_appointment.pop(old[2], None)
+                intervals.sort()
+                self._days[key] = intervals
+                self._loaded_at[key] = now
+                for interval in intervals:
+                    self._key_by_appointment[interval[2]] = key
+
+    def busy(self, professional_id: int, day: date) -> List[Tuple[int, int, int]]:
+        with self._lock:
+            return list(self._days.get((professional_id, day), ()))
+
+    def duration_of(self, service_id: int) -> Optional[int]:
+        with self._lock:
+            return self._durations.get(service_id)
+
+    def apply(self, changes):
+        """Aplica mudanças commitadas de `Appointment` ao índice."""
+        with self._lock:
+            for change in changes:
+                values = change.values
+                appointment_id = values.get("id")
+                old_key = self._key_by_appointment.pop(appointment_id, None)
+                if old_key is not None:
+                    self._days[old_key] = [i for i in self._days[old_key] if i[2] != appointment_id]
+                if change.op == "delete" or values.get("status") in FREE_STATUSES:
+                    continue
+                key = (values.get("professional_id"), values.get("date"))
+                if key not in self._days:
+                    continue # Dia ainda não carregado; será lido do banco quando pedido
+                duration = self._durations.get(values.get("service_id"))
+                start_time = values.get("start_time")
+                if duration is None or start_time is None or None in key:
+                    # Falta informação para atualizar no lugar: força recarga do dia
+                    self._days.pop(key, None)
+                    self._loaded_at.pop(key, None)
+                    continue
+                start = _minutes(start_time)
+                bisect.insort(self._days[key], (start, start + duration, appointment_id))
+                self._key_by_appointment[appointment_id] = key
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._loaded_at.clear()
+            self._key_by_appointment.clear()
+            self._durations.clear()
+
+
+availability_index = AvailabilityIndex(INDEX_TTL)
+
+
+@on_commit(models.Appointment)
+def _update_index(changes):
+    availability_index.apply(changes)
+
+@on_commit(models.Service)
+def _update_durations(changes):
+    # Mudou a duração de um serviço: os intervalos calculados com ela ficam inválidos
+    if any(c.op != "insert" for c in changes):
+        availability_index.clear()
+
+
+def free_slots(busy: List[Tuple[int, int, int]], day_start: int, day_end: int, duration: int, step: int) -> List[int]:
+    """Horários de início (em minutos) em que cabe um atendimento de `duration` minutos."""
+    slots = []
+    cursor = day_start
+    for start, end, _ in busy + [(day_end, day_end, 0)]:
+        gap_end = min(start, day_end)
+        # Alinha o início à grade de `step` minutos a partir da abertura
+        slot = day_start + -(-(cursor - day_start) // step) * step
+        while slot + duration <= gap_end:
+            slots.append(slot)
+            slot += step
+        cursor = max(cursor, end)
+        if cursor >= day_end:
+            break
+    return slots
+
+
+async def compute_availability(
+    db: AsyncSession,
+    service_id: int,
+    start: date,
+    days: int,
+    professional_id: Optional[int] = None,
+    step: int = 15,
+) -> Optional[List[dict]]:
+    """
+    Calcula os horários livres de cada profissional que realiza o serviço.
+    Retorna None se o serviço não existir.
+    """
+    service = await db.get(models.Service, service_id)
+    if service is None:
+        return None
+
+    query = select(models.professional_service_association.c.professional_id).where(
+        models.professional_service_association.c.service_id == service_id
+    )
+    if professional_id is not None:
+        query = query.where(models.professional_service_association.c.professional_id == professional_id)
+    professional_ids = sorted((await db.execute(query)).scalars().all())
+
+    clinic_hours = (await db.execute(select(models.ClinicInfo.working_hours).limit(1))).scalar()
+    day_start, day_end = parse_working_hours(clinic_hours)
+
+    dates = [start + timedelta(days=i) for i in range(days)]
+    working_dates = [d for d in dates if d.weekday() in WORKING_WEEKDAYS]
+    await availability_index.ensure_loaded(db, professional_ids, working_dates)
+
+    now = datetime.now()
+    result = []
+    for prof_id in professional_ids:
+        grid = []
+        for day in working_dates:
+            first = day_start
+            if day == now.date():
+                first = max(day_start, now.hour * 60 + now.minute)
+            elif day < now.date():
+                continue
+            starts = free_slots(availability_index.busy(prof_id, day), day_start, day_end, service.duration, step)
+            grid.append({
+                "date": day,
+                "slots": [time(m // 60, m % 60) for m in starts if m >= first],
+            })
+        result.append({"professional_id": prof_id, "service_id": service_id, "days": grid})
+    return result
@@ -0,0 +1,278 @@
+# app/bulk_import.py
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from . import customer_search, models, reference_cache, schemas, segments
+from .database import SessionLocal, insert_ignore_statement, upsert_statement
+
+# --- Configurações da Importação ---
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+# Processos dedicados à validação (a validação de email do Pydantic domina o custo por linha).
+# 0 valida no próprio processo; com N > 0 os lotes são validados em paralelo enquanto
+# o lote anterior é gravado no banco.
+IMPORT_VALIDATION_WORKERS = int(os.getenv("IMPORT_VALIDATION_WORKERS", "0"))
+CUSTOMER_COLUMNS = ("name", "email", "phone", "birthday", "notes")
+
+
+# --- Leitura em Streaming ---
+def iter_records(lines: Iterable[str], file_format: str) -> Iterator[Tuple[int, object]]:
+    """
+    Lê registros linha a linha, sem carregar o arquivo inteiro.
+    Gera (número_da_linha, dict) ou (número_da_linha, Exception) para linhas ilegíveis.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Campos vazios no CSV significam "sem valor"
+            yield reader.line_num, {k: (v if v != "" else None) for k, v in row.items() if k}
+    elif file_format == "ndjson":
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("cada linha deve ser um objeto JSON")
+                yield line_number, record
+            except ValueError as e:
+                yield line_number, e
+    else:
+        raise ValueError(f"Formato não suportado: {file_format}")
+
+
+def _parse_tags(value) -> List[str]:
+    # No CSV as tags vêm separadas por ";" ou ","; no NDJSON, como lista
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.replace(",", ";").split(";")
+    return [str(tag).strip() for tag in value if str(tag).strip()]
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def validate_chunk(chunk: List[Tuple[int, object]]):
+    """
+    Valida um lote com `CustomerCreate`. Retorna (válidos, erros), onde válidos são
+    (linha, colunas, tags) e erros são (linha, mensagem). Função de módulo para poder
+    rodar num ProcessPoolExecutor.
+    """
+    valid, errors = [], []
+    for line, record in chunk:
+        if isinstance(record, Exception):
+            errors.append((line, f"Linha inválida: {record}"))
+            continue
+        record = dict(record)
+        tags = _parse_tags(record.pop("tags", None))
+        try:
+            customer = schemas.CustomerCreate(**record)
+        except ValidationError as e:
+            errors.append((line, _validation_message(e)))
+            continue
+        valid.append((line, customer.model_dump(include=set(CUSTOMER_COLUMNS)), tags))
+    return valid, errors
+
+
+def _validated_chunks(records, batch_size: int, workers: int):
+    """Divide os registros em lotes validados, mantendo no máximo `2 * workers` lotes em voo."""
+    chunks = iter(lambda: list(islice(records, batch_size)), [])
+    if workers <= 0:
+        for chunk in chunks:
+            yield len(chunk), validate_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((len(chunk), executor.submit(validate_chunk, chunk)))
+            if len(in_flight) >= 2 * workers:
+                size, future = in_flight.popleft()
+                yield size, future.result()
+        while in_flight:
+            size, future = in_flight.popleft()
+            yield size, future.result()
+
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+# --- Gravação em Lote ---
+def _resolve_tags(db: Session, names) -> dict:
+    """Resolve nomes de tag em ids, criando as que faltam. Duas a três consultas por lote."""
+    if not names:
+        return {}
+    table = models.SystemTag.__table__
+    query = select(table.c.name, table.c.id).where(table.c.name.in_(names))
+    found = dict(db.execute(query).all())
+    missing = [name for name in names if name not in found]
+    if missing:
+        stmt = insert_ignore_statement(db.get_bind().dialect.name, table, ["name"])
+        db.execute(stmt, [{"name": name} for name in missing])
+        found = dict(db.execute(query).all())
+        # O INSERT em lote não passa pela sessão: a versão da lista de tags é incrementada aqui
+        reference_cache.bump(db.connection(), ["tags"])
+    return found
+
+
+def _write_batch(db: Session, batch: List[Tuple[int, dict, List[str]]], report: ImportReport):
+    dialect = db.get_bind().dialect.name
+    customers = models.Customer.__table__
+
+    # Emails repetidos no mesmo lote: vale a última ocorrência. As chaves ignoram maiúsculas:
+    # na collation padrão do MySQL "Ana@x.com" e "ana@x.com" são o mesmo cliente, e o upsert
+    # mantém a grafia já gravada (o EmailStr só normaliza o domínio)
+    by_email, without_email = {}, []
+    for line, values, tags in batch:
+        if values.get("email"):
+            by_email[values["email"].lower()] = (line, values, tags)
+        else:
+            without_email.append((line, values, tags))
+
+    ids_by_email = {}
+    if by_email:
+        emails = [values["email"] for _, values, _ in by_email.values()]
+        existing = {row[0].lower() for row in db.execute(select(customers.c.email).where(customers.c.email.in_(emails)))}
+        stmt = upsert_statement(
+            dialect, customers, ["email"],
+            update_columns=[c for c in CUSTOMER_COLUMNS if c != "email"],
+            extra_set={"updated_at": func.now()},
+        )
+        db.execute(stmt, [values for _, values, _ in by_email.values()])
+        ids_by_email = {
+            email.lower(): customer_id
+            for email, customer_id in db.execute(select(customers.c.email, customers.c.id).where(customers.c.email.in_(emails)))
+        }
+        report.updated += len(existing)
+        report.inserted += len(by_email) - len(existing)
+        report.updated += sum(1 for _, values, _ in batch if values.get("email")) - len(by_email)
+
+    # Sem email não há como reencontrar a linha depois, então o id vem do próprio INSERT
+    # (RETURNING em lote quando o dialeto suporta; senão, uma linha por vez)
+    new_ids = []
+    if without_email and db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        stmt = insert(customers).returning(customers.c.id, sort_by_parameter_order=True)
+        new_ids = db.execute(stmt, [values for _, values, _ in without_email]).scalars().all()
+    else:
+        for _, values, _ in without_email:
+            new_ids.append(db.execute(insert(customers).values(**values)).inserted_primary_key[0])
+    report.inserted += len(without_email)
+
+    links = [(customer_id, tag) for customer_id, (_, _, tags) in zip(new_ids, without_email) for tag in tags]
+    links.extend((ids_by_email[email], tag) for email, (_, _, tags) in by_email.items() for tag in tags)
+    if links:
+        tag_ids = _resolve_tags(db, sorted({tag for _, tag in links}))
+        rows = [{"customer_id": cid, "tag_id": tag_ids[tag]} for cid, tag in set(links)]
+        stmt = insert_ignore_statement(dialect, models.customer_tag_association, ["customer_id", "tag_id"])
+        db.execute(stmt, rows)
+        segments.record_links(db, [(row["customer_id"], row["tag_id"]) for row in rows])
+
+    # INSERTs em lote não passam pelos eventos do ORM: atualiza o índice de busca aqui
+    written = [(customer_id, values) for customer_id, (_, values, _) in zip(new_ids, without_email)]
+    written += [(ids_by_email[email], values) for email, (_, values, _) in by_email.items()]
+    segments.record_customers(db, [customer_id for customer_id, _ in written])
+    customer_search.index_customers(db.connection(), [
+        (customer_id, values["name"], values.get("email"), values.get("phone")) for customer_id, values in written
+    ])
+
+
+def import_customers(
+    db: Session,
+    records: Iterable[Tuple[int, object]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    validation_workers: int = IMPORT_VALIDATION_WORKERS,
+) -> dict:
+    """
+    Importa clientes (com tags) a partir de `iter_records`, validando com `CustomerCreate`.
+    Clientes com email existente são atualizados (upsert pelo email único); as tags informadas
+    são adicionadas às que o cliente já tem. Cada lote é uma transação: linhas inválidas são
+    reportadas e não interrompem a importação.
+    """
+    report = ImportReport()
+    for size, (batch, errors) in _validated_chunks(iter(records), batch_size, validation_workers):
+        report.total += size
+        for line, message in errors:
+            report.error(line, message)
+        if not batch:
+            continue
+        try:
+            _write_batch(db, batch, report)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for line, _, _ in batch:
+                report.error(line, f"Falha ao gravar o lote: {e}")
+    return report.as_dict()
+
+
+def detect_format(filename: Optional[str], explicit: Optional[str] = None) -> str:
+    if explicit:
+        return explicit
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+# --- Linha de Comando ---
+# Uso: python -m app.bulk_import clientes.csv [--format csv|ndjson] [--batch-size 2000]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa clientes (com tags) de um arquivo CSV ou NDJSON.")
+    parser.add_argument("path", help="Arquivo de entrada ('-' para ler da entrada padrão)")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_VALIDATION_WORKERS, help="Processos de validação (0 = sem paralelismo)")
+    args = parser.parse_args(argv)
+
+    file_format = detect_format(args.path, args.format)
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig") if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        with stream:
+            report = import_customers(
+                db, iter_records(stream, file_format), batch_size=args.batch_size, validation_workers=args.workers
+            )
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    print(f"{report['total']} linhas em {elapsed:.2f}s ({report['total'] / elapsed if elapsed else 0:.0f} linhas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# app/conversations.py
+
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models
+
+# --- Cursores ---
+# Um cursor é a posição (timestamp, id) de uma linha, codificada em base64 para ser opaca ao cliente.
+
+def encode_cursor(moment: datetime, row_id: int) -> str:
+    raw = f"{moment.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodifica um cursor. Levanta ValueError se ele for inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        moment, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(moment), int(row_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def _older_than(ts_column, id_column, cursor):
+    moment, row_id = cursor
+    return or_(ts_column < moment, and_(ts_column == moment, id_column < row_id))
+
+def _newer_than(ts_column, id_column, cursor):
+    moment, row_id = cursor
+    return or_(ts_column > moment, and_(ts_column == moment, id_column > row_id))
+
+
+# --- Histórico de Mensagens ---
+async def list_messages(
+    db: AsyncSession,
+    conversation_id: int,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> dict:
+    """
+    Página do histórico de uma conversa, sempre da mais nova para a mais antiga.
+    `before` busca mensagens mais antigas que o cursor; `after`, mais novas.
+    Cada página é uma leitura por intervalo no índice (conversation_id, timestamp, id).
+    """
+    ts, mid = models.Message.timestamp, models.Message.id
+    query = select(models.Message).where(models.Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.where(_newer_than(ts, mid, decode_cursor(after))).order_by(ts.asc(), mid.asc())
+    else:
+        if before is not None:
+            query = query.where(_older_than(ts, mid, decode_cursor(before)))
+        query = query.order_by(ts.desc(), mid.desc())
+
+    rows = list((await db.execute(query.limit(limit + 1))).scalars().all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+
+    newest, oldest = (rows[0], rows[-1]) if rows else (None, None)
+    # Indo para trás, há mais mensagens antigas se a consulta trouxe uma linha extra;
+    # vindo de `after`, as mais antigas são justamente as que o cliente já tem.
+    more_older = has_more if after is None else True
+    more_newer = before is not None or (after is not None and has_more)
+    return {
+        "items": rows,
+        "next_cursor": encode_cursor(oldest.timestamp, oldest.id) if oldest and more_older else None,
+        "prev_cursor": encode_cursor(newest.timestamp, newest.id) if newest and more_newer else None,
+    }
+
+
+# --- Caixa de Entrada ---
+async def list_inbox(db: AsyncSession, limit: int = 30, before: Optional[str] = None) -> dict:
+    """
+    Conversas ordenadas pela última mensagem, cada uma com a prévia da mensagem mais recente.
+    A prévia vem de uma subconsulta correlacionada que lê uma única linha do índice por conversa.
+    """
+    conv = models.Conversation
+    last_message_id = (
+        select(models.Message.id)
+        .where(models.Message.conversation_id == conv.id)
+        .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+        .limit(1)
+        .correlate(conv)
+        .scalar_subquery()
+    )
+    query = (
+        select(conv, models.Message)
+        .outerjoin(models.Message, models.Message.id == last_message_id)
+        .options(selectinload(conv.customer).selectinload(models.Customer.tags))
+        .order_by(conv.last_message_at.desc(), conv.id.desc())
+    )
+    if before is not None:
+        query = query.where(_older_than(conv.last_message_at, conv.id, decode_cursor(before)))
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    items: List[dict] = []
+    for conversation, message in rows[:limit]:
+        items.append({
+            "id": conversation.id,
+            "customer_id": conversation.customer_id,
+            "unread_count": conversation.unread_count,
+            "last_message_at": conversation.last_message_at,
+            "customer": conversation.customer,
+            "last_message": message,
+        })
+    last = rows[limit - 1][0] if has_more else None
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(last.last_message_at, last.id) if last is not None else None,
+    }
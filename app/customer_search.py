@@ -0,0 +1,226 @@
+# app/customer_search.py
+
+import argparse
+import re
+import time
+import unicodedata
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import case, delete, event, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from . import models
+from .database import SessionLocal
+
+MIN_PREFIX = 2 # Prefixos menores que isso não são indexados (nem buscados)
+MAX_PREFIX = 20 # Termos maiores são truncados: o índice guarda prefixos de até 20 caracteres
+MIN_PHONE_DIGITS = 4
+REBUILD_BATCH_SIZE = 5000
+
+tokens_table = models.CustomerSearchToken.__table__
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Busca que é só um telefone digitado com formatação: "(11) 98765-4321", "+55 11 98765.4321"
+_PHONE_QUERY = re.compile(r"^[\d\s()+.\-]+$")
+
+
+# --- Normalização e Geração de Tokens ---
+def fold(text: Optional[str]) -> str:
+    """Remove acentos e converte para minúsculas ("Conceição" -> "conceicao")."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+def words(text: Optional[str]) -> List[str]:
+    return [w for w in _NON_ALNUM.split(fold(text)) if w]
+
+def digits(text: Optional[str]) -> str:
+    return "".join(ch for ch in (text or "") if ch.isdigit())
+
+def _prefixes(word: str, minimum: int = MIN_PREFIX) -> Iterable[str]:
+    return (word[:n] for n in range(minimum, min(len(word), MAX_PREFIX) + 1))
+
+
+def customer_tokens(name: Optional[str], email: Optional[str], phone: Optional[str]) -> Set[str]:
+    tokens = set()
+    for word in words(name):
+        tokens.update("n:" + p for p in _prefixes(word))
+        tokens.add("x:" + word[:MAX_PREFIX])
+    if email:
+        email = fold(email)
+        local = email.split("@", 1)[0]
+        for word in words(local):
+            tokens.update("e:" + p for p in _prefixes(word))
+        # Email digitado até o "@" ou além: os prefixos do início já estão cobertos pelas palavras
+        tokens.update("e:" + p for p in _prefixes(email, len(local) + 1))
+    number = digits(phone)
+    if number:
+        # Número com DDD (sem o 55), número local (com o 9 do celular, se houver) e os 4 finais,
+        # que são os começos que a recepção costuma digitar
+        if number.startswith("55") and len(number) > 11:
+            number = number[2:]
+        local_number = number[-9:] if len(number) >= 11 and number[-9] == "9" else number[-8:]
+        for variant in {number, local_number, number[-4:]}:
+            tokens.update("p:" + p for p in _prefixes(variant, MIN_PHONE_DIGITS))
+    return tokens
+
+
+def query_terms(text: str) -> List[Set[str]]:
+    """
+    Converte a busca em termos; cada termo é o conjunto de tokens que o satisfazem.
+    Todos os termos precisam casar (AND).
+    """
+    number = digits(text)
+    if len(number) >= MIN_PHONE_DIGITS and _PHONE_QUERY.match(text.strip()):
+        # Um telefone inteiro vira um único termo; separado por espaços, "(11)" viraria um
+        # termo de nome de 2 caracteres que nunca casa. Mesma normalização da indexação (sem o 55)
+        if number.startswith("55") and len(number) > 11:
+            number = number[2:]
+        number = number[:MAX_PREFIX]
+        return [{"p:" + number, "n:" + number, "e:" + number, "x:" + number}]
+    terms = []
+    for raw in fold(text).split():
+        if "@" in raw:
+            terms.append({"e:" + raw[:MAX_PREFIX]})
+            continue
+        number = digits(raw)
+        if len(number) >= MIN_PHONE_DIGITS and len(number) == len(_NON_ALNUM.sub("", raw)):
+            # Só dígitos: telefone, mas também pode ser parte do nome/email ("ana2020@")
+            number = number[:MAX_PREFIX]
+            terms.append({"p:" + number, "n:" + number, "e:" + number, "x:" + number})
+            continue
+        for word in words(raw):
+            if len(word) >= MIN_PREFIX:
+                word = word[:MAX_PREFIX]
+                terms.append({"n:" + word, "e:" + word, "x:" + word})
+    # Termos repetidos ("ana ana") casariam sempre o primeiro no CASE da busca, e o HAVING
+    # nunca chegaria à contagem de termos
+    seen, unique = set(), []
+    for term in terms:
+        if frozenset(term) not in seen:
+            seen.add(frozenset(term))
+            unique.append(term)
+    return unique
+
+
+# --- Manutenção do Índice ---
+def _insert_tokens(connection, customers):
+    # São dezenas de tokens por cliente: o executemany vai direto ao driver, com tuplas,
+    # evitando o processamento de parâmetros do SQLAlchemy para cada uma das linhas
+    rows = [
+        (token, customer_id)
+        for customer_id, name, email, phone in customers
+        for token in customer_tokens(name, email, phone)
+    ]
+    if rows:
+        placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+        connection.exec_driver_sql(
+            f"INSERT INTO {tokens_table.name} (token, customer_id) VALUES ({placeholder}, {placeholder})", rows
+        )
+
+def index_customers(connection, customers: Sequence[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+    """(Re)indexa clientes dados como (id, nome, email, telefone). Duas instruções por lote."""
+    if not customers:
+        return
+    connection.execute(delete(tokens_table).where(tokens_table.c.customer_id.in_([c[0] for c in customers])))
+    _insert_tokens(connection, customers)
+
+
+@event.listens_for(models.Customer, "after_insert")
+def _index_new_customer(mapper, connection, target):
+    index_customers(connection, [(target.id, target.name, target.email, target.phone)])
+
+@event.listens_for(models.Customer, "after_update")
+def _reindex_customer(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in ("name", "email", "phone")):
+        index_customers(connection, [(target.id, target.name, target.email, target.phone)])
+
+@event.listens_for(models.Customer, "before_delete")
+def _unindex_customer(mapper, connection, target):
+    connection.execute(delete(tokens_table).where(tokens_table.c.customer_id == target.id))
+
+
+def rebuild(batch_size: int = REBUILD_BATCH_SIZE, bind=None) -> int:
+    """
+    Reconstrói o índice inteiro a partir de `customers`, numa única transação.
+    Lê os clientes em páginas por id (keyset), o que permite ler e gravar na mesma conexão.
+    `bind`: outra conexão/motor (ex: o bootstrap); por padrão, o banco principal.
+    Retorna o número de clientes indexados.
+    """
+    customers = models.Customer.__table__
+    db = Session(bind=bind) if bind is not None else SessionLocal()
+    total, last_id = 0, 0
+    try:
+        connection = db.connection()
+        connection.execute(delete(tokens_table))
+        query = select(customers.c.id, customers.c.name, customers.c.email, customers.c.phone).order_by(customers.c.id)
+        while True:
+            page = connection.execute(query.where(customers.c.id > last_id).limit(batch_size)).all()
+            if not page:
+                break
+            _insert_tokens(connection, page)
+            total += len(page)
+            last_id = page[-1][0]
+        db.commit()
+    finally:
+        db.close()
+    return total
+
+
+# --- Busca ---
+def _selectivity(term: Set[str]) -> int:
+    # Heurística sem estatísticas: termos mais longos casam com menos clientes, e sequências
+    # de dígitos (telefone) são bem mais seletivas que palavras de mesmo tamanho
+    text = next(iter(term)).split(":", 1)[1]
+    return len(text) * (2 if text.isdigit() else 1)
+
+async def search_customers(db: AsyncSession, text: str, limit: int = 20) -> List[models.Customer]:
+    """
+    Busca ranqueada: exige todos os termos e ordena por quantidade de palavras completas
+    casadas e depois pelo nome. Usa apenas o índice de tokens e a chave primária de `customers`.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return []
+    token = tokens_table.c.token
+    all_tokens = set().union(*terms)
+    term_number = case(*[(token.in_(sorted(term)), index) for index, term in enumerate(terms)])
+    exact_bonus = func.sum(case((token.like("x:%"), 1), else_=0))
+    matches = select(tokens_table.c.customer_id, exact_bonus.label("score")).where(token.in_(sorted(all_tokens)))
+    if len(terms) > 1:
+        # O termo mais longo costuma ser o mais seletivo: restringe o agrupamento aos clientes
+        # que casam com ele, em vez de agrupar a lista inteira de um termo comum ("ana")
+        driver = max(terms, key=_selectivity)
+        narrowed = select(tokens_table.c.customer_id).where(token.in_(sorted(driver)))
+        matches = matches.where(tokens_table.c.customer_id.in_(narrowed))
+    matches = (
+        matches
+        .group_by(tokens_table.c.customer_id)
+        .having(func.count(func.distinct(term_number)) == len(terms))
+        .subquery()
+    )
+    ranked = (
+        select(models.Customer)
+        .join(matches, matches.c.customer_id == models.Customer.id)
+        .options(selectinload(models.Customer.tags))
+        .order_by(matches.c.score.desc(), models.Customer.name, models.Customer.id)
+        .limit(limit)
+    )
+    return list((await db.execute(ranked)).scalars().all())
+
+
+# Uso: python -m app.customer_search rebuild
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do índice de busca de clientes.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    total = rebuild(batch_size=args.batch_size)
+    print(f"Índice de busca reconstruído: {total} clientes em {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 # app/database.py
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from . import instrumentation, pool_metrics
+
 # Carrega as variáveis de ambiente do arquivo .env (apenas em desenvolvimento local)
 load_dotenv()
 
@@ -17,21 +20,70 @@ DB_PORT = os.getenv("MYSQL_PORT", "3306")
 DB_NAME = os.getenv("MYSQL_DATABASE", "estetica_io")
 
 # ATENÇÃO: Mudamos o driver para "mysql+pymysql"
-DATABASE_URL = (
+# DATABASE_URL pode ser sobrescrita diretamente (ex: "sqlite:///./estetica.db" para testes locais)
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 
+def to_async_url(url: str) -> str:
+    """Converte uma URL síncrona na equivalente com driver assíncrono (aiomysql / aiosqlite)."""
+    if url.startswith("mysql+pymysql://") or url.startswith("mysql://"):
+        return "mysql+aiomysql://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# --- Configurações do Pool de Conexões ---
+# Valem para cada motor (síncrono e assíncrono) de cada worker.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5")) # Conexões mantidas abertas
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10")) # Conexões extras em picos, fechadas ao voltar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30")) # Espera máxima por uma conexão livre (s)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Recicla conexões mais velhas que N s (-1 desliga)
+# Validação da conexão no checkout:
+# "always" = pool_pre_ping (um round-trip a cada checkout), "idle" = só conexões paradas
+# há mais de DB_PRE_PING_IDLE segundos, "off" = nunca (falhas aparecem na primeira consulta)
+DB_PRE_PING = os.getenv("DB_PRE_PING", "idle").lower()
+DB_PRE_PING_IDLE = float(os.getenv("DB_PRE_PING_IDLE", "60"))
+
+def engine_kwargs(url: str, is_async: bool = False) -> dict:
+    """Argumentos comuns para criar os motores síncrono e assíncrono."""
+    if url.startswith("sqlite"):
+        # O SQLite só é usado em desenvolvimento/testes; a conexão é compartilhada entre threads
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "poolclass": pool_metrics.InstrumentedAsyncAdaptedQueuePool if is_async else pool_metrics.InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_PRE_PING == "always",
+    }
+
+def idle_ping_after() -> float:
+    return DB_PRE_PING_IDLE if DB_PRE_PING == "idle" else 0.0
+
 # Cria o motor do SQLAlchemy
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True
-)
+engine = create_engine(DATABASE_URL, **engine_kwargs(DATABASE_URL))
+pool_metrics.instrument(engine, "sync", idle_ping_after=idle_ping_after())
+instrumentation.instrument_engine(engine)
+
+# Motor assíncrono, usado pelas rotas `async def` para não bloquear o event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_kwargs(ASYNC_DATABASE_URL, is_async=True))
+pool_metrics.instrument(async_engine.sync_engine, "async", idle_ping_after=idle_ping_after())
+instrumentation.instrument_engine(async_engine.sync_engine)
 
 # Cria uma SessionLocal para cada requisição ao banco de dados
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Base para os modelos declarativos do SQLAlchemy
-Base = declarative_base()
+# Equivalente assíncrono da SessionLocal. expire_on_commit=False evita lazy loads
+# implícitos (proibidos em AsyncSession) ao ler atributos depois do commit.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Base para os modelos declarativos do SQLAlchemy.
+# AsyncAttrs adiciona `obj.awaitable_attrs.<relação>` para carregar relações em AsyncSession.
+Base = declarative_base(cls=AsyncAttrs)
 
 def get_db():
     db = SessionLocal()
@@ -39,3 +91,47 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """Dependência assíncrona: fornece uma AsyncSession por requisição."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# --- Utilitários de INSERT em lote ---
+def _dialect_insert(dialect_name: str, table):
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        return mysql_insert(table)
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table)
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table)
+    raise NotImplementedError(f"Upsert não suportado para o dialeto {dialect_name}")
+
+def upsert_statement(dialect_name: str, table, index_elements, update_columns=(), increment_columns=(), extra_set=None):
+    """
+    INSERT que, em caso de conflito na chave `index_elements`, atualiza a linha existente:
+    `update_columns` recebem o valor novo e `increment_columns` são somadas ao valor atual.
+    Gera ON DUPLICATE KEY UPDATE no MySQL e ON CONFLICT DO UPDATE no SQLite/PostgreSQL.
+    Use com `connection.execute(stmt, lista_de_dicts)` para gravar várias linhas de uma vez.
+    """
+    stmt = _dialect_insert(dialect_name, table)
+    new = stmt.inserted if dialect_name == "mysql" else stmt.excluded
+    values = {col: new[col] for col in update_columns}
+    values.update({col: table.c[col] + new[col] for col in increment_columns})
+    values.update(extra_set or {})
+    if not values:
+        return insert_ignore_statement(dialect_name, table, index_elements)
+    if dialect_name == "mysql":
+        return stmt.on_duplicate_key_update(values)
+    return stmt.on_conflict_do_update(index_elements=list(index_elements), set_=values)
+
+def insert_ignore_statement(dialect_name: str, table, index_elements=None):
+    """INSERT que ignora linhas que violariam a chave única (INSERT IGNORE / ON CONFLICT DO NOTHING)."""
+    if dialect_name == "mysql":
+        return insert(table).prefix_with("IGNORE")
+    stmt = _dialect_insert(dialect_name, table)
+    return stmt.on_conflict_do_nothing(index_elements=list(index_elements) if index_elements else None)
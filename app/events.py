@@ -0,0 +1,103 @@
+# app/events.py
+
+from typing import Callable, Dict, List
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Ganchos executados depois do COMMIT para mudanças em modelos específicos.
+# Os caches em memória (disponibilidade, referências, etc.) usam isto para se
+# atualizar só com dados efetivamente gravados; um rollback descarta as mudanças.
+
+_callbacks: Dict[type, List[Callable]] = {}
+
+
+class RowChange:
+    """Uma mudança (insert/update/delete) de uma linha, capturada no flush."""
+    __slots__ = ("op", "model", "values", "previous")
+
+    def __init__(self, op: str, model: type, values: dict, previous: dict):
+        self.op = op # "insert", "update" ou "delete"
+        self.model = model
+        self.values = values # Valores das colunas já carregados no objeto
+        self.previous = previous # Valores anteriores das colunas alteradas (apenas em update)
+
+    def __repr__(self):
+        return f"RowChange({self.op}, {self.model.__name__}, {self.values})"
+
+
+def on_commit(*models):
+    """
+    Decorador que registra `callback(changes)` para ser chamado após cada commit
+    que tenha inserido, alterado ou removido instâncias de `models`.
+    """
+    def decorator(callback):
+        for model in models:
+            _callbacks.setdefault(model, []).append(callback)
+        return callback
+    return decorator
+
+
+def _snapshot(obj, op: str) -> dict:
+    state = inspect(obj)
+    if op == "update":
+        # Objeto expirado por um commit anterior: recarrega as colunas (um único SELECT)
+        # para que os callbacks recebam a linha completa, e não só o que foi alterado.
+        expired = {attr.key for attr in state.mapper.column_attrs} & state.unloaded
+        if expired:
+            getattr(obj, next(iter(expired)))
+    loaded = state.dict
+    return {attr.key: loaded.get(attr.key) for attr in state.mapper.column_attrs}
+
+
+def _has_changes(obj) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[attr.key].history.has_changes() for attr in state.mapper.column_attrs)
+
+
+def _previous_values(obj) -> dict:
+    state = inspect(obj)
+    previous = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if history.deleted:
+            previous[attr.key] = history.deleted[0]
+    return previous
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    if not _callbacks:
+        return
+    pending = session.info.setdefault("_row_changes", [])
+    for op, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            model = type(obj)
+            if model not in _callbacks:
+                continue
+            if op == "update" and not _has_changes(obj):
+                continue
+            previous = _previous_values(obj) if op == "update" else {}
+            pending.append(RowChange(op, model, _snapshot(obj, op), previous))
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_changes(session):
+    pending = session.info.pop("_row_changes", None)
+    if not pending:
+        return
+    by_callback = {}
+    for change in pending:
+        for callback in _callbacks.get(change.model, ()):
+            by_callback.setdefault(callback, []).append(change)
+    for callback, changes in by_callback.items():
+        try:
+            callback(changes)
+        except Exception as e:
+            # O commit já aconteceu; uma falha aqui não pode derrubar a requisição
+            print(f"Erro ao processar mudanças pós-commit em {callback.__name__}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("_row_changes", None)
@@ -0,0 +1,103 @@
+# app/exports.py
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterator
+
+from sqlalchemy import select
+
+from . import models
+from .database import SessionLocal
+
+# --- Configurações da Exportação ---
+# Linhas buscadas por ida ao banco (cursor no servidor) e, portanto, por bloco enviado ao cliente
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+
+
+def _customers_query():
+    c = models.Customer.__table__.c
+    return select(c.id, c.name, c.email, c.phone, c.birthday, c.notes, c.created_at, c.updated_at).order_by(c.id)
+
+def _appointments_query():
+    a = models.Appointment.__table__.c
+    # Projeção já com os nomes usados em relatórios, sem hidratar os objetos relacionados
+    return (
+        select(
+            a.id, a.date, a.start_time, a.status,
+            a.customer_id, models.Customer.name.label("customer_name"),
+            a.service_id, models.Service.name.label("service_name"),
+            models.Service.price.label("service_price"), models.Service.duration.label("service_duration"),
+            a.professional_id, models.Professional.name.label("professional_name"),
+            a.notes, a.created_at, a.updated_at,
+        )
+        .join(models.Customer, models.Customer.id == a.customer_id)
+        .join(models.Service, models.Service.id == a.service_id)
+        .join(models.Professional, models.Professional.id == a.professional_id)
+        .order_by(a.id)
+    )
+
+def _anamnesis_records_query():
+    r = models.AnamnesisRecord.__table__.c
+    return select(r.id, r.appointment_id, r.customer_id, r.record_date, r.data).order_by(r.id)
+
+
+# Entidades exportáveis: nome -> função que monta o SELECT com as colunas projetadas
+EXPORTS = {
+    "customers": _customers_query,
+    "appointments": _appointments_query,
+    "anamnesis_records": _anamnesis_records_query,
+}
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def stream_export(entity: str, file_format: str, yield_per: int = EXPORT_YIELD_PER) -> Iterator[bytes]:
+    """
+    Gera o conteúdo da exportação em blocos de bytes, um bloco por lote de `yield_per` linhas.
+    Usa cursor no servidor (yield_per/stream_results): a memória fica constante e o
+    primeiro bloco sai assim que o banco devolve o primeiro lote.
+    A sessão é aberta aqui, e não via dependência, porque precisa viver durante todo o streaming.
+    """
+    query = EXPORTS[entity]()
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=yield_per))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if file_format == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+        for partition in result.partitions():
+            if writer is not None:
+                writer.writerows([_csv_value(v) for v in row] for row in partition)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
@@ -0,0 +1,309 @@
+# app/ingestion.py
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, select, update
+
+from . import models, realtime
+from .database import AsyncSessionLocal, insert_ignore_statement
+
+# --- Configurações da Ingestão de Mensagens ---
+# Um lote é gravado quando junta INGEST_BATCH_SIZE mensagens ou quando a mais antiga
+# espera INGEST_FLUSH_INTERVAL segundos, o que acontecer primeiro.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.05"))
+# Mensagens aguardando gravação; acima disso a rota responde 503 (backpressure)
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))
+# Chaves de idempotência lembradas em memória (as já gravadas também são conferidas no banco)
+INGEST_RECENT_KEYS = int(os.getenv("INGEST_RECENT_KEYS", "100000"))
+# Tentativas de gravar um lote quando outro worker grava a mesma chave ao mesmo tempo
+INGEST_WRITE_ATTEMPTS = 3
+# Remetente cujas mensagens contam como não lidas pela clínica
+UNREAD_SENDER = "customer"
+
+messages = models.Message.__table__
+conversations = models.Conversation.__table__
+
+
+# Marcador enfileirado por stop(): a tarefa de gravação sai depois do lote atual
+_STOP = object()
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Datas com fuso ("...Z") viram UTC sem fuso, como a coluna `timestamp` guarda: um lote junta
+    mensagens de vários remetentes, e comparar datas com e sem fuso derrubaria o lote inteiro.
+    """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class QueueFull(Exception):
+    """A fila de ingestão não comporta o lote; o cliente deve tentar de novo mais tarde."""
+
+
+class PendingMessage:
+    """Uma mensagem aguardando o próximo lote, com o Future resolvido após a gravação."""
+    __slots__ = ("conversation_id", "idempotency_key", "row", "future")
+
+    def __init__(self, conversation_id: int, idempotency_key: Optional[str], row: dict, future: asyncio.Future):
+        self.conversation_id = conversation_id
+        self.idempotency_key = idempotency_key
+        self.row = row
+        self.future = future # Resultado: "stored", "duplicate", "unknown_conversation" ou "failed"
+
+
+class MessageIngestor:
+    """
+    Fila em processo para mensagens recebidas (webhooks de chat).
+    As mensagens são agrupadas em micro-lotes e cada lote é gravado numa única transação:
+    um INSERT de várias linhas em `messages` e um UPDATE agregado por conversa
+    (`unread_count` e `last_message_at`), em vez de uma transação por mensagem.
+    Roda no event loop: nada aqui precisa de lock.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_max: int, recent_keys: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_max = queue_max
+        self.recent_keys = recent_keys
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._recent: "OrderedDict[str, None]" = OrderedDict() # Enfileiradas ou gravadas há pouco
+        self.stored = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failures = 0
+
+    # --- Ciclo de Vida ---
+    def start(self):
+        """Inicia a tarefa de gravação (chamado no startup da aplicação)."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name="message-ingestion")
+
+    async def stop(self):
+        """
+        Grava o que estiver na fila e encerra a tarefa (chamado no shutdown).
+        A tarefa não é cancelada: o marcador de parada entra no fim da fila, e ela termina o lote
+        que estiver montando ou gravando antes de sair (cancelar perderia esse lote).
+        """
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+        # Mensagens enfileiradas depois do marcador
+        while not self._queue.empty():
+            await self._flush(self._drain(self.batch_size)[0])
+
+    # --- Entrada ---
+    def submit(self, items: List[dict]) -> List[asyncio.Future]:
+        """
+        Enfileira mensagens (dicts com conversation_id, idempotency_key e as colunas de `messages`).
+        O lote é aceito inteiro ou recusado inteiro com QueueFull.
+        Duplicatas já conhecidas em memória são resolvidas na hora como "duplicate".
+        """
+        if self._queue is None:
+            raise RuntimeError("A ingestão de mensagens não foi iniciada")
+        if self._queue.qsize() + len(items) > self.queue_max:
+            self.rejected += len(items)
+            raise QueueFull()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            futures.append(future)
+            key = item.get("idempotency_key")
+            if key is not None and key in self._recent:
+                self.duplicates += 1
+                future.set_result("duplicate")
+                continue
+            if key is not None:
+                self._remember(key)
+            row = {k: v for k, v in item.items() if k != "idempotency_key"}
+            # Sem chave do provedor, a linha recebe uma gerada aqui: é por ela que o id de cada
+            # mensagem é lido de volta depois do INSERT em lote (nem todo banco tem RETURNING)
+            row["idempotency_key"] = key if key is not None else f"ingest:{uuid.uuid4().hex}"
+            row["timestamp"] = _naive_utc(row.get("timestamp"))
+            self._queue.put_nowait(PendingMessage(item["conversation_id"], key, row, future))
+        return futures
+
+    def _remember(self, key: str):
+        self._recent[key] = None
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.recent_keys:
+            self._recent.popitem(last=False)
+
+    # --- Gravação ---
+    def _drain(self, limit: int) -> Tuple[List[PendingMessage], bool]:
+        """Até `limit` mensagens já na fila, sem esperar; o bool indica que o marcador de parada foi lido."""
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                drained, stopping = self._drain(self.batch_size - len(batch))
+                batch.extend(drained)
+                remaining = deadline - time.monotonic()
+                if stopping or len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[PendingMessage]):
+        if not batch:
+            return
+        try:
+            results = await self._write(batch)
+        except Exception as e:
+            self.failures += 1
+            print(f"Erro ao gravar lote de {len(batch)} mensagens: {e}")
+            for pending in batch:
+                # Permite que uma nova entrega da mesma mensagem seja aceita
+                if pending.idempotency_key is not None:
+                    self._recent.pop(pending.idempotency_key, None)
+                if not pending.future.done():
+                    pending.future.set_result("failed")
+            return
+        self.batches += 1
+        for pending, result in zip(batch, results):
+            if result == "unknown_conversation" and pending.idempotency_key is not None:
+                self._recent.pop(pending.idempotency_key, None)
+            if result == "stored":
+                self.stored += 1
+                # INSERT em lote via Core: não passa pelos eventos do ORM, então publica aqui,
+                # já com o id gerado (os clientes usam o id para deduplicar e paginar o histórico)
+                realtime.publish_message(pending.row)
+            elif result == "duplicate":
+                self.duplicates += 1
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    async def _write(self, batch: List[PendingMessage]) -> List[str]:
+        """Grava um lote numa transação. Retorna o resultado de cada mensagem, na ordem do lote."""
+        for _ in range(INGEST_WRITE_ATTEMPTS):
+            results = await self._write_once(batch)
+            if results is not None:
+                return results
+        raise RuntimeError(f"Chaves de idempotência disputadas com outro worker em {INGEST_WRITE_ATTEMPTS} tentativas")
+
+    async def _write_once(self, batch: List[PendingMessage]) -> Optional[List[str]]:
+        """
+        Uma tentativa de gravar o lote. None se o INSERT descartou alguma linha: outro worker
+        gravou a mesma chave entre a conferência e o INSERT. A transação é desfeita e, na próxima
+        tentativa, a conferência já enxerga a chave dele (e a mensagem sai como "duplicate").
+        """
+        conversation_ids = sorted({p.conversation_id for p in batch})
+        keys = [p.idempotency_key for p in batch if p.idempotency_key is not None]
+        async with AsyncSessionLocal() as db:
+            existing_conversations = set((await db.execute(
+                select(conversations.c.id).where(conversations.c.id.in_(conversation_ids))
+            )).scalars())
+            stored_keys = set()
+            if keys:
+                stored_keys = set((await db.execute(
+                    select(messages.c.idempotency_key).where(messages.c.idempotency_key.in_(keys))
+                )).scalars())
+
+            results, rows = [], []
+            totals: Dict[int, dict] = {}
+            seen = set()
+            for pending in batch:
+                key = pending.idempotency_key
+                if pending.conversation_id not in existing_conversations:
+                    results.append("unknown_conversation")
+                    continue
+                if key is not None and (key in stored_keys or key in seen):
+                    results.append("duplicate")
+                    continue
+                if key is not None:
+                    seen.add(key)
+                results.append("stored")
+                rows.append(pending.row)
+                total = totals.setdefault(pending.conversation_id, {"cid": pending.conversation_id, "unread": 0, "last": None})
+                if pending.row["sender"] == UNREAD_SENDER:
+                    total["unread"] += 1
+                if total["last"] is None or pending.row["timestamp"] > total["last"]:
+                    total["last"] = pending.row["timestamp"]
+
+            if rows:
+                connection = await db.connection()
+                # IGNORE/ON CONFLICT DO NOTHING: cobre a corrida com outro worker gravando a mesma chave.
+                # Um único INSERT de várias linhas, para que o rowcount diga quantas entraram de fato
+                # (no executemany ele não é confiável em todos os drivers)
+                inserted = await connection.execute(
+                    insert_ignore_statement(connection.dialect.name, messages, ["idempotency_key"]).values(rows)
+                )
+                if inserted.rowcount != len(rows):
+                    await db.rollback()
+                    return None
+                # Todas as linhas são deste lote: os ids gerados são lidos pelas chaves
+                ids = dict((await connection.execute(
+                    select(messages.c.idempotency_key, messages.c.id)
+                    .where(messages.c.idempotency_key.in_([row["idempotency_key"] for row in rows]))
+                )).all())
+                # Um UPDATE por conversa, em ordem de id para evitar deadlocks entre lotes concorrentes
+                last = bindparam("last")
+                await connection.execute(
+                    update(conversations)
+                    .where(conversations.c.id == bindparam("cid"))
+                    .values(
+                        unread_count=conversations.c.unread_count + bindparam("unread"),
+                        last_message_at=case(
+                            (conversations.c.last_message_at.is_(None), last),
+                            (conversations.c.last_message_at < last, last),
+                            else_=conversations.c.last_message_at,
+                        ),
+                    ),
+                    [totals[cid] for cid in sorted(totals)],
+                )
+                await db.commit()
+                for row in rows:
+                    row["id"] = ids[row["idempotency_key"]]
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self.queue_max,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "stored": self.stored,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+
+message_ingestor = MessageIngestor(INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_QUEUE_MAX, INGEST_RECENT_KEYS)
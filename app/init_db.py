@@ -1,14 +1,41 @@
 # app/init_db.py
 
+import argparse
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
 from .database import engine, Base
 from . import models  # Importa todos os modelos definidos em models.py
 
-def create_tables():
+# Versão do esquema esperada por este código. Incremente ao adicionar tabelas/colunas:
+# os workers recusam subir contra um banco que não passou pelo bootstrap da versão atual.
+SCHEMA_VERSION = 5
+# Nome do lock consultivo que serializa bootstraps concorrentes (ex: várias réplicas no deploy)
+BOOTSTRAP_LOCK_NAME = "estetica_io_bootstrap"
+BOOTSTRAP_LOCK_TIMEOUT = int(os.getenv("BOOTSTRAP_LOCK_TIMEOUT", "60")) # Segundos
+# Desenvolvimento: roda o bootstrap no startup da aplicação, como antes
+DB_AUTO_BOOTSTRAP = os.getenv("DB_AUTO_BOOTSTRAP", "false").lower() in ("1", "true", "yes")
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@estetica.com")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "1234")
+
+schema_info = models.SchemaInfo.__table__
+
+
+class SchemaMismatch(RuntimeError):
+    """O banco não está na versão de esquema esperada; rode `python -m app.init_db`."""
+
+
+def create_tables(bind=None):
     print("Tentando criar tabelas no banco de dados...")
     try:
         # Cria todas as tabelas definidas nos modelos que herdam de Base
         # Agora, Base.metadata.create_all() vai encontrar suas classes de modelo
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=bind if bind is not None else engine)
         print("Tabelas criadas com sucesso ou já existentes.")
     except Exception as e:
         print(f"Erro ao criar tabelas: {e}")
@@ -16,6 +43,202 @@ def create_tables():
         # e talvez ter uma lógica para tentar novamente ou notificar.
         raise # Re-levanta a exceção para que o chamador possa lidar com ela
 
+
+@contextmanager
+def advisory_lock(connection, name: str = BOOTSTRAP_LOCK_NAME, timeout: int = BOOTSTRAP_LOCK_TIMEOUT):
+    """
+    Lock consultivo no banco, mantido enquanto durar o bloco.
+    MySQL: GET_LOCK/RELEASE_LOCK; PostgreSQL: pg_advisory_lock. No SQLite (só desenvolvimento)
+    não há lock entre processos além do lock de escrita do próprio arquivo.
+    """
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        acquired = connection.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}).scalar()
+        if acquired != 1:
+            raise TimeoutError(f"Não foi possível obter o lock '{name}' em {timeout}s")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+    elif dialect == "postgresql":
+        connection.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": name})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": name})
+    else:
+        yield
+
+
+def current_schema_version(connection) -> int:
+    """Versão gravada no banco (0 se o bootstrap nunca rodou)."""
+    if not inspect(connection).has_table(schema_info.name):
+        return 0
+    return connection.execute(select(schema_info.c.version).where(schema_info.c.id == 1)).scalar() or 0
+
+
+# --- Migrações ---
+# `create_all` só cria tabelas que ainda não existem: colunas e índices novos em tabelas
+# antigas precisam de um passo explícito aqui, associado à versão que os introduziu.
+def _add_column(connection, table, name: str, default: str = None):
+    column = table.c[name]
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}"
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    connection.execute(text(ddl))
+    print(f"Coluna {table.name}.{name} adicionada.")
+
+
+def _create_index(connection, table, name: str):
+    index = next(index for index in table.indexes if index.name == name)
+    connection.execute(CreateIndex(index))
+    print(f"Índice {name} criado.")
+
+
+def _migrate_to_4(connection):
+    """
+    Colunas e índices adicionados às tabelas do esquema original (agenda, paginação de
+    mensagens, índice de anamnese e ingestão idempotente). Cada passo confere antes se já
+    existe: bancos criados do zero nas versões 1 a 3 já os têm.
+    """
+    inspector = inspect(connection)
+    fields = models.AnamnesisTemplateField.__table__
+    messages = models.Message.__table__
+    appointments = models.Appointment.__table__
+    if "indexed" not in {c["name"] for c in inspector.get_columns(fields.name)}:
+        _add_column(connection, fields, "indexed", default="false")
+    if "idempotency_key" not in {c["name"] for c in inspector.get_columns(messages.name)}:
+        _add_column(connection, messages, "idempotency_key")
+        # Índice único em vez de ADD CONSTRAINT (o SQLite não altera restrições de tabelas existentes)
+        connection.execute(text(f"CREATE UNIQUE INDEX uq_messages_idempotency_key ON {messages.name} (idempotency_key)"))
+        print("Índice único uq_messages_idempotency_key criado.")
+    for table, name in (
+        (appointments, "ix_appointments_professional_date"),
+        (messages, "ix_messages_conversation_timestamp_id"),
+    ):
+        if name not in {index["name"] for index in inspector.get_indexes(table.name)}:
+            _create_index(connection, table, name)
+
+
+def _migrate_to_5(connection):
+    """Índice da caixa de entrada (conversas ordenadas pela última mensagem)."""
+    conversations = models.Conversation.__table__
+    if "ix_conversations_last_message" not in {index["name"] for index in inspect(connection).get_indexes(conversations.name)}:
+        _create_index(connection, conversations, "ix_conversations_last_message")
+
+
+# Passos aplicados em ordem a partir da versão gravada no banco (versão -> função)
+MIGRATIONS = {
+    4: _migrate_to_4,
+    5: _migrate_to_5,
+}
+
+
+def migrate(connection, version: int):
+    """Aplica os passos de MIGRATIONS posteriores a `version`, depois do `create_all`."""
+    for target in sorted(MIGRATIONS):
+        if version < target <= SCHEMA_VERSION:
+            print(f"Aplicando migração para a versão {target}...")
+            MIGRATIONS[target](connection)
+
+
+def seed_admin(db: Session):
+    """Cria o usuário admin padrão se ele ainda não existir."""
+    from . import auth # Importado aqui: o bcrypt só é necessário quando o admin precisa ser criado
+    if db.execute(select(models.User.id).where(models.User.email == ADMIN_EMAIL)).first() is not None:
+        print("Usuário administrador padrão já existe.")
+        return
+    db.add(models.User(
+        email=ADMIN_EMAIL,
+        password_hash=auth.get_password_hash(ADMIN_PASSWORD),
+        name="Administrador",
+        role="admin",
+    ))
+    db.commit()
+    print(f"Usuário administrador padrão criado com sucesso: {ADMIN_EMAIL}")
+
+
+def backfill(db: Session, version: int):
+    """
+    Preenche os resumos e índices mantidos pela aplicação a partir dos dados que já existem
+    no banco, para as tabelas criadas neste upgrade (vazias). Todos são idempotentes.
+    """
+    from . import anamnesis_index, customer_search, pipeline, revenue
+    if version < 2:
+        # Versão 2: resumo diário de faturamento
+        print(f"Resumo de faturamento preenchido: {revenue.rebuild(db)} linhas.")
+    if version < 4:
+        # Bancos anteriores às migrações versionadas podem ter vindo do esquema original, sem os
+        # resumos do funil, o índice de busca de clientes e o índice de anamnese
+        print(f"Resumo do funil preenchido: {pipeline.rebuild(db)} linhas.")
+        connection = db.get_bind() # Sem transação aberta (os rebuilds acima fazem commit)
+        print(f"Índice de busca preenchido: {customer_search.rebuild(bind=connection)} clientes.")
+        print(f"Índice de anamnese preenchido: {anamnesis_index.backfill(bind=connection)} fichas.")
+
+
+def bootstrap(target_engine=None):
+    """
+    Cria as tabelas, aplica as migrações pendentes, semeia o admin e grava a versão do esquema,
+    sob lock consultivo.
+    Idempotente: com o banco já na versão atual, só confere e sai.
+    Rode uma vez por deploy (`python -m app.init_db`), antes de subir os workers.
+    `target_engine` permite rodar contra outro banco (ex: o de uma clínica, em app/tenancy.py).
+    """
+    started = time.perf_counter()
+    with (target_engine or engine).connect() as connection:
+        with advisory_lock(connection):
+            # Os locks são de sessão: sobrevivem aos commits abaixo
+            version = current_schema_version(connection)
+            connection.commit()
+            if version > SCHEMA_VERSION:
+                raise SchemaMismatch(f"Banco na versão {version}, mais nova que a deste código ({SCHEMA_VERSION})")
+            if version < SCHEMA_VERSION:
+                create_tables(bind=connection)
+                migrate(connection, version)
+                connection.commit()
+            with Session(bind=connection) as db:
+                seed_admin(db)
+                backfill(db, version)
+            if version < SCHEMA_VERSION:
+                stmt = schema_info.update() if version else schema_info.insert()
+                connection.execute(stmt.values(id=1, version=SCHEMA_VERSION))
+                connection.commit()
+                print(f"Esquema atualizado da versão {version} para {SCHEMA_VERSION}.")
+    print(f"Bootstrap concluído em {time.perf_counter() - started:.2f}s.")
+
+
+def verify_schema(target_engine=None):
+    """
+    Caminho rápido do startup dos workers: só lê a versão do esquema, sem DDL nem bcrypt.
+    Levanta SchemaMismatch se o bootstrap não rodou para a versão atual.
+    """
+    with (target_engine or engine).connect() as connection:
+        version = current_schema_version(connection)
+    if version != SCHEMA_VERSION:
+        raise SchemaMismatch(
+            f"Esquema do banco na versão {version}, esperada {SCHEMA_VERSION}. "
+            "Rode `python -m app.init_db` antes de iniciar a aplicação."
+        )
+
+
+# Uso: python -m app.init_db [bootstrap | verify]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Criação do esquema e dados iniciais do banco.")
+    parser.add_argument("command", nargs="?", default="bootstrap", choices=["bootstrap", "verify"])
+    args = parser.parse_args(argv)
+    if args.command == "bootstrap":
+        bootstrap()
+    else:
+        try:
+            verify_schema()
+        except SchemaMismatch as e:
+            print(str(e))
+            raise SystemExit(1)
+        print(f"Esquema na versão {SCHEMA_VERSION}.")
+
+
 # Se este script for executado diretamente
 if __name__ == "__main__":
-    create_tables()
+    main()
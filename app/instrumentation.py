@@ -0,0 +1,212 @@
+# app/instrumentation.py
+
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from .metrics import Histogram
+
+# --- Configurações da Instrumentação ---
+# Fração das requisições com contagem de consultas, Server-Timing e log de lentidão (0 desliga).
+# O histograma de latência por rota é registrado em todas as requisições.
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv("INSTRUMENTATION_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_REQUEST_TOP_STATEMENTS = int(os.getenv("SLOW_REQUEST_TOP_STATEMENTS", "5"))
+# Se definido, /metrics exige `Authorization: Bearer <METRICS_TOKEN>`. É também o token de
+# operador das métricas /admin/metrics/* no modo multi-clínica (ver auth.get_current_operator)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+
+class RequestStats:
+    """Consultas executadas durante uma requisição amostrada."""
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements: List[Tuple[float, str]] = [] # (duração, SQL)
+
+
+# Objeto mutável no contexto: o threadpool do FastAPI e os greenlets do motor assíncrono
+# herdam o contexto da requisição, então as consultas feitas lá são somadas aqui.
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+# --- Ganchos do Motor ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats.queries += 1
+    stats.db_time += elapsed
+    stats.statements.append((elapsed, statement))
+
+def instrument_engine(engine):
+    """Conta consultas e tempo de banco por requisição (motor síncrono ou `async_engine.sync_engine`)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Agregados por Rota ---
+class RouteMetrics:
+    """Latência, quantidade de consultas e tempo de banco acumulados por (método, rota)."""
+
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._db: Dict[Tuple[str, str], List[float]] = {} # [requisições amostradas, consultas, tempo]
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, elapsed: float, stats: Optional[RequestStats]):
+        key = (method, route)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latency.setdefault(key, Histogram())
+        histogram.observe(elapsed)
+        with self._lock:
+            status_key = (method, route, status)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            if stats is not None:
+                db = self._db.setdefault(key, [0, 0, 0.0])
+                db[0] += 1
+                db[1] += stats.queries
+                db[2] += stats.db_time
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            latency = dict(self._latency)
+            db = {k: list(v) for k, v in self._db.items()}
+        rows = []
+        for (method, route), histogram in sorted(latency.items(), key=lambda item: item[0][1]):
+            snapshot = histogram.snapshot()
+            sampled, queries, db_time = db.get((method, route), (0, 0, 0.0))
+            rows.append({
+                "method": method,
+                "route": route,
+                "count": snapshot["count"],
+                "p50": snapshot["p50"],
+                "p95": snapshot["p95"],
+                "p99": snapshot["p99"],
+                "mean_queries": (queries / sampled) if sampled else None,
+                "mean_db_seconds": (db_time / sampled) if sampled else None,
+            })
+        return rows
+
+    def prometheus(self) -> str:
+        """Métricas no formato de texto do Prometheus."""
+        with self._lock:
+            latency = dict(self._latency)
+            requests = dict(self._requests)
+            db = {k: list(v) for k, v in self._db.items()}
+        lines = [
+            "# HELP http_requests_total Requisições atendidas, por rota e status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+        lines += [
+            "# HELP http_request_duration_seconds Latência das requisições, por rota.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {snapshot['sum']}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {snapshot['count']}")
+        lines += [
+            "# HELP db_queries_total Consultas SQL nas requisições amostradas, por rota.",
+            "# TYPE db_queries_total counter",
+        ]
+        for (method, route), (sampled, queries, db_time) in sorted(db.items()):
+            lines.append(f'db_queries_total{{method="{method}",route="{_escape(route)}"}} {queries}')
+        lines += [
+            "# HELP db_time_seconds_total Tempo gasto em SQL nas requisições amostradas, por rota.",
+            "# TYPE db_time_seconds_total counter",
+        ]
+        for (method, route), (sampled, queries, db_time) in sorted(db.items()):
+            lines.append(f'db_time_seconds_total{{method="{method}",route="{_escape(route)}"}} {db_time}')
+        lines += [
+            "# HELP db_sampled_requests_total Requisições amostradas (base das métricas db_*), por rota.",
+            "# TYPE db_sampled_requests_total counter",
+        ]
+        for (method, route), (sampled, queries, db_time) in sorted(db.items()):
+            lines.append(f'db_sampled_requests_total{{method="{method}",route="{_escape(route)}"}} {sampled}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+route_metrics = RouteMetrics()
+
+
+def _log_slow_request(method: str, route: str, path: str, elapsed: float, stats: RequestStats):
+    top = sorted(stats.statements, key=lambda s: s[0], reverse=True)[:SLOW_REQUEST_TOP_STATEMENTS]
+    print(
+        f"Requisição lenta: {method} {path} ({route}) em {elapsed * 1000:.1f} ms, "
+        f"{stats.queries} consultas, {stats.db_time * 1000:.1f} ms no banco"
+    )
+    for duration, statement in top:
+        print(f"  {duration * 1000:8.1f} ms  {' '.join(statement.split())[:300]}")
+
+
+# --- Middleware ---
+class InstrumentationMiddleware:
+    """
+    Middleware ASGI: mede a latência de cada requisição HTTP, agregada pelo template da rota
+    (ex: /customers/{customer_id}), e nas requisições amostradas conta as consultas SQL,
+    adiciona o cabeçalho Server-Timing e registra as requisições lentas.
+    """
+
+    def __init__(self, app, sample_rate: float = INSTRUMENTATION_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.sample_rate >= 1.0 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        stats = RequestStats() if sampled else None
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if stats is not None:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", app;dur={app_ms:.1f}'
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            route_metrics.record(scope["method"], route, status_code, elapsed, stats)
+            if stats is not None and elapsed >= SLOW_REQUEST_SECONDS:
+                _log_slow_request(scope["method"], route, scope["path"], elapsed, stats)
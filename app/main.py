@@ -1,75 +1,114 @@
 # app/main.py
 
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import io
+from datetime import date, timedelta
+from typing import List, Optional, Union
+
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import schemas, models, auth # Importa os módulos de schemas, models e auth
-from .database import get_db, engine # Importa get_db e engine para criar tabelas
+from . import anamnesis_index, availability, agenda, bulk_import, init_db, conversations, customer_search, exports, ingestion, media, instrumentation, pipeline, pool_metrics, projections, realtime, reference_cache, replicas, revenue, segments, series, tenancy
+from .database import get_db, get_async_db, engine, async_engine # Importa get_db e engine para criar tabelas
+from .replicas import get_read_db
+from .tenancy import get_tenant_db, single_tenant_only
 
 # --- INSTÂNCIA DO FASTAPI (MOVIDA PARA CIMA) ---
 app = FastAPI(
     title="Estética.IO API",
     description="API para o sistema de gestão de clínica estética",
     version="0.1.0",
+    # orjson serializa datetime/date nativamente e é bem mais rápido que o encoder padrão
+    default_response_class=ORJSONResponse,
 )
 
-# --- Criação de Tabelas no Startup (Instalador) ---
+# Latência por rota, consultas por requisição (Server-Timing) e log de requisições lentas
+app.add_middleware(instrumentation.InstrumentationMiddleware)
+# Depois de uma escrita, o cliente lê do primário por alguns segundos (ver app/replicas.py)
+app.add_middleware(replicas.ReadYourWritesMiddleware)
+
+# --- Verificação do Banco no Startup ---
+# A criação das tabelas e do admin padrão roda uma única vez por deploy, fora dos workers:
+#     python -m app.init_db
+# Cada worker só confere a versão do esquema. Com DB_AUTO_BOOTSTRAP=true
+# (desenvolvimento), o próprio startup roda o bootstrap, protegido pelo lock consultivo.
 @app.on_event("startup")
 def on_startup():
     """Função executada na inicialização da aplicação."""
-    print("Iniciando a aplicação e verificando/criando tabelas do banco de dados...")
     try:
-        # Cria todas as tabelas se elas não existirem
-        models.Base.metadata.create_all(bind=engine)
-        print("Tabelas do banco de dados verificadas/criadas com sucesso.")
-
-        # Opcional: Criar um usuário admin padrão se não existir
-        db = next(get_db()) # Obtém uma sessão de DB
-        if not auth.get_user_by_email(db, email="admin@estetica.com"):
-            hashed_password = auth.get_password_hash("1234")
-            admin_user = models.User(
-                email="admin@estetica.com",
-                password_hash=hashed_password,
-                name="Administrador",
-                role="admin"
-            )
-            db.add(admin_user)
-            db.commit()
-            db.refresh(admin_user)
-            print("Usuário administrador padrão criado com sucesso: admin@estetica.com")
+        if init_db.DB_AUTO_BOOTSTRAP:
+            init_db.bootstrap()
         else:
-            print("Usuário administrador padrão já existe.")
-        db.close()
+            init_db.verify_schema()
     except Exception as e:
         print(f"ERRO CRÍTICO na inicialização do banco de dados: {e}")
-        # Em produção, você pode querer que a aplicação falhe ao iniciar se o DB não estiver pronto.
-        raise # Re-levanta a exceção para que o EasyPanel possa reportar a falha.
+        # Falha ao iniciar para que o EasyPanel possa reportar o problema.
+        raise
+
+@app.on_event("startup")
+async def on_startup_async():
+    """Inicia as tarefas de fundo que vivem no event loop."""
+    realtime.broker.start()
+    ingestion.message_ingestor.start()
+    if replicas.router.replicas:
+        app.state.replica_health = asyncio.create_task(replicas.health_loop())
+    if tenancy.TENANCY_ENABLED:
+        app.state.tenant_idle = asyncio.create_task(tenancy.idle_loop())
 
+@app.on_event("shutdown")
+def on_shutdown():
+    """Função executada no encerramento da aplicação."""
+    auth.shutdown_hash_executor()
+
+@app.on_event("shutdown")
+async def on_shutdown_async():
+    """Grava as mensagens ainda na fila de ingestão e fecha as conexões dos motores assíncronos."""
+    await ingestion.message_ingestor.stop()
+    await realtime.broker.stop()
+    for name in ("replica_health", "tenant_idle"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await replicas.router.dispose()
+    await tenancy.registry.dispose()
+    await async_engine.dispose()
 
 # --- Endpoints de Autenticação ---
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_tenant_db),
+):
     """
     Endpoint para autenticação de usuário.
     Recebe `username` (email) e `password`.
     Retorna um token JWT se as credenciais forem válidas.
+    A consulta é assíncrona e a verificação bcrypt roda no pool de hashing.
+    No modo multi-clínica, a clínica vem do cabeçalho X-Tenant e é gravada no token.
     """
-    user = auth.get_user_by_email(db, email=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.password_hash):
+    user = await auth.get_user_by_email_async(db, email=form_data.username)
+    if not user or not await auth.verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha inválidos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.email, "role": user.role}, expires_delta=access_token_expires
-    )
+    claims = {"sub": user.email, "role": user.role, "uid": user.id, "name": user.name}
+    tenant = getattr(request.state, "tenant", None)
+    if tenant is not None:
+        claims["tenant"] = tenant
+    access_token = auth.create_access_token(data=claims, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=schemas.UserResponse)
-async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+async def read_users_me(current_user: auth.Principal = Depends(auth.get_current_user)):
     """
     Retorna as informações do usuário logado.
     Esta rota é protegida e exige um token JWT válido.
@@ -78,12 +117,617 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_use
 
 # Exemplo de rota protegida apenas para admin
 @app.get("/admin-only", response_model=schemas.MessageResponse)
-async def read_admin_only_data(current_admin: models.User = Depends(auth.get_current_admin_user)):
+async def read_admin_only_data(current_admin: auth.Principal = Depends(auth.get_current_admin_user)):
     """
     Endpoint de exemplo acessível apenas por usuários com role 'admin'.
     """
     return {"message": f"Olá, {current_admin.name}! Você tem acesso de admin."}
 
+# --- Clientes ---
+@app.post("/customers/import", response_model=schemas.CustomerImportReport)
+def import_customers(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(bulk_import.IMPORT_BATCH_SIZE, ge=1, le=20000),
+    db: Session = Depends(get_db),
+    current_admin: auth.Principal = Depends(auth.get_current_admin_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Importação em lote de clientes a partir de CSV ou NDJSON (com coluna/campo `tags`).
+    O arquivo é lido em streaming e gravado em lotes com INSERTs de várias linhas;
+    clientes com email já cadastrado são atualizados. Linhas inválidas são reportadas
+    individualmente sem abortar a importação.
+    Rota síncrona de propósito: roda no threadpool, fora do event loop.
+    """
+    file_format = bulk_import.detect_format(file.filename, format)
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    return bulk_import.import_customers(db, bulk_import.iter_records(lines, file_format), batch_size=batch_size)
+
+@app.get("/customers", response_model=List[schemas.CustomerResponse])
+async def read_customers(
+    limit: int = Query(1000, ge=1, le=10000),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Lista de clientes com suas tags, em ordem de id. Paginação por `after_id` (id do último da página anterior).
+    Projeção enxuta: só as colunas necessárias, sem objetos ORM nem validação por linha.
+    """
+    return ORJSONResponse(await projections.list_customers(db, limit=limit, after_id=after_id))
+
+@app.get("/customers/search", response_model=List[schemas.CustomerResponse])
+async def search_customers(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Busca de clientes por partes do nome, email ou telefone (ex: "ana sil", "9876", "ana@").
+    Ignora acentos e maiúsculas; todos os termos precisam casar. Usa o índice de tokens.
+    """
+    return await customer_search.search_customers(db, q, limit=limit)
+
+# --- Serviços ---
+@app.get("/services", response_model=List[schemas.ServiceResponse])
+async def read_services(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """Todos os serviços, por nome (projeção enxuta, como em GET /customers)."""
+    return ORJSONResponse(await projections.list_services(db))
+
+# --- Agenda / Calendário ---
+CALENDAR_MAX_DAYS = 93
+
+@app.get("/appointments/calendar", response_model=schemas.CalendarResponse)
+async def read_calendar(
+    start: date,
+    end: date,
+    professional_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Agendamentos entre `start` e `end` (inclusive), com clientes, serviços e profissionais
+    listados uma única vez. O número de consultas ao banco é fixo, qualquer que seja o período.
+    """
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="`end` deve ser maior ou igual a `start`")
+    if (end - start).days >= CALENDAR_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O período máximo é de {CALENDAR_MAX_DAYS} dias",
+        )
+    return await agenda.list_calendar(db, start, end, professional_id=professional_id, customer_id=customer_id)
+
+@app.post("/appointments/series", response_model=schemas.AppointmentSeriesResult, status_code=status.HTTP_201_CREATED)
+async def create_appointment_series(
+    booking: schemas.AppointmentSeriesCreate,
+    atomic: bool = True,
+    db: AsyncSession = Depends(get_tenant_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Agenda uma série de sessões (ex: 10 semanais) a partir de uma regra de recorrência.
+    Todas as ocorrências são conferidas contra a agenda do profissional numa única consulta
+    (início + duração do serviço) e as livres são gravadas de uma vez.
+    Com `atomic=true` (padrão), qualquer conflito cancela a série: 409 com o relatório por data.
+    Com `atomic=false`, grava as livres e reporta os conflitos.
+    """
+    try:
+        result = await series.book_series(db, booking.model_dump(), atomic=atomic)
+    except series.SeriesError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not result["committed"]:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=jsonable_encoder(result))
+    return result
+
+# --- Conversas ---
+@app.get("/conversations", response_model=schemas.ConversationPage)
+async def read_inbox(
+    limit: int = Query(30, ge=1, le=100),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """Caixa de entrada: conversas mais recentes primeiro, com a prévia da última mensagem."""
+    try:
+        return await conversations.list_inbox(db, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/conversations/{conversation_id}/messages", response_model=schemas.MessagePage)
+async def read_conversation_messages(
+    conversation_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Histórico de mensagens paginado por cursor, da mais nova para a mais antiga.
+    Use `next_cursor` em `before` para voltar no tempo e `prev_cursor` em `after` para avançar.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use apenas `before` ou `after`")
+    if await db.get(models.Conversation, conversation_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversa não encontrada")
+    try:
+        return await conversations.list_messages(db, conversation_id, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.post("/messages/ingest", response_model=schemas.IngestResult, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_messages(
+    payload: Union[schemas.InboundMessage, List[schemas.InboundMessage]],
+    wait: bool = False,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Recebe uma mensagem ou uma lista de mensagens de canais externos (ex: WhatsApp).
+    As mensagens entram numa fila e são gravadas em micro-lotes, com um UPDATE por conversa.
+    Entregas repetidas com a mesma `idempotency_key` são descartadas.
+    Com `wait=true`, responde só depois da gravação, com o resultado de cada mensagem.
+    Fila cheia: 503 com Retry-After.
+    """
+    inbound = payload if isinstance(payload, list) else [payload]
+    items = []
+    for message in inbound:
+        items.append({
+            "conversation_id": message.conversation_id,
+            "idempotency_key": message.idempotency_key,
+            "sender": message.sender,
+            "message_type": message.message_type,
+            "content": message.content.model_dump(exclude_none=True),
+            "timestamp": message.timestamp,
+        })
+    try:
+        futures = ingestion.message_ingestor.submit(items)
+    except ingestion.QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Fila de mensagens cheia, tente novamente em instantes",
+            headers={"Retry-After": "1"},
+        )
+    duplicates = sum(1 for f in futures if f.done() and f.result() == "duplicate")
+    if not wait:
+        return {"accepted": len(items) - duplicates, "duplicates": duplicates}
+    results = await asyncio.gather(*futures)
+    return {"accepted": len(items) - duplicates, "duplicates": duplicates, "results": results}
+
+# --- Mídia (anexos do chat) ---
+def _media_error(e: media.MediaError) -> HTTPException:
+    headers = {"Upload-Offset": str(e.received)} if e.received is not None else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+@app.post("/media/uploads", response_model=schemas.MediaUploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_media_upload(
+    upload: schemas.MediaUploadCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Inicia um upload em partes. Envie o arquivo com PUT /media/uploads/{id}?offset=N e conclua com /complete."""
+    try:
+        return await media.create_upload(db, upload.filename, upload.content_type, upload.size)
+    except media.MediaError as e:
+        raise _media_error(e)
+
+@app.get("/media/uploads/{upload_id}", response_model=schemas.MediaUploadResponse)
+async def read_media_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Situação do upload: `received` é o offset de onde retomar após uma falha."""
+    upload = await db.get(models.MediaUpload, upload_id)
+    if upload is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload não encontrado")
+    return upload
+
+@app.put("/media/uploads/{upload_id}", response_model=schemas.MediaUploadResponse)
+async def write_media_upload_part(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Grava o corpo da requisição (bytes crus, de qualquer tamanho) a partir de `offset`.
+    O corpo é lido em streaming e gravado em blocos, sem juntar o arquivo na memória.
+    `offset` diferente do já recebido: 409 com o cabeçalho Upload-Offset.
+    """
+    try:
+        return await media.write_part(db, upload_id, offset, request.stream())
+    except media.MediaError as e:
+        raise _media_error(e)
+
+@app.post("/media/uploads/{upload_id}/complete", response_model=schemas.MediaObjectResponse)
+async def complete_media_upload(
+    upload_id: str,
+    completion: Optional[schemas.MediaUploadComplete] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Conclui o upload: calcula o SHA-256 e armazena o arquivo (conteúdo repetido não é gravado de novo)."""
+    try:
+        stored, created = await media.complete_upload(db, upload_id, completion.sha256 if completion else None)
+    except media.MediaError as e:
+        raise _media_error(e)
+    return {
+        "sha256": stored.sha256, "size": stored.size, "content_type": stored.content_type,
+        "url": media.media_url(stored.sha256), "deduplicated": not created,
+    }
+
+@app.get("/media/{sha256}/url", response_model=schemas.MediaSignedUrl)
+async def read_media_signed_url(
+    sha256: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Link assinado e temporário (MEDIA_URL_TTL) para baixar um arquivo sem o cabeçalho
+    Authorization, ex: em tags <img>/<audio>. Vale só para este arquivo e não revela o token.
+    """
+    if not media.SHA256_RE.match(sha256) or await db.get(models.MediaObject, sha256) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mídia não encontrada")
+    url, expires_at = media.signed_url(sha256)
+    return {"url": url, "expires_at": expires_at}
+
+@app.get("/media/{sha256}")
+async def download_media(
+    sha256: str,
+    request: Request,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Download de um arquivo armazenado, com suporte a `Range` (206) para players de áudio/vídeo
+    e downloads retomados. Aceita o token no cabeçalho Authorization ou um link assinado
+    (`expires` + `signature`, de GET /media/{sha256}/url). O token de sessão não é aceito na
+    URL: iria parar em logs de acesso, proxies e cabeçalhos Referer.
+    """
+    token = authorization[7:] if authorization and authorization.lower().startswith("bearer ") else None
+    if not media.verify_signature(sha256, expires, signature) and _realtime_subject(token) is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não foi possível validar as credenciais",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        return await media.media_response(db, request, sha256)
+    except media.MediaError as e:
+        raise _media_error(e)
+
+@app.post("/conversations/{conversation_id}/attachments", response_model=schemas.ChatMessageResponse, status_code=status.HTTP_201_CREATED)
+async def create_attachment_message(
+    conversation_id: int,
+    attachment: schemas.AttachmentCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Envia na conversa uma mensagem de imagem/áudio/arquivo com uma mídia já armazenada."""
+    try:
+        return await media.attach_to_conversation(db, conversation_id, attachment.sha256, attachment.model_dump())
+    except media.MediaError as e:
+        raise _media_error(e)
+
+# --- Eventos em Tempo Real ---
+def _realtime_subject(token: Optional[str]) -> Optional[str]:
+    """Email do usuário do token JWT, ou None se o token for inválido."""
+    payload = auth.decode_token(token) if token else None
+    return payload.get("sub") if payload else None
+
+@app.websocket("/ws")
+async def websocket_events(websocket: WebSocket, topics: str, token: Optional[str] = None):
+    """
+    Canal WebSocket de eventos: `message.created` em `conversation:<id>`/`inbox` e
+    `appointment.created|updated|deleted` em `professional:<id>`.
+    O token JWT vai no parâmetro `token` (navegadores não enviam cabeçalhos no handshake).
+    """
+    if tenancy.TENANCY_ENABLED or _realtime_subject(token) is None:
+        await websocket.close(code=1008)
+        return
+    try:
+        topic_list = realtime.parse_topics(topics)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await realtime.serve_websocket(websocket, topic_list)
+
+@app.get("/events")
+async def sse_events(
+    request: Request,
+    topics: str,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Alternativa ao WebSocket via Server-Sent Events, com os mesmos tópicos.
+    Aceita o token no cabeçalho Authorization ou no parâmetro `token` (EventSource não envia cabeçalhos).
+    """
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if _realtime_subject(token) is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não foi possível validar as credenciais",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        topic_list = realtime.parse_topics(topics)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return StreamingResponse(
+        realtime.stream_sse(request, topic_list),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Agenda / Disponibilidade ---
+@app.get("/services/{service_id}/availability", response_model=List[schemas.ProfessionalAvailability])
+async def read_service_availability(
+    service_id: int,
+    start: Optional[date] = None,
+    days: int = Query(7, ge=1, le=31),
+    professional_id: Optional[int] = None,
+    step: int = Query(15, ge=5, le=240),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Horários livres para o serviço, por profissional que o realiza, a partir de `start` (padrão: hoje).
+    A grade é montada a partir do índice em memória da agenda.
+    """
+    result = await availability.compute_availability(
+        db, service_id, start or date.today(), days, professional_id=professional_id, step=step
+    )
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Serviço não encontrado")
+    return result
+
+@app.get("/professionals/{professional_id}/availability", response_model=schemas.ProfessionalAvailability)
+async def read_professional_availability(
+    professional_id: int,
+    service_id: int,
+    start: Optional[date] = None,
+    days: int = Query(7, ge=1, le=31),
+    step: int = Query(15, ge=5, le=240),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Horários livres de um profissional para um serviço que ele realiza."""
+    result = await availability.compute_availability(
+        db, service_id, start or date.today(), days, professional_id=professional_id, step=step
+    )
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Serviço não encontrado")
+    if not result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profissional não realiza este serviço")
+    return result[0]
+
+# --- Anamnese ---
+@app.post("/anamnesis/search", response_model=List[schemas.AnamnesisSearchResult])
+async def search_anamnesis_records(
+    search: schemas.AnamnesisSearchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Fichas de anamnese cujas respostas satisfazem todos os filtros
+    (ex: `{"key": "alergia", "op": "eq", "value": "Sim"}`). Só aceita campos marcados como
+    `indexed`; a busca usa o índice de respostas, sem ler o JSON das fichas.
+    Paginação por `after_id`.
+    """
+    try:
+        return await anamnesis_index.search_records(
+            db, [f.model_dump() for f in search.filters], limit=search.limit, after_id=search.after_id
+        )
+    except anamnesis_index.AnamnesisFilterError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+# --- Segmentação de Clientes ---
+@app.post("/segments/query", response_model=schemas.SegmentResult)
+async def query_segment(
+    segment: schemas.SegmentRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Clientes que satisfazem uma expressão booleana de tags (`and`, `or`, `not`; tags por id ou nome).
+    Avaliada sobre bitmaps em memória, um por tag: o total sai na hora e os ids vêm paginados
+    por `after_id`, em ordem crescente (ex: para disparar campanhas em lotes).
+    """
+    try:
+        return await segments.query(db, segment.expression, limit=segment.limit, after_id=segment.after_id)
+    except segments.SegmentExpressionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.post("/admin/segments/rebuild")
+async def rebuild_segments(
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: auth.Principal = Depends(auth.get_current_admin_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Reconstrói agora os bitmaps de segmentação a partir da tabela de associação cliente-tag."""
+    async with segments.segment_index.build_lock:
+        await segments.segment_index.rebuild(db)
+    return segments.segment_index.stats()
+
+# --- Dados de Referência ---
+@app.get("/reference/{name}")
+async def read_reference(
+    name: str,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_tenant_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Dados de referência usados em quase todas as telas: `anamnesis-fields`, `tags`, `services`,
+    `professionals` ou `clinic-info`. Servidos de um cache em memória, já serializados, com ETag
+    derivado da versão: o cliente envia `If-None-Match` e recebe 304 enquanto nada mudar.
+    """
+    if name not in reference_cache.REFERENCES:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dados de referência não encontrados")
+    entry = await reference_cache.get(db, name)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if reference_cache.etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+# --- Oportunidades (CRM) ---
+@app.get("/opportunities/pipeline", response_model=schemas.PipelineSummary)
+async def read_pipeline_summary(
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Quantidade e valor total das oportunidades por estágio (geral ou das criadas em `month`, AAAA-MM).
+    Lê o resumo mantido incrementalmente: custo proporcional ao número de estágios.
+    """
+    return await pipeline.pipeline_summary(db, period=month)
+
+@app.get("/admin/pipeline/check")
+def check_pipeline_summary(
+    db: Session = Depends(get_db),
+    current_admin: auth.Principal = Depends(auth.get_current_admin_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Compara o resumo do funil com um GROUP BY completo e lista as divergências."""
+    problems = pipeline.check(db)
+    return {"consistent": not problems, "problems": problems}
+
+# --- Dashboard ---
+@app.get("/dashboard/revenue", response_model=schemas.RevenueReport)
+async def read_revenue_report(
+    start: date,
+    end: date,
+    group: str = Query("day", pattern="^(day|month|professional|service)$"),
+    professional_id: Optional[int] = None,
+    service_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Faturamento (atendimentos concluídos) e ocupação (minutos reservados) entre `start` e `end`,
+    por dia, mês, profissional ou serviço. Lê o resumo diário mantido incrementalmente:
+    um ano inteiro agrupado por dia ou mês são no máximo 366 linhas.
+    """
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="`end` deve ser maior ou igual a `start`")
+    return await revenue.revenue_report(
+        db, start, end, group=group, professional_id=professional_id, service_id=service_id
+    )
+
+@app.get("/admin/revenue/check")
+def check_revenue_summary(
+    db: Session = Depends(get_db),
+    current_admin: auth.Principal = Depends(auth.get_current_admin_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """Compara o resumo de faturamento com o JOIN completo de agendamentos e serviços."""
+    problems = revenue.check(db)
+    return {"consistent": not problems, "problems": problems}
+
+# --- Exportações ---
+@app.get("/exports/{entity}")
+def export_entity(
+    entity: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_admin: auth.Principal = Depends(auth.get_current_admin_user),
+    single_tenant: None = Depends(single_tenant_only),
+):
+    """
+    Exportação completa de `customers`, `appointments` ou `anamnesis_records` em NDJSON ou CSV.
+    O corpo é enviado em streaming, lote a lote, com memória constante.
+    """
+    if entity not in exports.EXPORTS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Exportação não encontrada")
+    return StreamingResponse(
+        exports.stream_export(entity, format),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'},
+    )
+
+# --- Métricas Internas ---
+# Dados do worker inteiro: com várias clínicas no mesmo processo, só o operador (METRICS_TOKEN) vê
+@app.get("/admin/metrics/auth-cache")
+async def read_auth_cache_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Contadores de hit/miss do cache de usuários autenticados."""
+    return auth.principal_cache.stats()
+
+@app.get("/admin/metrics/routes")
+async def read_route_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Latência (p50/p95/p99, em segundos) e média de consultas/tempo de banco por rota."""
+    return instrumentation.route_metrics.summary()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Métricas deste worker no formato de texto do Prometheus.
+    Protegida por `METRICS_TOKEN` (Bearer) quando a variável estiver definida.
+    """
+    if instrumentation.METRICS_TOKEN and authorization != f"Bearer {instrumentation.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de métricas inválido")
+    return PlainTextResponse(instrumentation.route_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/metrics/db-pool")
+async def read_db_pool_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """
+    Estado dos pools de conexão (síncrono e assíncrono) deste worker: conexões em uso,
+    overflow, checkouts aguardando e histograma da espera por conexão.
+    """
+    return {
+        "sync": pool_metrics.pool_snapshot(engine),
+        "async": pool_metrics.pool_snapshot(async_engine.sync_engine),
+    }
+
+@app.get("/admin/metrics/replicas")
+async def read_replica_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Estado das réplicas de leitura e contagem de leituras roteadas para réplicas/primário."""
+    return replicas.router.stats()
+
+@app.get("/admin/metrics/segments")
+async def read_segment_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Tamanho e idade dos bitmaps de segmentação por tags."""
+    return segments.segment_index.stats()
+
+@app.get("/admin/metrics/tenants")
+async def read_tenant_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Motores das clínicas abertos neste worker, sessões em uso e evicções."""
+    return {"enabled": tenancy.TENANCY_ENABLED, **tenancy.registry.stats()}
+
+@app.get("/admin/metrics/realtime")
+async def read_realtime_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Clientes conectados e contadores do canal em tempo real."""
+    return realtime.broker.stats()
+
+@app.get("/admin/metrics/ingestion")
+async def read_ingestion_metrics(operator: Optional[auth.Principal] = Depends(auth.get_current_operator)):
+    """Tamanho da fila e contadores da ingestão de mensagens."""
+    return ingestion.message_ingestor.stats()
+
 # --- Rotas de Saúde da Aplicação (Mantidas no final para organização) ---
 @app.get("/", response_model=schemas.MessageResponse)
 async def read_root():
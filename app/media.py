@@ -0,0 +1,401 @@
+# app/media.py
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .auth import SECRET_KEY
+from .database import SessionLocal, insert_ignore_statement
+
+# --- Configurações do Armazenamento de Mídia ---
+# Arquivos de chat (imagens, áudios, documentos) ficam em disco local, endereçados pelo
+# SHA-256 do conteúdo: objects/ab/abcdef... (o mesmo arquivo enviado duas vezes é gravado uma vez)
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "./media")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(1024 * 1024 * 1024))) # 1 GiB por arquivo
+# Tamanho dos blocos gravados/lidos no disco (fora do event loop)
+MEDIA_IO_CHUNK = int(os.getenv("MEDIA_IO_CHUNK", str(1024 * 1024)))
+# Uploads não concluídos há mais que isso são removidos por `python -m app.media cleanup`
+MEDIA_UPLOAD_TTL_HOURS = float(os.getenv("MEDIA_UPLOAD_TTL_HOURS", "24"))
+# Validade dos links assinados de download (segundos). Tags <img>/<audio> não enviam o
+# cabeçalho Authorization: usam um link desses em vez do token de sessão na URL.
+MEDIA_URL_TTL = int(os.getenv("MEDIA_URL_TTL", "3600"))
+# Chave própria dos links, derivada da SECRET_KEY: um link vazado não serve como token de sessão
+MEDIA_URL_KEY = hashlib.sha256(f"media-url:{SECRET_KEY}".encode()).digest()
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Tipos servidos inline (o navegador exibe/toca). O content_type vem de quem enviou o arquivo:
+# qualquer outro (HTML, SVG, PDF...) vai como anexo binário, para não executar na origem da API
+INLINE_TYPE_RE = re.compile(r"^(image|audio|video)/[a-z0-9.+-]+$")
+INLINE_TYPE_BLOCKLIST = {"image/svg+xml"} # SVG pode conter <script>
+
+objects = models.MediaObject.__table__
+
+
+class MediaError(ValueError):
+    """Requisição de mídia inválida; `status_code` indica a resposta HTTP."""
+
+    def __init__(self, message: str, status_code: int = 400, received: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.received = received
+
+
+def object_path(sha256: str) -> str:
+    return os.path.join(MEDIA_ROOT, "objects", sha256[:2], sha256)
+
+
+def upload_path(upload_id: str) -> str:
+    return os.path.join(MEDIA_ROOT, "uploads", f"{upload_id}.part")
+
+
+def media_url(sha256: str) -> str:
+    return f"/media/{sha256}"
+
+
+# --- Links Assinados ---
+def _signature(sha256: str, expires: int) -> str:
+    return hmac.new(MEDIA_URL_KEY, f"{sha256}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def signed_url(sha256: str, ttl: int = MEDIA_URL_TTL) -> Tuple[str, datetime]:
+    """Link de download de um único objeto, válido por `ttl` segundos. Devolve (url, expira_em)."""
+    expires = int(time.time()) + ttl
+    return f"{media_url(sha256)}?expires={expires}&signature={_signature(sha256, expires)}", datetime.fromtimestamp(expires)
+
+
+def verify_signature(sha256: str, expires: Optional[int], signature: Optional[str]) -> bool:
+    if expires is None or not signature or expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(sha256, expires), signature)
+
+
+def human_size(size: int) -> str:
+    """Tamanho no formato de `MessageContent.size` (ex: "2.3 MB")."""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def message_type_for(content_type: Optional[str]) -> str:
+    if content_type and content_type.startswith("image/"):
+        return "image"
+    if content_type and content_type.startswith("audio/"):
+        return "audio"
+    return "file"
+
+
+# --- Upload em Partes (retomável) ---
+# Um upload aceita partes em sequência: cada PUT informa o `offset` onde começa, que precisa
+# ser igual ao que já foi recebido. Se a conexão cair, o cliente consulta `received` e continua
+# dali. O corpo é lido em streaming e gravado em blocos de MEDIA_IO_CHUNK, sem juntar o arquivo na memória.
+# Um lock por upload em uso, com o número de requisições que o usam: removido quando a última
+# termina (com sucesso ou erro), para que uploads abandonados ou ids inventados não acumulem.
+_upload_locks: Dict[str, List] = {} # id -> [lock, usuários]
+
+
+async def create_upload(db: AsyncSession, filename: Optional[str], content_type: Optional[str], size: Optional[int]) -> models.MediaUpload:
+    if size is not None and size > MEDIA_MAX_BYTES:
+        raise MediaError(f"Arquivo maior que o limite de {MEDIA_MAX_BYTES} bytes", status_code=413)
+    upload = models.MediaUpload(
+        id=uuid.uuid4().hex, filename=filename, content_type=content_type, expected_size=size, received=0,
+    )
+    db.add(upload)
+    await db.commit()
+    return upload
+
+
+def _check_open(upload: Optional[models.MediaUpload]) -> models.MediaUpload:
+    if upload is None:
+        raise MediaError("Upload não encontrado", status_code=404)
+    if upload.sha256 is not None:
+        raise MediaError("Upload já concluído", status_code=409, received=upload.received)
+    return upload
+
+
+async def _get_open_upload(db: AsyncSession, upload_id: str) -> models.MediaUpload:
+    return _check_open(await db.get(models.MediaUpload, upload_id))
+
+
+@asynccontextmanager
+async def _locked_upload(db: AsyncSession, upload_id: str):
+    """Serializa as operações de um upload existente e ainda aberto; entrega o upload lido sob o lock."""
+    # Confere antes de criar o lock: ids inexistentes não chegam a entrar no dicionário
+    await _get_open_upload(db, upload_id)
+    await db.commit()
+    entry = _upload_locks.setdefault(upload_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            # Relido sob o lock: outra requisição pode ter gravado partes ou concluído o upload
+            yield await db.get(models.MediaUpload, upload_id, populate_existing=True)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and _upload_locks.get(upload_id) is entry:
+            del _upload_locks[upload_id]
+
+
+def _append(path: str, offset: int, blocks: list) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        if f.tell() != offset:
+            raise MediaError("`offset` diferente do recebido até agora", status_code=409, received=f.tell())
+        for block in blocks:
+            f.write(block)
+        return f.tell()
+
+
+async def write_part(db: AsyncSession, upload_id: str, offset: int, body: AsyncIterator[bytes]) -> models.MediaUpload:
+    """Acrescenta o corpo da requisição ao upload a partir de `offset`; devolve o upload com `received` atualizado."""
+    async with _locked_upload(db, upload_id) as upload:
+        _check_open(upload)
+        await db.commit() # Devolve a conexão ao pool durante a transferência, que pode levar minutos
+        path = upload_path(upload_id)
+        limit = min(MEDIA_MAX_BYTES, upload.expected_size if upload.expected_size is not None else MEDIA_MAX_BYTES)
+        position = await asyncio.to_thread(lambda: os.path.getsize(path) if os.path.exists(path) else 0)
+        if offset != position:
+            raise MediaError("`offset` diferente do recebido até agora", status_code=409, received=position)
+        pending, pending_size = [], 0
+        try:
+            async for chunk in body:
+                if not chunk:
+                    continue
+                if position + pending_size + len(chunk) > limit:
+                    raise MediaError("O upload passou do tamanho informado ou do limite", status_code=413, received=position)
+                pending.append(chunk)
+                pending_size += len(chunk)
+                if pending_size >= MEDIA_IO_CHUNK:
+                    position = await asyncio.to_thread(_append, path, position, pending)
+                    pending, pending_size = [], 0
+            if pending:
+                position = await asyncio.to_thread(_append, path, position, pending)
+        finally:
+            # Mesmo com a conexão interrompida, o que chegou ao disco conta para a retomada
+            upload.received = position
+            await db.commit()
+    return upload
+
+
+def _hash_file(path: str) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(MEDIA_IO_CHUNK), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def _store(path: str, sha256: str) -> bool:
+    """Move o arquivo para o endereço do conteúdo; False se o objeto já existia (duplicado)."""
+    target = object_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    return True
+
+
+async def complete_upload(db: AsyncSession, upload_id: str, expected_sha256: Optional[str] = None) -> Tuple[models.MediaObject, bool]:
+    """
+    Conclui o upload: calcula o SHA-256 (lendo o arquivo em blocos) e grava o objeto.
+    Devolve (objeto, criado); `criado` é False quando o mesmo conteúdo já estava armazenado.
+    """
+    async with _locked_upload(db, upload_id) as upload:
+        _check_open(upload)
+        await db.commit() # Idem durante o cálculo do hash
+        path = upload_path(upload_id)
+        if not os.path.exists(path):
+            raise MediaError("Nenhuma parte recebida", status_code=400, received=0)
+        sha256, size = await asyncio.to_thread(_hash_file, path)
+        if upload.expected_size is not None and size != upload.expected_size:
+            raise MediaError(f"Recebidos {size} de {upload.expected_size} bytes", status_code=409, received=size)
+        if expected_sha256 is not None and expected_sha256.lower() != sha256:
+            await asyncio.to_thread(os.remove, path)
+            upload.received = 0
+            await db.commit()
+            raise MediaError("O SHA-256 do conteúdo não confere; envie o arquivo novamente", status_code=400, received=0)
+        created = await asyncio.to_thread(_store, path, sha256)
+        connection = await db.connection()
+        await connection.execute(
+            insert_ignore_statement(connection.dialect.name, objects, ["sha256"]),
+            [{"sha256": sha256, "size": size, "content_type": upload.content_type, "created_at": datetime.now()}],
+        )
+        upload.sha256 = sha256
+        upload.received = size
+        await db.commit()
+    return await db.get(models.MediaObject, sha256), created
+
+
+# --- Download com Range ---
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (início, fim inclusive) de um cabeçalho `Range: bytes=...` com um único intervalo.
+    None: sem Range (ou com vários intervalos), responde o arquivo inteiro.
+    Intervalo fora do arquivo: MediaError 416.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # Sufixo: os últimos N bytes
+        length = int(last)
+        if length == 0:
+            raise MediaError("Intervalo inválido", status_code=416)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise MediaError("Intervalo inválido", status_code=416)
+    return start, end
+
+
+def _read_block(path: str, position: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(position)
+        return f.read(length)
+
+
+async def _iter_range(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    position = start
+    while position <= end:
+        block = await asyncio.to_thread(_read_block, path, position, min(MEDIA_IO_CHUNK, end - position + 1))
+        if not block:
+            break
+        position += len(block)
+        yield block
+
+
+def inline_type(content_type: Optional[str]) -> Optional[str]:
+    """O tipo, se puder ser servido inline (imagem, áudio ou vídeo); senão None (download como anexo)."""
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    if INLINE_TYPE_RE.match(media_type) and media_type not in INLINE_TYPE_BLOCKLIST:
+        return media_type
+    return None
+
+
+async def media_response(db: AsyncSession, request: Request, sha256: str) -> Response:
+    """Resposta de download: inteiro via FileResponse, intervalo via 206, 304 se o ETag confere."""
+    if not SHA256_RE.match(sha256):
+        raise MediaError("Mídia não encontrada", status_code=404)
+    media = await db.get(models.MediaObject, sha256)
+    path = object_path(sha256)
+    if media is None or not os.path.exists(path):
+        raise MediaError("Mídia não encontrada", status_code=404)
+    # Conteúdo imutável: o próprio hash é o ETag
+    headers = {
+        "ETag": f'"{sha256}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+    media_type = inline_type(media.content_type)
+    if media_type is None:
+        media_type = "application/octet-stream"
+        headers["Content-Disposition"] = "attachment"
+    if request.headers.get("if-none-match") in (f'"{sha256}"', sha256):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = parse_range(request.headers.get("range"), media.size)
+    except MediaError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{media.size}"})
+    if byte_range is None:
+        # FileResponse envia o arquivo em blocos, sem carregá-lo na memória
+        return FileResponse(path, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{media.size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(_iter_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+# --- Anexos de Mensagens ---
+async def attach_to_conversation(db: AsyncSession, conversation_id: int, sha256: str, attachment: dict) -> models.Message:
+    """Cria a mensagem de mídia (imagem/áudio/arquivo) na conversa, vinculada ao objeto armazenado."""
+    media = await db.get(models.MediaObject, sha256)
+    if media is None:
+        raise MediaError("Mídia não encontrada", status_code=404)
+    conversation = await db.get(models.Conversation, conversation_id)
+    if conversation is None:
+        raise MediaError("Conversa não encontrada", status_code=404)
+    content = {
+        "url": media_url(sha256),
+        "size": human_size(media.size),
+        "name": attachment.get("name"),
+        "caption": attachment.get("caption"),
+        "duration": attachment.get("duration"),
+    }
+    message = models.Message(
+        conversation_id=conversation_id,
+        sender=attachment.get("sender") or "clinic",
+        message_type=attachment.get("message_type") or message_type_for(media.content_type),
+        content={k: v for k, v in content.items() if v is not None},
+        timestamp=datetime.now(),
+    )
+    db.add(message)
+    await db.flush()
+    db.add(models.MessageAttachment(message_id=message.id, sha256=sha256))
+    if conversation.last_message_at is None or conversation.last_message_at < message.timestamp:
+        conversation.last_message_at = message.timestamp
+    if message.sender == "customer":
+        conversation.unread_count = (conversation.unread_count or 0) + 1
+    await db.commit()
+    return message
+
+
+# --- Limpeza ---
+def cleanup(db, older_than_hours: float = MEDIA_UPLOAD_TTL_HOURS) -> int:
+    """Remove uploads não concluídos e sem atividade há mais de `older_than_hours` (linhas e partes)."""
+    limit = datetime.now() - timedelta(hours=older_than_hours)
+    upload = models.MediaUpload
+    stale = db.execute(
+        select(upload.id).where(upload.sha256.is_(None), upload.updated_at < limit)
+    ).scalars().all()
+    for upload_id in stale:
+        _upload_locks.pop(upload_id, None)
+        path = upload_path(upload_id)
+        if os.path.exists(path):
+            os.remove(path)
+    if stale:
+        db.execute(delete(upload).where(upload.id.in_(stale)))
+        db.commit()
+    return len(stale)
+
+
+# Uso: python -m app.media cleanup [--hours N]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do armazenamento de mídia.")
+    parser.add_argument("command", choices=["cleanup"])
+    parser.add_argument("--hours", type=float, default=MEDIA_UPLOAD_TTL_HOURS)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        removed = cleanup(db, args.hours)
+    finally:
+        db.close()
+    print(f"{removed} upload(s) abandonado(s) removido(s) em {time.perf_counter() - started:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
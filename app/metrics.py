@@ -0,0 +1,57 @@
+# app/metrics.py
+
+import bisect
+import threading
+from typing import Dict, List, Sequence
+
+# Limites (em segundos) dos buckets de latência, no estilo do Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Histograma cumulativo de buckets fixos, thread-safe e sem dependências externas.
+    `observe` custa uma busca binária e um incremento sob lock.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # Último: acima do maior limite (+Inf)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        """Contagem, soma, buckets cumulativos ({limite: n}) e percentis aproximados pelo limite superior do bucket."""
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, n in zip(list(self.buckets) + [float("inf")], counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else repr(bound)] = running
+        return {
+            "count": count,
+            "sum": total,
+            "buckets": cumulative,
+            "p50": self._percentile(counts, count, 0.50),
+            "p95": self._percentile(counts, count, 0.95),
+            "p99": self._percentile(counts, count, 0.99),
+        }
+
+    def _percentile(self, counts: List[int], count: int, q: float):
+        if not count:
+            return None
+        target, running = q * count, 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            if running >= target:
+                return bound
+        return None # Acima do maior limite
@@ -1,6 +1,6 @@
 # app/models.py
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Date, Time, Text, ForeignKey, Table, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Boolean, Date, Time, Text, ForeignKey, Table, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -51,6 +51,17 @@ class Customer(Base):
     conversations = relationship("Conversation", back_populates="customer")
 
 
+class CustomerSearchToken(Base):
+    """
+    Índice de busca de clientes: um token normalizado (sem acentos, minúsculo) por linha.
+    Prefixos de nome ("n:"), email ("e:") e telefone só com dígitos ("p:"), além das
+    palavras completas do nome ("x:") para ranqueamento. Mantido em app/customer_search.py.
+    """
+    __tablename__ = "customer_search_tokens"
+    token = Column(String(64), primary_key=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True, index=True)
+
+
 class Professional(Base):
     __tablename__ = "professionals"
     id = Column(Integer, primary_key=True, index=True)
@@ -92,6 +103,11 @@ class Appointment(Base):
     professional = relationship("Professional", back_populates="appointments")
     anamnesis_record = relationship("AnamnesisRecord", back_populates="appointment", uselist=False)
 
+    __table_args__ = (
+        # Consulta da agenda: todos os agendamentos de um profissional num intervalo de dias
+        Index("ix_appointments_professional_date", "professional_id", "date"),
+    )
+
 
 class AnamnesisTemplateField(Base):
     __tablename__ = "anamnesis_template_fields"
@@ -101,6 +117,7 @@ class AnamnesisTemplateField(Base):
     field_type = Column(String(50), nullable=False) # Ex: 'text', 'textarea', 'radio', 'select'
     options = Column(JSON) # Para radio/select, armazena as opções como JSON (ex: ["Sim", "Não"])
     order = Column(Integer, default=0) # Ordem de exibição do campo
+    indexed = Column(Boolean, default=False, nullable=False) # Respostas copiadas para anamnesis_answer_index (filtráveis)
 
 class AnamnesisRecord(Base):
     __tablename__ = "anamnesis_records"
@@ -113,6 +130,26 @@ class AnamnesisRecord(Base):
     appointment = relationship("Appointment", back_populates="anamnesis_record")
     customer = relationship("Customer", back_populates="anamnesis_records")
 
+class AnamnesisAnswerIndex(Base):
+    """
+    Índice (EAV) das respostas de anamnese dos campos marcados como `indexed`.
+    Uma linha por valor respondido: texto normalizado (sem acentos, minúsculo) e,
+    quando a resposta é numérica, também o número. Mantido em app/anamnesis_index.py.
+    """
+    __tablename__ = "anamnesis_answer_index"
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, ForeignKey("anamnesis_records.id"), nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    field_key = Column(String(255), nullable=False)
+    value_text = Column(String(255))
+    value_number = Column(Float)
+
+    __table_args__ = (
+        Index("ix_anamnesis_answer_key_text", "field_key", "value_text"),
+        Index("ix_anamnesis_answer_key_number", "field_key", "value_number"),
+        Index("ix_anamnesis_answer_record_key", "record_id", "field_key"),
+    )
+
 class Opportunity(Base):
     __tablename__ = "opportunities"
     id = Column(Integer, primary_key=True, index=True)
@@ -125,6 +162,33 @@ class Opportunity(Base):
 
     customer = relationship("Customer", back_populates="opportunities")
 
+class OpportunityStageRollup(Base):
+    """
+    Resumo do funil de vendas: quantidade e soma de `value` por estágio.
+    `period` é o mês de criação ("AAAA-MM") ou "all" para o total geral.
+    Mantido na mesma transação que grava a Opportunity (ver app/pipeline.py).
+    """
+    __tablename__ = "opportunity_stage_rollups"
+    stage = Column(String(50), primary_key=True)
+    period = Column(String(7), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+class AppointmentDailyRollup(Base):
+    """
+    Resumo diário da agenda por profissional e serviço: agendamentos não cancelados,
+    minutos reservados (`Service.duration`), atendimentos concluídos e faturamento (`Service.price`).
+    Mantido na mesma transação que grava o Appointment (ver app/revenue.py).
+    """
+    __tablename__ = "appointment_daily_rollups"
+    day = Column(Date, primary_key=True)
+    professional_id = Column(Integer, primary_key=True)
+    service_id = Column(Integer, primary_key=True)
+    booked_count = Column(Integer, nullable=False, default=0)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
 class SystemTag(Base):
     __tablename__ = "system_tags"
     id = Column(Integer, primary_key=True, index=True)
@@ -141,7 +205,14 @@ class Conversation(Base):
     unread_count = Column(Integer, default=0) # Contagem de mensagens não lidas pela clínica
 
     customer = relationship("Customer", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation")
+    # write_only: o histórico pode ter anos de mensagens, então nunca é carregado inteiro.
+    # Para ler, use a paginação por cursor em app/conversations.py.
+    messages = relationship("Message", back_populates="conversation", lazy="write_only")
+
+    __table_args__ = (
+        # Caixa de entrada: conversas por atividade recente, paginadas pelo cursor (last_message_at, id)
+        Index("ix_conversations_last_message", "last_message_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -151,9 +222,43 @@ class Message(Base):
     message_type = Column(String(50), default="text") # Ex: "text", "image", "audio", "file"
     content = Column(JSON, nullable=False) # Conteúdo da mensagem (texto, URL da imagem, etc.)
     timestamp = Column(DateTime, default=func.now())
+    # Chave enviada pelo provedor de chat; entregas repetidas da mesma mensagem são descartadas.
+    # Mensagens ingeridas sem chave recebem uma gerada ("ingest:<uuid>", ver app/ingestion.py)
+    idempotency_key = Column(String(100), unique=True)
 
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        # Paginação por cursor (timestamp, id) dentro de uma conversa, e "última mensagem" da caixa de entrada
+        Index("ix_messages_conversation_timestamp_id", "conversation_id", "timestamp", "id"),
+    )
+
+class MediaObject(Base):
+    """Arquivo do armazenamento local de mídia, endereçado pelo SHA-256 do conteúdo (ver app/media.py)."""
+    __tablename__ = "media_objects"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(255))
+    created_at = Column(DateTime, default=func.now())
+
+class MediaUpload(Base):
+    """Upload em partes em andamento (retomável a partir de `received`) ou concluído (`sha256`)."""
+    __tablename__ = "media_uploads"
+    id = Column(String(32), primary_key=True)
+    filename = Column(String(255))
+    content_type = Column(String(255))
+    expected_size = Column(BigInteger) # Informado pelo cliente; opcional
+    received = Column(BigInteger, nullable=False, default=0)
+    sha256 = Column(String(64)) # Preenchido ao concluir
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class MessageAttachment(Base):
+    """Vínculo entre uma mensagem de mídia e o arquivo armazenado."""
+    __tablename__ = "message_attachments"
+    message_id = Column(Integer, ForeignKey("messages.id"), primary_key=True)
+    sha256 = Column(String(64), ForeignKey("media_objects.sha256"), primary_key=True)
+
 class ClinicInfo(Base):
     __tablename__ = "clinic_info"
     id = Column(Integer, primary_key=True, index=True) # Geralmente terá apenas uma linha (id=1)
@@ -161,3 +266,20 @@ class ClinicInfo(Base):
     phone = Column(String(50))
     address = Column(String(255))
     working_hours = Column(String(255))
+
+class ReferenceVersion(Base):
+    """
+    Versão de cada conjunto de dados de referência (serviços, tags, etc.).
+    Incrementada na mesma transação de qualquer escrita nessas tabelas; usada como ETag
+    e para invalidar os caches em memória de todos os workers (ver app/reference_cache.py).
+    """
+    __tablename__ = "reference_versions"
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class SchemaInfo(Base):
+    """Versão do esquema aplicada pelo bootstrap (`python -m app.init_db`). Uma única linha (id=1)."""
+    __tablename__ = "schema_info"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -0,0 +1,194 @@
+# app/pipeline.py
+
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, upsert_statement
+
+# Ordem das colunas do quadro do CRM; estágios desconhecidos aparecem no final
+STAGES = ["Lead", "Follow Up", "Proposta", "Negociação", "Fechado", "Perdido"]
+DEFAULT_STAGE = models.Opportunity.__table__.c.stage.default.arg
+ALL_PERIODS = "all"
+# Tolerância da verificação de consistência para somas em ponto flutuante
+VALUE_TOLERANCE = 0.005
+
+rollups = models.OpportunityStageRollup.__table__
+
+
+def period_of(moment: Optional[datetime]) -> str:
+    return (moment or datetime.now()).strftime("%Y-%m")
+
+
+# --- Manutenção Incremental ---
+# stage e value precisam do valor anterior mesmo quando o objeto estava expirado:
+# active_history faz o SQLAlchemy carregá-lo antes da alteração.
+def _keep_history(target, value, oldvalue, initiator):
+    return value
+
+event.listen(models.Opportunity.stage, "set", _keep_history, retval=True, active_history=True)
+event.listen(models.Opportunity.value, "set", _keep_history, retval=True, active_history=True)
+
+
+def _old_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), key)
+
+
+def _add(deltas, stage, moment, count, value):
+    for period in (ALL_PERIODS, period_of(moment)):
+        entry = deltas.setdefault((stage, period), [0, 0.0])
+        entry[0] += count
+        entry[1] += value
+
+
+@event.listens_for(Session, "before_flush")
+def _track_opportunities(session, flush_context, instances):
+    deltas: Dict[Tuple[str, str], list] = {}
+    for obj in session.new:
+        if isinstance(obj, models.Opportunity):
+            # Fixa os defaults no Python para que o resumo use exatamente o que será gravado
+            if obj.created_at is None:
+                obj.created_at = datetime.now()
+            if obj.stage is None:
+                obj.stage = DEFAULT_STAGE
+            _add(deltas, obj.stage, obj.created_at, 1, obj.value or 0.0)
+    for obj in session.deleted:
+        if isinstance(obj, models.Opportunity):
+            state = inspect(obj)
+            _add(deltas, _old_value(state, "stage"), obj.created_at, -1, -(_old_value(state, "value") or 0.0))
+    for obj in session.dirty:
+        if isinstance(obj, models.Opportunity):
+            state = inspect(obj)
+            if not (state.attrs.stage.history.has_changes() or state.attrs.value.history.has_changes()):
+                continue
+            _add(deltas, _old_value(state, "stage"), obj.created_at, -1, -(_old_value(state, "value") or 0.0))
+            _add(deltas, obj.stage, obj.created_at, 1, obj.value or 0.0)
+
+    rows = [
+        {"stage": stage, "period": period, "count": count, "total_value": value}
+        for (stage, period), (count, value) in deltas.items()
+        if count or value
+    ]
+    if rows:
+        connection = session.connection()
+        stmt = upsert_statement(
+            connection.dialect.name, rollups, ["stage", "period"],
+            increment_columns=["count", "total_value"],
+        )
+        connection.execute(stmt, rows)
+
+
+# --- Leitura ---
+def _stage_order(stage: str):
+    return (STAGES.index(stage), "") if stage in STAGES else (len(STAGES), stage)
+
+
+async def pipeline_summary(db: AsyncSession, period: Optional[str] = None) -> dict:
+    """Resumo do funil (por estágio) lendo apenas as linhas do período no rollup."""
+    period = period or ALL_PERIODS
+    result = await db.execute(
+        select(rollups.c.stage, rollups.c.count, rollups.c.total_value).where(rollups.c.period == period)
+    )
+    stages = {stage: {"stage": stage, "count": 0, "total_value": 0.0} for stage in STAGES}
+    for stage, count, total_value in result.all():
+        if count or stage in stages:
+            stages[stage] = {"stage": stage, "count": count, "total_value": round(total_value, 2)}
+    ordered = sorted(stages.values(), key=lambda s: _stage_order(s["stage"]))
+    return {
+        "period": period,
+        "stages": ordered,
+        "total_count": sum(s["count"] for s in ordered),
+        "total_value": round(sum(s["total_value"] for s in ordered), 2),
+    }
+
+
+# --- Reconstrução e Verificação ---
+def _month_expression(dialect_name: str):
+    created_at = models.Opportunity.created_at
+    if dialect_name == "sqlite":
+        return func.strftime("%Y-%m", created_at)
+    if dialect_name == "postgresql":
+        return func.to_char(created_at, "YYYY-MM")
+    return func.date_format(created_at, "%Y-%m")
+
+
+def compute_from_source(db: Session) -> Dict[Tuple[str, str], Tuple[int, float]]:
+    """Recalcula o resumo a partir da tabela `opportunities` (GROUP BY completo)."""
+    opp = models.Opportunity
+    month = _month_expression(db.get_bind().dialect.name)
+    expected = {}
+    totals = select(opp.stage, func.count(), func.coalesce(func.sum(opp.value), 0.0)).group_by(opp.stage)
+    for stage, count, value in db.execute(totals):
+        expected[(stage, ALL_PERIODS)] = (count, float(value))
+    monthly = select(opp.stage, month, func.count(), func.coalesce(func.sum(opp.value), 0.0)).group_by(opp.stage, month)
+    for stage, period, count, value in db.execute(monthly):
+        expected[(stage, period)] = (count, float(value))
+    return expected
+
+
+def rebuild(db: Session) -> int:
+    """Apaga e recria o rollup inteiro numa única transação. Retorna o número de linhas gravadas."""
+    expected = compute_from_source(db)
+    db.execute(delete(rollups))
+    if expected:
+        db.execute(rollups.insert(), [
+            {"stage": stage, "period": period, "count": count, "total_value": value}
+            for (stage, period), (count, value) in expected.items()
+        ])
+    db.commit()
+    return len(expected)
+
+
+def check(db: Session) -> List[dict]:
+    """Compara o rollup com o GROUP BY completo. Retorna as divergências (lista vazia = consistente)."""
+    expected = compute_from_source(db)
+    stored = {
+        (stage, period): (count, value)
+        for stage, period, count, value in db.execute(
+            select(rollups.c.stage, rollups.c.period, rollups.c.count, rollups.c.total_value)
+        )
+    }
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        exp_count, exp_value = expected.get(key, (0, 0.0))
+        got_count, got_value = stored.get(key, (0, 0.0))
+        if exp_count != got_count or abs(exp_value - got_value) > VALUE_TOLERANCE:
+            problems.append({
+                "stage": key[0], "period": key[1],
+                "expected_count": exp_count, "stored_count": got_count,
+                "expected_value": exp_value, "stored_value": got_value,
+            })
+    return problems
+
+
+# Uso: python -m app.pipeline rebuild | check
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do resumo do funil de vendas.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Resumo do funil reconstruído: {rebuild(db)} linhas.")
+        else:
+            problems = check(db)
+            for problem in problems:
+                print(f"Divergência: {problem}")
+            print("Resumo do funil consistente." if not problems else f"{len(problems)} divergência(s) encontrada(s).")
+            raise SystemExit(1 if problems else 0)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# app/pool_metrics.py
+
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .metrics import Histogram
+
+# Buckets da espera por uma conexão: a maioria dos checkouts é instantânea, então
+# o interesse está nos casos em que o pool esgotou
+CHECKOUT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolStats:
+    """Contadores de um pool, alimentados pelos eventos do SQLAlchemy e pelo `_do_get` instrumentado."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkout_wait = Histogram(CHECKOUT_BUCKETS)
+        self.waiters = 0 # Checkouts aguardando uma conexão agora
+        self.max_waiters = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.pings = 0 # Pre-pings feitos (modo "idle")
+        self.ping_failures = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def wait_started(self):
+        with self._lock:
+            self.waiters += 1
+            self.max_waiters = max(self.max_waiters, self.waiters)
+
+    def wait_finished(self, elapsed: float, timed_out: bool):
+        with self._lock:
+            self.waiters -= 1
+            if timed_out:
+                self.timeouts += 1
+        if not timed_out:
+            self.checkout_wait.observe(elapsed)
+
+
+_stats: Dict[int, PoolStats] = {} # id(pool) -> estatísticas
+
+
+class _InstrumentedPoolMixin:
+    """Mede quanto cada checkout espera por uma conexão livre (inclui abrir uma nova, no overflow)."""
+
+    def _do_get(self):
+        stats = _stats.get(id(self))
+        if stats is None:
+            return super()._do_get()
+        stats.wait_started()
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            stats.wait_finished(time.perf_counter() - started, timed_out)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _ping(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    finally:
+        cursor.close()
+
+
+def instrument(engine, name: str, idle_ping_after: float = 0.0) -> PoolStats:
+    """
+    Registra os eventos de pool do `engine` e devolve suas estatísticas.
+    Com `idle_ping_after` > 0, valida no checkout só as conexões paradas há mais de N segundos
+    (em vez de um ping a cada checkout, como faz `pool_pre_ping`); uma conexão morta é
+    descartada e o pool tenta outra.
+    """
+    pool = engine.pool
+    stats = PoolStats(name)
+    _stats[id(pool)] = stats
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+        connection_record.info["returned_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+        returned_at = connection_record.info.get("returned_at")
+        if idle_ping_after > 0 and returned_at is not None and time.monotonic() - returned_at > idle_ping_after:
+            stats.pings += 1
+            try:
+                _ping(dbapi_connection)
+            except Exception as e:
+                stats.ping_failures += 1
+                raise exc.DisconnectionError(f"Conexão inativa não respondeu ao ping: {e}")
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info["returned_at"] = time.monotonic()
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
+
+    return stats
+
+
+def pool_snapshot(engine) -> dict:
+    """Estado atual do pool (tamanho, conexões em uso, overflow) mais os contadores coletados."""
+    pool = engine.pool
+    data = {"pool_class": type(pool).__name__, "status": pool.status()}
+    for attr in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, attr, None)
+        if callable(method):
+            data[attr] = method()
+    stats = _stats.get(id(pool))
+    if stats is not None:
+        data.update({
+            "name": stats.name,
+            "waiters": stats.waiters,
+            "max_waiters": stats.max_waiters,
+            "checkouts": stats.checkouts,
+            "connects": stats.connects,
+            "invalidations": stats.invalidations,
+            "idle_pings": stats.pings,
+            "idle_ping_failures": stats.ping_failures,
+            "checkout_timeouts": stats.timeouts,
+            "checkout_wait_seconds": stats.checkout_wait.snapshot(),
+        })
+    return data
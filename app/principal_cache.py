@@ -0,0 +1,143 @@
+# app/principal_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event, inspect
+
+from . import models
+
+# --- Configurações do Cache de Usuários Autenticados ---
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60")) # Segundos; 0 desliga o cache
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+
+class Principal:
+    """
+    Cópia leve do usuário autenticado, desacoplada da Session do SQLAlchemy.
+    Possui os mesmos atributos usados por `UserResponse` e pelas rotas protegidas.
+    """
+    __slots__ = ("id", "email", "name", "role")
+
+    def __init__(self, id: int, email: str, name: str, role: str):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, email=user.email, name=user.name, role=user.role)
+
+
+class PrincipalCache:
+    """
+    Cache LRU com TTL de usuários autenticados, indexado por (sub, jti) do token.
+    As leituras vêm de `get_current_user`, no event loop; a invalidação vem dos eventos
+    `after_update`/`after_delete` do ORM, que também disparam em rotas síncronas e sessões do
+    threadpool. Por isso o acesso é protegido por um lock.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # (sub, jti) -> (expira_em, Principal)
+        self._keys_by_subject = {} # sub -> conjunto de chaves, para invalidação
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str, token_id: Optional[str]) -> Optional[Principal]:
+        key = (subject, token_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def put(self, subject: str, token_id: Optional[str], principal: Principal, token_exp: Optional[float] = None):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        ttl = self.ttl
+        if token_exp is not None:
+            # Nunca mantém o usuário em cache além da validade do próprio token
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        key = (subject, token_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, principal)
+            self._entries.move_to_end(key)
+            self._keys_by_subject.setdefault(subject, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_subject(self, subject: str):
+        """Remove todas as entradas de um usuário (todas as sessões/tokens dele)."""
+        with self._lock:
+            for key in list(self._keys_by_subject.get(subject, ())):
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_subject.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        # Chamado sempre com o lock adquirido
+        self._entries.pop(key, None)
+        keys = self._keys_by_subject.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_subject[key[0]]
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL)
+
+
+# --- Ganchos de Invalidação ---
+def invalidate_user(email: str):
+    """Invalida explicitamente o cache de um usuário (ex: após trocar senha ou role)."""
+    principal_cache.invalidate_subject(email)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_on_update(mapper, connection, target):
+    # Se o email mudou, os tokens antigos usam o email anterior como `sub`
+    for email in inspect(target).attrs.email.history.deleted or ():
+        invalidate_user(email)
+    invalidate_user(target.email)
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    invalidate_user(target.email)
@@ -0,0 +1,59 @@
+# app/projections.py
+
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# Listagens grandes sem ORM nem Pydantic por linha: o SELECT traz só as colunas da resposta
+# como tuplas, os dicts são montados direto delas (dados do próprio banco, já confiáveis) e o
+# ORJSONResponse serializa o resultado. Os dicts têm exatamente os campos dos *Response
+# correspondentes, que continuam documentando o formato no OpenAPI.
+
+customers = models.Customer.__table__
+services = models.Service.__table__
+tags = models.SystemTag.__table__
+customer_tags = models.customer_tag_association
+
+CUSTOMER_FIELDS = ("id", "name", "email", "phone", "birthday", "notes", "created_at", "updated_at")
+SERVICE_FIELDS = ("id", "name", "duration", "price", "description")
+TAG_FIELDS = ("id", "name", "color")
+
+
+async def list_customers(db: AsyncSession, limit: int = 1000, after_id: Optional[int] = None) -> List[dict]:
+    """
+    Página de clientes (ordem de id, paginação por `after_id`) no formato de `CustomerResponse`.
+    Duas consultas por página: as colunas dos clientes e as tags de todos eles de uma vez.
+    """
+    query = select(*(customers.c[f] for f in CUSTOMER_FIELDS)).order_by(customers.c.id).limit(limit)
+    if after_id is not None:
+        query = query.where(customers.c.id > after_id)
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return []
+
+    items = [dict(zip(CUSTOMER_FIELDS, row)) for row in rows]
+    by_id: Dict[int, dict] = {}
+    for item in items:
+        item["tags"] = []
+        by_id[item["id"]] = item
+
+    tag_rows = await db.execute(
+        select(customer_tags.c.customer_id, *(tags.c[f] for f in TAG_FIELDS))
+        .join(tags, tags.c.id == customer_tags.c.tag_id)
+        .where(customer_tags.c.customer_id.between(rows[0][0], rows[-1][0]))
+        .order_by(customer_tags.c.customer_id, tags.c.name)
+    )
+    for customer_id, *tag in tag_rows:
+        item = by_id.get(customer_id)
+        if item is not None:
+            item["tags"].append(dict(zip(TAG_FIELDS, tag)))
+    return items
+
+
+async def list_services(db: AsyncSession) -> List[dict]:
+    """Todos os serviços, por nome, no formato de `ServiceResponse`."""
+    query = select(*(services.c[f] for f in SERVICE_FIELDS)).order_by(services.c.name)
+    return [dict(zip(SERVICE_FIELDS, row)) for row in (await db.execute(query)).all()]
@@ -0,0 +1,276 @@
+# app/realtime.py
+
+import asyncio
+import json
+import os
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from . import models
+from .events import on_commit
+
+# --- Configurações do Canal em Tempo Real ---
+# Eventos aguardando envio por cliente; um cliente lento que estoura o limite é desconectado
+REALTIME_CLIENT_BUFFER = int(os.getenv("REALTIME_CLIENT_BUFFER", "256"))
+REALTIME_MAX_TOPICS = int(os.getenv("REALTIME_MAX_TOPICS", "50"))
+# Intervalo dos heartbeats (SSE) e pings (WebSocket), em segundos
+REALTIME_HEARTBEAT = float(os.getenv("REALTIME_HEARTBEAT", "15"))
+
+# Tópicos: "conversation:<id>" (mensagens de uma conversa), "inbox" (mensagens de todas as
+# conversas) e "professional:<id>" (agenda de um profissional)
+TOPIC_RE = re.compile(r"^(conversation:\d+|professional:\d+|inbox)$")
+
+_CLOSE = object() # Sentinela colocada na fila de um assinante que deve ser encerrado
+
+
+class SubscriberClosed(Exception):
+    """O assinante foi descartado (consumidor lento ou shutdown)."""
+
+
+def parse_topics(raw: str) -> List[str]:
+    """Lista de tópicos separados por vírgula. Levanta ValueError se algum for inválido."""
+    topics = sorted({t.strip() for t in raw.split(",") if t.strip()})
+    if not topics:
+        raise ValueError("Informe ao menos um tópico")
+    if len(topics) > REALTIME_MAX_TOPICS:
+        raise ValueError(f"No máximo {REALTIME_MAX_TOPICS} tópicos por conexão")
+    invalid = [t for t in topics if not TOPIC_RE.match(t)]
+    if invalid:
+        raise ValueError(f"Tópicos inválidos: {', '.join(invalid)}")
+    return topics
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def encode_event(topic: str, event_type: str, data: dict) -> str:
+    return json.dumps({"topic": topic, "type": event_type, "data": data}, ensure_ascii=False, default=_json_default)
+
+
+class Subscriber:
+    """Uma conexão (WebSocket ou SSE) com sua fila de eventos limitada."""
+
+    def __init__(self, topics: Iterable[str], buffer: int):
+        self.topics = list(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+        self.dropped = False
+
+    def offer(self, event: str) -> bool:
+        """Enfileira um evento sem bloquear. Retorna False se o assinante estourou o buffer."""
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Consumidor lento: descarta o que estava pendente e pede o encerramento da conexão
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_CLOSE)
+            return False
+
+    async def next_event(self, timeout: float) -> Optional[str]:
+        """Próximo evento, ou None se nada chegou em `timeout` segundos. Levanta SubscriberClosed ao encerrar."""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _CLOSE:
+            raise SubscriberClosed
+        return event
+
+
+class Broker:
+    """
+    Interface de pub/sub usada pelo canal em tempo real.
+    A implementação padrão entrega apenas dentro deste processo; com vários workers,
+    uma implementação baseada em Redis/NATS/etc. republica os eventos recebidos
+    chamando `deliver` em cada worker.
+    """
+
+    def start(self):
+        """Chamado no startup, dentro do event loop."""
+
+    async def stop(self):
+        """Chamado no shutdown."""
+
+    def publish(self, topic: str, event_type: str, data: dict):
+        """Publica um evento. Pode ser chamado de qualquer thread."""
+        raise NotImplementedError
+
+    def subscribe(self, topics: Iterable[str]) -> Subscriber:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscriber: Subscriber):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InProcessBroker(Broker):
+    """
+    Fan-out em memória por tópico. Toda a entrega acontece no event loop:
+    publicações vindas do threadpool (rotas síncronas, callbacks pós-commit) são
+    repassadas com `call_soon_threadsafe`. Cada evento é serializado uma única vez.
+    """
+
+    def __init__(self, buffer: int):
+        self.buffer = buffer
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped_clients = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        for subscribers in list(self._topics.values()):
+            for subscriber in list(subscribers):
+                if not subscriber.dropped:
+                    subscriber.dropped = True
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(_CLOSE)
+        self._topics.clear()
+
+    def publish(self, topic: str, event_type: str, data: dict):
+        if self._loop is None or topic not in self._topics:
+            return
+        event = encode_event(topic, event_type, data)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self.deliver(topic, event)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.deliver, topic, event)
+
+    def deliver(self, topic: str, event: str):
+        """Entrega um evento já serializado aos assinantes locais do tópico (no event loop)."""
+        self.published += 1
+        for subscriber in list(self._topics.get(topic, ())):
+            if subscriber.offer(event):
+                self.delivered += 1
+            else:
+                self.dropped_clients += 1
+                self.unsubscribe(subscriber)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscriber:
+        subscriber = Subscriber(topics, self.buffer)
+        for topic in subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def stats(self) -> dict:
+        clients = set()
+        for subscribers in self._topics.values():
+            clients.update(subscribers)
+        return {
+            "clients": len(clients),
+            "topics": len(self._topics),
+            "client_buffer": self.buffer,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_clients": self.dropped_clients,
+        }
+
+
+broker: Broker = InProcessBroker(REALTIME_CLIENT_BUFFER)
+
+
+# --- Publicação ---
+def publish_message(row: dict):
+    """Publica uma mensagem gravada na conversa dela e na caixa de entrada."""
+    data = {k: row.get(k) for k in ("id", "conversation_id", "sender", "message_type", "content", "timestamp")}
+    broker.publish(f"conversation:{row['conversation_id']}", "message.created", data)
+    broker.publish("inbox", "message.created", data)
+
+@on_commit(models.Message)
+def _publish_messages(changes):
+    for change in changes:
+        if change.op == "insert":
+            publish_message(change.values)
+
+@on_commit(models.Appointment)
+def _publish_appointments(changes):
+    for change in changes:
+        values = change.values
+        event_type = f"appointment.{change.op}d" if change.op != "insert" else "appointment.created"
+        data = {k: values.get(k) for k in ("id", "customer_id", "service_id", "professional_id", "date", "start_time", "status")}
+        professionals = {values.get("professional_id"), change.previous.get("professional_id")}
+        # Reagendado para outro profissional: as duas agendas precisam saber
+        for professional_id in sorted(p for p in professionals if p is not None):
+            broker.publish(f"professional:{professional_id}", event_type, data)
+
+
+# --- Transporte ---
+async def serve_websocket(websocket: WebSocket, topics: List[str]):
+    """Envia os eventos dos tópicos até o cliente desconectar ou ficar para trás."""
+    await websocket.accept()
+    subscriber = broker.subscribe(topics)
+
+    async def drain_incoming():
+        # Mensagens do cliente são ignoradas; a leitura só serve para notar a desconexão
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    reader = asyncio.create_task(drain_incoming())
+    try:
+        while not reader.done():
+            try:
+                event = await subscriber.next_event(REALTIME_HEARTBEAT)
+            except SubscriberClosed:
+                await websocket.close(code=1013) # Try again later: cliente lento descartado
+                break
+            await websocket.send_text(event if event is not None else '{"type": "ping"}')
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader.cancel()
+        broker.unsubscribe(subscriber)
+
+
+async def stream_sse(request, topics: List[str]):
+    """Gerador de eventos no formato text/event-stream, com heartbeats para manter a conexão."""
+    subscriber = broker.subscribe(topics)
+    try:
+        yield ": conectado\n\n"
+        while True:
+            try:
+                event = await subscriber.next_event(REALTIME_HEARTBEAT)
+            except SubscriberClosed:
+                yield "event: dropped\ndata: {}\n\n"
+                break
+            if event is None:
+                if await request.is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+                continue
+            yield f"data: {event}\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
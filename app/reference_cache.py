@@ -0,0 +1,146 @@
+# app/reference_cache.py
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import TypeAdapter
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+
+from . import models, schemas
+from .database import upsert_statement
+from .events import on_commit
+
+# Intervalo em que uma entrada do cache é servida sem conferir a versão no banco.
+# Escritas feitas por este worker invalidam na hora; as de outros workers aparecem em até N segundos.
+REFERENCE_CACHE_RECHECK = float(os.getenv("REFERENCE_CACHE_RECHECK", "5"))
+
+versions = models.ReferenceVersion.__table__
+
+
+class Reference:
+    """Um conjunto de dados de referência: como consultar e como serializar."""
+
+    def __init__(self, name: str, query, schema, single: bool = False):
+        self.name = name
+        self.query = query
+        self.single = single # ClinicInfo: um único objeto (ou null) em vez de lista
+        self.adapter = TypeAdapter(Optional[schema] if single else List[schema])
+
+
+REFERENCES: Dict[str, Reference] = {
+    ref.name: ref for ref in (
+        Reference(
+            "anamnesis-fields",
+            select(models.AnamnesisTemplateField).order_by(models.AnamnesisTemplateField.order, models.AnamnesisTemplateField.id),
+            schemas.AnamnesisTemplateFieldResponse,
+        ),
+        Reference("tags", select(models.SystemTag).order_by(models.SystemTag.name), schemas.SystemTagResponse),
+        Reference("services", select(models.Service).order_by(models.Service.name), schemas.ServiceResponse),
+        Reference(
+            "professionals",
+            select(models.Professional).options(joinedload(models.Professional.user)).order_by(models.Professional.name),
+            schemas.ProfessionalResponse,
+        ),
+        Reference("clinic-info", select(models.ClinicInfo).order_by(models.ClinicInfo.id).limit(1), schemas.ClinicInfoResponse, single=True),
+    )
+}
+
+# Modelo -> referências afetadas por uma escrita nele
+AFFECTED_BY = {
+    models.AnamnesisTemplateField: ("anamnesis-fields",),
+    models.SystemTag: ("tags",),
+    models.Service: ("services",),
+    models.Professional: ("professionals",),
+    models.User: ("professionals",), # ProfessionalResponse inclui o usuário vinculado
+    models.ClinicInfo: ("clinic-info",),
+}
+
+
+class CacheEntry:
+    __slots__ = ("version", "body", "etag", "checked_at")
+
+    def __init__(self, version: int, body: bytes, etag: str):
+        self.version = version
+        self.body = body # JSON já serializado: um hit não passa pelo banco nem pelo Pydantic
+        self.etag = etag
+        self.checked_at = time.monotonic()
+
+
+_entries: Dict[tuple, CacheEntry] = {} # (clínica, nome) -> entrada; clínica None fora do modo multi-clínica
+
+
+# --- Versões ---
+def bump(connection, names: Iterable[str]):
+    """Incrementa a versão das referências `names` na transação corrente de `connection`."""
+    rows = [{"name": name, "version": 1} for name in sorted(set(names))]
+    if rows:
+        stmt = upsert_statement(connection.dialect.name, versions, ["name"], increment_columns=["version"])
+        connection.execute(stmt, rows)
+
+def invalidate(names: Iterable[str]):
+    """Descarta as entradas locais (o próximo acesso relê a versão e os dados)."""
+    names = set(names)
+    for key in [key for key in list(_entries) if key[1] in names]:
+        _entries.pop(key, None)
+
+
+def _affected(objects) -> set:
+    names = set()
+    for obj in objects:
+        names.update(AFFECTED_BY.get(type(obj), ()))
+    return names
+
+@event.listens_for(Session, "after_flush")
+def _bump_on_flush(session, flush_context):
+    # Mudanças só em coleções (ex: uma tag ganhou um cliente) não alteram a referência
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    names = _affected(session.new) | _affected(dirty) | _affected(session.deleted)
+    if names:
+        bump(session.connection(), names)
+
+@on_commit(*AFFECTED_BY)
+def _invalidate_on_commit(changes):
+    invalidate(name for change in changes for name in AFFECTED_BY[change.model])
+
+
+# --- Leitura ---
+async def _current_version(db: AsyncSession, name: str) -> int:
+    version = (await db.execute(select(versions.c.version).where(versions.c.name == name))).scalar()
+    return version or 0
+
+async def get(db: AsyncSession, name: str) -> CacheEntry:
+    """
+    Entrada do cache (corpo JSON + ETag) da referência `name`.
+    Hit recente: nenhuma consulta. Hit antigo: uma consulta (a versão). Miss: versão + dados.
+    """
+    key = (db.info.get("tenant"), name)
+    entry = _entries.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked_at < REFERENCE_CACHE_RECHECK:
+        return entry
+
+    # A versão é lida antes dos dados: se houver uma escrita no meio, o cache fica com
+    # uma versão antiga e se corrige na próxima conferência (nunca o contrário)
+    version = await _current_version(db, name)
+    if entry is not None and entry.version == version:
+        entry.checked_at = now
+        return entry
+
+    reference = REFERENCES[name]
+    rows = (await db.execute(reference.query)).unique().scalars().all()
+    data = (rows[0] if rows else None) if reference.single else rows
+    body = reference.adapter.dump_json(reference.adapter.validate_python(data, from_attributes=True))
+    entry = CacheEntry(version, body, f'"{name}-v{version}"')
+    _entries[key] = entry
+    return entry
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o cabeçalho If-None-Match (pode ter vários valores e prefixo W/) com o ETag."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
@@ -0,0 +1,218 @@
+# app/replicas.py
+
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from . import instrumentation, pool_metrics, tenancy
+from .database import AsyncSessionLocal, engine_kwargs, idle_ping_after, to_async_url
+
+# --- Configurações das Réplicas de Leitura ---
+# URLs separadas por vírgula (ex: "mysql+pymysql://...@replica1/estetica_io,..." ou, localmente,
+# "sqlite:///./replica.db"). Vazio: todas as leituras vão para o primário.
+REPLICA_DATABASE_URLS = [u.strip() for u in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if u.strip()]
+# Depois de uma escrita, o cliente lê do primário por N segundos (read-your-writes)
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+REPLICA_PIN_MAX_CLIENTS = int(os.getenv("REPLICA_PIN_MAX_CLIENTS", "100000"))
+# Uma réplica que falhou fica fora da rotação até passar numa verificação (a cada N segundos)
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "10"))
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class Replica:
+    __slots__ = ("name", "engine", "sessionmaker", "healthy", "failures", "checked_at")
+
+    def __init__(self, name: str, url: str):
+        async_url = to_async_url(url)
+        self.name = name
+        self.engine = create_async_engine(async_url, **engine_kwargs(async_url, is_async=True))
+        pool_metrics.instrument(self.engine.sync_engine, name, idle_ping_after=idle_ping_after())
+        instrumentation.instrument_engine(self.engine.sync_engine)
+        self.sessionmaker = async_sessionmaker(self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.failures = 0
+        self.checked_at = 0.0
+
+
+class PrimaryPins:
+    """Clientes que escreveram há pouco e devem ler do primário. LRU limitado, thread-safe."""
+
+    def __init__(self, seconds: float, max_clients: int):
+        self.seconds = seconds
+        self.max_clients = max_clients
+        self._until = OrderedDict() # chave do cliente -> instante (monotonic) em que o pin expira
+        self._lock = threading.Lock()
+
+    def pin(self, client: str):
+        with self._lock:
+            self._until[client] = time.monotonic() + self.seconds
+            self._until.move_to_end(client)
+            while len(self._until) > self.max_clients:
+                self._until.popitem(last=False)
+
+    def is_pinned(self, client: str) -> bool:
+        with self._lock:
+            until = self._until.get(client)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._until[client]
+                return False
+            return True
+
+
+class ReplicaRouter:
+    """
+    Escolhe a sessão de leitura: réplicas saudáveis em round-robin, ou o primário quando
+    não há réplica disponível ou o cliente está fixado nele após uma escrita.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(f"replica{i + 1}", url) for i, url in enumerate(urls)]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self.pins = PrimaryPins(REPLICA_PIN_SECONDS, REPLICA_PIN_MAX_CLIENTS)
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    def _candidates(self) -> List[Replica]:
+        now = time.monotonic()
+        candidates = []
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            # Réplica fora do ar: ganha uma nova chance depois do intervalo de verificação
+            if replica.healthy or now - replica.checked_at >= REPLICA_HEALTH_INTERVAL:
+                candidates.append(replica)
+        return candidates
+
+    async def open_session(self, client: Optional[str]) -> AsyncSession:
+        """Sessão de leitura já conectada (a falha de uma réplica aparece aqui, não na rota)."""
+        if self.replicas and not (client and self.pins.is_pinned(client)):
+            for replica in self._candidates():
+                session = replica.sessionmaker()
+                try:
+                    await session.connection()
+                except Exception as e:
+                    await session.close()
+                    self.mark_down(replica, e)
+                    continue
+                if not replica.healthy:
+                    print(f"Réplica {replica.name} voltou a responder.")
+                replica.healthy = True
+                self.replica_reads += 1
+                return session
+            self.fallbacks += 1
+        self.primary_reads += 1
+        return AsyncSessionLocal()
+
+    def mark_down(self, replica: Replica, error: Exception):
+        if replica.healthy:
+            print(f"Réplica {replica.name} fora de rotação: {error}")
+        replica.healthy = False
+        replica.failures += 1
+        replica.checked_at = time.monotonic()
+
+    async def check_health(self):
+        """Verifica (SELECT 1) as réplicas fora de rotação; chamado periodicamente."""
+        for replica in self.replicas:
+            if replica.healthy:
+                continue
+            try:
+                async with replica.engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except Exception:
+                replica.checked_at = time.monotonic()
+                continue
+            replica.healthy = True
+            print(f"Réplica {replica.name} voltou a responder.")
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {"name": r.name, "healthy": r.healthy, "failures": r.failures, "pool": pool_metrics.pool_snapshot(r.engine.sync_engine)}
+                for r in self.replicas
+            ],
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "pin_seconds": REPLICA_PIN_SECONDS,
+        }
+
+
+router = ReplicaRouter(REPLICA_DATABASE_URLS)
+
+
+def client_key(headers: dict, client_host: Optional[str]) -> Optional[str]:
+    """Identifica o cliente pelo token (hash do cabeçalho Authorization) ou, sem token, pelo IP."""
+    authorization = headers.get("authorization")
+    if authorization:
+        return hashlib.sha1(authorization.encode("latin-1", "ignore")).hexdigest()
+    return client_host
+
+
+async def get_read_db(request: Request):
+    """
+    Variante de `get_async_db` para rotas somente leitura: GET/HEAD vão para uma réplica,
+    exceto logo após uma escrita do mesmo cliente; qualquer outro método usa o primário.
+    No modo multi-clínica, usa o banco da clínica (réplicas por clínica não são suportadas).
+    """
+    if tenancy.TENANCY_ENABLED:
+        async for db in tenancy.get_tenant_db(request):
+            yield db
+        return
+    if request.method in SAFE_METHODS:
+        client = client_key(request.headers, request.client.host if request.client else None)
+        db = await router.open_session(client)
+    else:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def health_loop():
+    """Tarefa de fundo: reintegra réplicas que voltaram a responder."""
+    while True:
+        await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+        try:
+            await router.check_health()
+        except Exception as e:
+            print(f"Erro na verificação das réplicas: {e}")
+
+
+class ReadYourWritesMiddleware:
+    """Fixa no primário, por REPLICA_PIN_SECONDS, o cliente que acabou de fazer uma escrita bem-sucedida."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+                client = scope.get("client")
+                key = client_key(headers, client[0] if client else None)
+                if key:
+                    router.pins.pin(key)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,256 @@
+# app/revenue.py
+
+import argparse
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, upsert_statement
+
+# Status que contam para o faturamento e status que liberam o horário
+COMPLETED_STATUS = "Concluído"
+CANCELLED_STATUS = "Cancelado"
+DEFAULT_STATUS = models.Appointment.__table__.c.status.default.arg
+# Tolerância da verificação de consistência para somas em ponto flutuante
+VALUE_TOLERANCE = 0.005
+
+rollups = models.AppointmentDailyRollup.__table__
+services = models.Service.__table__
+appointments = models.Appointment.__table__
+
+METRICS = ("booked_count", "booked_minutes", "completed_count", "revenue")
+
+
+# --- Manutenção Incremental ---
+# Os valores anteriores são necessários mesmo com o objeto expirado (ver app/pipeline.py)
+def _keep_history(target, value, oldvalue, initiator):
+    return value
+
+for _attr in (models.Appointment.date, models.Appointment.status, models.Appointment.service_id, models.Appointment.professional_id):
+    event.listen(_attr, "set", _keep_history, retval=True, active_history=True)
+
+
+def _old_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), key)
+
+
+def _add(deltas, day, professional_id, service_id, status, sign):
+    # Por enquanto só as contagens; minutos e receita saem do serviço no fim do flush
+    entry = deltas.setdefault((day, professional_id, service_id), [0, 0])
+    if status != CANCELLED_STATUS:
+        entry[0] += sign
+    if status == COMPLETED_STATUS:
+        entry[1] += sign
+
+
+# Alterações e exclusões são lidas no before_flush, com o objeto ainda carregável; inclusões no
+# after_flush, quando os ids de profissional/serviço atribuídos por relacionamento já existem.
+@event.listens_for(Session, "before_flush")
+def _track_changes(session, flush_context, instances):
+    deltas: Dict[Tuple[date, int, int], list] = {}
+    repriced = set()
+    keys = ("date", "professional_id", "service_id", "status")
+    for obj in session.deleted:
+        if isinstance(obj, models.Appointment):
+            state = inspect(obj)
+            _add(deltas, *(_old_value(state, k) for k in keys), -1)
+    for obj in session.dirty:
+        if isinstance(obj, models.Appointment):
+            state = inspect(obj)
+            if not any(state.attrs[k].history.has_changes() for k in keys):
+                continue
+            _add(deltas, *(_old_value(state, k) for k in keys), -1)
+            _add(deltas, obj.date, obj.professional_id, obj.service_id, obj.status or DEFAULT_STATUS, 1)
+        elif isinstance(obj, models.Service):
+            state = inspect(obj)
+            if state.attrs.price.history.has_changes() or state.attrs.duration.history.has_changes():
+                repriced.add(obj.id)
+    session.info["revenue_pending"] = (deltas, repriced)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_changes(session, flush_context):
+    deltas, repriced = session.info.pop("revenue_pending", ({}, set()))
+    for obj in session.new:
+        if isinstance(obj, models.Appointment):
+            _add(deltas, obj.date, obj.professional_id, obj.service_id, obj.status or DEFAULT_STATUS, 1)
+
+    deltas = {key: counts for key, counts in deltas.items() if counts[0] or counts[1]}
+    if not deltas and not repriced:
+        return
+    connection = session.connection()
+    if deltas:
+        service_ids = {service_id for _, _, service_id in deltas}
+        prices = {
+            service_id: (duration or 0, price or 0.0)
+            for service_id, duration, price in connection.execute(
+                select(services.c.id, services.c.duration, services.c.price).where(services.c.id.in_(service_ids))
+            )
+        }
+        rows = []
+        for (day, professional_id, service_id), (booked, completed) in deltas.items():
+            duration, price = prices.get(service_id, (0, 0.0))
+            rows.append({
+                "day": day, "professional_id": professional_id, "service_id": service_id,
+                "booked_count": booked, "booked_minutes": booked * duration,
+                "completed_count": completed, "revenue": completed * price,
+            })
+        stmt = upsert_statement(
+            connection.dialect.name, rollups, ["day", "professional_id", "service_id"], increment_columns=METRICS,
+        )
+        connection.execute(stmt, rows)
+    if repriced:
+        # Preço/duração novos valem para todo o histórico, como no JOIN com `services`
+        connection.execute(
+            update(rollups)
+            .where(rollups.c.service_id.in_(repriced))
+            .values(
+                booked_minutes=rollups.c.booked_count * select(services.c.duration).where(services.c.id == rollups.c.service_id).scalar_subquery(),
+                revenue=rollups.c.completed_count * select(services.c.price).where(services.c.id == rollups.c.service_id).scalar_subquery(),
+            )
+        )
+
+
+# --- Leitura ---
+def _empty(key) -> dict:
+    return {"key": key, "appointments": 0, "booked_minutes": 0, "completed": 0, "revenue": 0.0}
+
+
+async def revenue_report(
+    db: AsyncSession,
+    start: date,
+    end: date,
+    group: str = "day",
+    professional_id: Optional[int] = None,
+    service_id: Optional[int] = None,
+) -> dict:
+    """
+    Agendamentos, minutos reservados, atendimentos concluídos e faturamento entre `start` e `end`
+    (inclusive), agrupados por dia, mês, profissional ou serviço. Lê só o rollup diário,
+    já somado no banco pela chave do agrupamento (por mês: soma dos dias).
+    """
+    column = {
+        "day": rollups.c.day, "month": rollups.c.day,
+        "professional": rollups.c.professional_id, "service": rollups.c.service_id,
+    }[group]
+    query = (
+        select(column, *(func.sum(rollups.c[m]) for m in METRICS))
+        .where(rollups.c.day.between(start, end))
+        .group_by(column)
+        .order_by(column)
+    )
+    if professional_id is not None:
+        query = query.where(rollups.c.professional_id == professional_id)
+    if service_id is not None:
+        query = query.where(rollups.c.service_id == service_id)
+
+    buckets: Dict[object, dict] = {}
+    for key, booked, minutes, completed, revenue in (await db.execute(query)).all():
+        if group == "day":
+            key = key.isoformat()
+        elif group == "month":
+            key = key.strftime("%Y-%m")
+        bucket = buckets.setdefault(key, _empty(key))
+        bucket["appointments"] += booked or 0
+        bucket["booked_minutes"] += minutes or 0
+        bucket["completed"] += completed or 0
+        bucket["revenue"] += revenue or 0.0
+    rows = list(buckets.values())
+    totals = _empty("total")
+    for row in rows:
+        row["revenue"] = round(row["revenue"], 2)
+        for field in ("appointments", "booked_minutes", "completed", "revenue"):
+            totals[field] += row[field]
+    totals["revenue"] = round(totals["revenue"], 2)
+    return {"start": start, "end": end, "group": group, "rows": rows, "totals": totals}
+
+
+# --- Reconstrução e Verificação ---
+def compute_from_source(db: Session) -> Dict[Tuple[date, int, int], Tuple[int, int, int, float]]:
+    """Recalcula o rollup a partir de `appointments` JOIN `services` (GROUP BY completo)."""
+    status = func.coalesce(appointments.c.status, DEFAULT_STATUS)
+    booked = case((status != CANCELLED_STATUS, 1), else_=0)
+    completed = case((status == COMPLETED_STATUS, 1), else_=0)
+    query = (
+        select(
+            appointments.c.date, appointments.c.professional_id, appointments.c.service_id,
+            func.sum(booked), func.sum(booked * services.c.duration),
+            func.sum(completed), func.sum(completed * services.c.price),
+        )
+        .join(services, services.c.id == appointments.c.service_id)
+        .group_by(appointments.c.date, appointments.c.professional_id, appointments.c.service_id)
+    )
+    expected = {}
+    for day, professional_id, service_id, booked_count, minutes, completed_count, revenue in db.execute(query):
+        if booked_count or completed_count:
+            expected[(day, professional_id, service_id)] = (
+                int(booked_count), int(minutes or 0), int(completed_count), float(revenue or 0.0),
+            )
+    return expected
+
+
+def rebuild(db: Session) -> int:
+    """Apaga e recria o rollup inteiro numa única transação. Retorna o número de linhas gravadas."""
+    expected = compute_from_source(db)
+    db.execute(delete(rollups))
+    if expected:
+        db.execute(rollups.insert(), [
+            {"day": day, "professional_id": professional_id, "service_id": service_id, **dict(zip(METRICS, values))}
+            for (day, professional_id, service_id), values in expected.items()
+        ])
+    db.commit()
+    return len(expected)
+
+
+def check(db: Session) -> List[dict]:
+    """Compara o rollup com o GROUP BY completo. Retorna as divergências (lista vazia = consistente)."""
+    expected = compute_from_source(db)
+    stored = {
+        (day, professional_id, service_id): tuple(values)
+        for day, professional_id, service_id, *values in db.execute(
+            select(rollups.c.day, rollups.c.professional_id, rollups.c.service_id, *(rollups.c[m] for m in METRICS))
+        )
+        if any(values)
+    }
+    zero = (0, 0, 0, 0.0)
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        exp, got = expected.get(key, zero), stored.get(key, zero)
+        if exp[:3] != got[:3] or abs(exp[3] - got[3]) > VALUE_TOLERANCE:
+            problems.append({
+                "day": key[0].isoformat(), "professional_id": key[1], "service_id": key[2],
+                "expected": dict(zip(METRICS, exp)), "stored": dict(zip(METRICS, got)),
+            })
+    return problems
+
+
+# Uso: python -m app.revenue rebuild | check
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do resumo diário de faturamento e ocupação.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Resumo de faturamento reconstruído: {rebuild(db)} linhas.")
+        else:
+            problems = check(db)
+            for problem in problems:
+                print(f"Divergência: {problem}")
+            print("Resumo de faturamento consistente." if not problems else f"{len(problems)} divergência(s) encontrada(s).")
+            raise SystemExit(1 if problems else 0)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
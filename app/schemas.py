@@ -1,7 +1,7 @@
 # app/schemas.py
 
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from datetime import date, time, datetime
 
 # --- Schemas Básicos e Utilitários ---
@@ -58,7 +58,7 @@ class CustomerUpdate(CustomerBase):
 class CustomerTag(BaseModel):
     id: int
     name: str
-    color: str
+    color: Optional[str] = None
     class Config:
         from_attributes = True
 
@@ -70,6 +70,18 @@ class CustomerResponse(CustomerBase):
     class Config:
         from_attributes = True
 
+class CustomerImportError(BaseModel):
+    line: int
+    error: str
+
+class CustomerImportReport(BaseModel):
+    """Resultado de uma importação em lote de clientes."""
+    total: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[CustomerImportError] = [] # Limitado a IMPORT_MAX_REPORTED_ERRORS itens
+
 # Professional
 class ProfessionalBase(BaseModel):
     name: str = Field(..., min_length=2)
@@ -145,6 +157,63 @@ class AppointmentResponse(AppointmentBase):
     class Config:
         from_attributes = True
 
+# Séries de Agendamentos (sessões recorrentes)
+class AppointmentSeriesCreate(BaseModel):
+    customer_id: int
+    service_id: int
+    professional_id: int
+    start_date: date
+    start_time: time
+    frequency: str = Field("weekly", pattern="^(daily|weekly|monthly)$")
+    interval: int = Field(1, ge=1, le=52) # A cada N dias/semanas/meses
+    weekdays: Optional[List[int]] = None # Só semanal: 0 = segunda ... 6 = domingo
+    count: Optional[int] = Field(None, ge=1) # Número de sessões, ou...
+    until: Optional[date] = None # ...data final (inclusive)
+    status: str = "Confirmado"
+    notes: Optional[str] = None
+
+class SeriesOccurrence(BaseModel):
+    date: date
+    start_time: time
+    status: str # "created", "conflict" ou "skipped" (série atômica com conflito em outra data)
+    appointment_id: Optional[int] = None
+    conflicts_with: List[int] = [] # Agendamentos existentes que se sobrepõem
+
+class AppointmentSeriesResult(BaseModel):
+    committed: bool
+    created: int
+    conflicts: int
+    occurrences: List[SeriesOccurrence] = []
+
+# Calendar
+class CalendarAppointment(AppointmentBase):
+    """Agendamento na listagem de calendário: referencia cliente/serviço/profissional apenas por id."""
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    class Config:
+        from_attributes = True
+
+class CalendarResponse(BaseModel):
+    """
+    Listagem de calendário normalizada: cada cliente, serviço e profissional aparece uma
+    única vez, mesmo que tenha vários agendamentos no período.
+    """
+    appointments: List[CalendarAppointment] = []
+    customers: List[CustomerResponse] = []
+    services: List[ServiceResponse] = []
+    professionals: List[ProfessionalResponse] = []
+
+# Availability
+class AvailabilityDay(BaseModel):
+    date: date
+    slots: List[time] = [] # Horários de início livres para o serviço
+
+class ProfessionalAvailability(BaseModel):
+    professional_id: int
+    service_id: int
+    days: List[AvailabilityDay] = []
+
 # Anamnesis Template
 class AnamnesisTemplateFieldBase(BaseModel):
     key: str
@@ -152,6 +221,7 @@ class AnamnesisTemplateFieldBase(BaseModel):
     field_type: str # 'text', 'textarea', 'radio', 'select'
     options: Optional[List[str]] = None
     order: int = 0
+    indexed: bool = False # Se as respostas deste campo podem ser filtradas em /anamnesis/search
 
 class AnamnesisTemplateFieldCreate(AnamnesisTemplateFieldBase):
     pass
@@ -182,6 +252,36 @@ class AnamnesisRecordResponse(AnamnesisRecordBase):
     class Config:
         from_attributes = True
 
+class AnamnesisFilter(BaseModel):
+    key: str # AnamnesisTemplateField.key (o campo precisa estar marcado como indexed)
+    op: str = Field("eq", pattern="^(eq|ne|in|lt|lte|gt|gte|contains)$")
+    value: Any
+
+class AnamnesisSearchRequest(BaseModel):
+    filters: List[AnamnesisFilter] = Field(..., min_length=1)
+    limit: int = Field(100, ge=1, le=1000)
+    after_id: Optional[int] = None # Paginação: id do último registro da página anterior
+
+class AnamnesisSearchResult(BaseModel):
+    id: int
+    appointment_id: int
+    customer_id: int
+    record_date: date
+    class Config:
+        from_attributes = True
+
+# Segmentação por Tags
+class SegmentRequest(BaseModel):
+    # Ex: {"and": [{"tag": "VIP"}, {"or": [{"tag": 3}, {"tag": 7}]}, {"not": {"tag": "Inativo"}}]}
+    expression: Dict[str, Any]
+    limit: int = Field(1000, ge=0, le=10000) # 0: só o total
+    after_id: Optional[int] = None # Paginação: último id da página anterior
+
+class SegmentResult(BaseModel):
+    count: int # Total de clientes no segmento
+    customer_ids: List[int] = []
+    next_after_id: Optional[int] = None
+
 # Opportunity
 class OpportunityBase(BaseModel):
     title: str = Field(..., min_length=3)
@@ -206,6 +306,33 @@ class OpportunityResponse(OpportunityBase):
     class Config:
         from_attributes = True
 
+class PipelineStage(BaseModel):
+    stage: str
+    count: int
+    total_value: float
+
+class PipelineSummary(BaseModel):
+    """Resumo do funil de vendas por estágio, para o quadro do CRM."""
+    period: str # "all" ou "AAAA-MM"
+    stages: List[PipelineStage] = []
+    total_count: int
+    total_value: float
+
+class RevenueBucket(BaseModel):
+    key: Union[str, int] # Dia (AAAA-MM-DD), mês (AAAA-MM), id do profissional ou do serviço
+    appointments: int # Agendamentos não cancelados
+    booked_minutes: int
+    completed: int
+    revenue: float
+
+class RevenueReport(BaseModel):
+    """Faturamento e ocupação da agenda num período, para o dashboard."""
+    start: date
+    end: date
+    group: str
+    rows: List[RevenueBucket] = []
+    totals: RevenueBucket
+
 # SystemTag
 class SystemTagBase(BaseModel):
     name: str = Field(..., min_length=2)
@@ -241,7 +368,55 @@ class MessageBase(BaseModel):
 class MessageCreate(MessageBase):
     pass
 
-class MessageResponse(MessageBase):
+class InboundMessage(MessageCreate):
+    """Mensagem recebida de um canal externo (ex: WhatsApp), para a fila de ingestão."""
+    conversation_id: int
+    idempotency_key: Optional[str] = Field(None, max_length=100) # Id da mensagem no provedor
+
+# Mídia (anexos do chat)
+class MediaUploadCreate(BaseModel):
+    filename: Optional[str] = Field(None, max_length=255)
+    content_type: Optional[str] = Field(None, max_length=255)
+    size: Optional[int] = Field(None, ge=1) # Tamanho total, se conhecido
+
+class MediaUploadResponse(BaseModel):
+    id: str
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    expected_size: Optional[int] = None
+    received: int # Bytes já gravados: `offset` da próxima parte
+    sha256: Optional[str] = None # Preenchido ao concluir
+    class Config:
+        from_attributes = True
+
+class MediaUploadComplete(BaseModel):
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$") # Confere o conteúdo, se informado
+
+class MediaObjectResponse(BaseModel):
+    sha256: str
+    size: int
+    content_type: Optional[str] = None
+    url: str
+    deduplicated: bool = False # O mesmo conteúdo já estava armazenado
+
+class MediaSignedUrl(BaseModel):
+    url: str # Link de download sem cabeçalho de autenticação, só para este arquivo
+    expires_at: datetime
+
+class AttachmentCreate(BaseModel):
+    sha256: str = Field(..., pattern="^[0-9a-f]{64}$")
+    sender: str = "clinic"
+    message_type: Optional[str] = Field(None, pattern="^(image|audio|file)$") # Padrão: pelo content_type
+    name: Optional[str] = None
+    caption: Optional[str] = None
+    duration: Optional[str] = None
+
+class IngestResult(BaseModel):
+    accepted: int
+    duplicates: int = 0 # Conhecidas em memória; as já gravadas só são detectadas no lote
+    results: Optional[List[str]] = None # Com `wait=true`: "stored", "duplicate", "unknown_conversation" ou "failed"
+
+class ChatMessageResponse(MessageBase):
     id: int
     class Config:
         from_attributes = True
@@ -262,10 +437,21 @@ class ConversationResponse(ConversationBase):
     id: int
     last_message_at: datetime
     customer: CustomerResponse # Inclui dados do cliente associado
-    messages: List[MessageResponse] = [] # Carrega as últimas mensagens, ou todas
+    last_message: Optional[ChatMessageResponse] = None # Prévia; o histórico é paginado em /conversations/{id}/messages
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    """Página do histórico de mensagens, da mais nova para a mais antiga."""
+    items: List[ChatMessageResponse] = []
+    next_cursor: Optional[str] = None # Passe em `before` para buscar mensagens mais antigas
+    prev_cursor: Optional[str] = None # Passe em `after` para buscar mensagens mais novas
+
+class ConversationPage(BaseModel):
+    """Página da caixa de entrada, ordenada pela última mensagem."""
+    items: List[ConversationResponse] = []
+    next_cursor: Optional[str] = None
+
 # ClinicInfo
 class ClinicInfoBase(BaseModel):
     name: str
@@ -0,0 +1,372 @@
+# app/segments.py
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .events import on_commit
+
+# --- Configurações da Segmentação ---
+# Tempo máximo sem reconstruir o índice a partir do banco. Protege contra mudanças
+# feitas por outros workers/processos (os commits deste worker são aplicados na hora).
+SEGMENT_INDEX_TTL = float(os.getenv("SEGMENT_INDEX_TTL", "600"))
+# Limite de nós numa expressão (tags + operadores)
+SEGMENT_MAX_NODES = int(os.getenv("SEGMENT_MAX_NODES", "100"))
+
+# Cada bitmap é dividido em blocos de 2^16 ids (como no Roaring): só os blocos com
+# algum cliente existem, e cada bloco é um int do Python usado como vetor de bits.
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+customers = models.Customer.__table__
+tags = models.SystemTag.__table__
+customer_tags = models.customer_tag_association
+
+
+class SegmentExpressionError(ValueError):
+    """Expressão de segmento inválida (operador desconhecido, tag inexistente, etc.)."""
+
+
+class Bitmap:
+    """Conjunto de ids de clientes em blocos de bits. As operações devolvem bitmaps novos."""
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks: Optional[Dict[int, int]] = None):
+        self.chunks = chunks or {}
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "Bitmap":
+        # Monta cada bloco num bytearray e converte uma única vez (|= bit a bit seria quadrático)
+        buffers: Dict[int, bytearray] = {}
+        for i in ids:
+            buffer = buffers.get(i >> CHUNK_BITS)
+            if buffer is None:
+                buffer = buffers[i >> CHUNK_BITS] = bytearray(CHUNK_SIZE // 8)
+            low = i & CHUNK_MASK
+            buffer[low >> 3] |= 1 << (low & 7)
+        return cls({high: int.from_bytes(buffer, "little") for high, buffer in buffers.items()})
+
+    def add(self, i: int):
+        high = i >> CHUNK_BITS
+        self.chunks[high] = self.chunks.get(high, 0) | (1 << (i & CHUNK_MASK))
+
+    def discard(self, i: int):
+        high = i >> CHUNK_BITS
+        chunk = self.chunks.get(high)
+        if chunk is not None:
+            chunk &= ~(1 << (i & CHUNK_MASK))
+            if chunk:
+                self.chunks[high] = chunk
+            else:
+                del self.chunks[high]
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        result = {}
+        for high, chunk in small.chunks.items():
+            value = chunk & large.chunks.get(high, 0)
+            if value:
+                result[high] = value
+        return Bitmap(result)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        result = dict(self.chunks)
+        for high, chunk in other.chunks.items():
+            result[high] = result.get(high, 0) | chunk
+        return Bitmap(result)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        result = {}
+        for high, chunk in self.chunks.items():
+            value = chunk & ~other.chunks.get(high, 0)
+            if value:
+                result[high] = value
+        return Bitmap(result)
+
+    def __len__(self) -> int:
+        return sum(bin(chunk).count("1") for chunk in self.chunks.values())
+
+    def iter_from(self, after_id: Optional[int] = None) -> Iterator[int]:
+        """Ids em ordem crescente, a partir do primeiro maior que `after_id`."""
+        start = -1 if after_id is None else after_id
+        for high in sorted(self.chunks):
+            if (high + 1) << CHUNK_BITS <= start + 1:
+                continue
+            base = high << CHUNK_BITS
+            chunk = self.chunks[high]
+            if start >= base:
+                chunk &= ~((1 << (start - base + 1)) - 1)
+            data = chunk.to_bytes(CHUNK_SIZE // 8, "little")
+            for offset, byte in enumerate(data):
+                if byte:
+                    for bit in range(8):
+                        if byte >> bit & 1:
+                            yield base + offset * 8 + bit
+
+    def memory_bytes(self) -> int:
+        return sum((chunk.bit_length() + 7) // 8 for chunk in self.chunks.values())
+
+
+class SegmentIndex:
+    """
+    Bitmaps em memória: um por `SystemTag` (clientes com a tag) e um com todos os clientes
+    (necessário para NOT). Construído do banco no primeiro uso e a cada SEGMENT_INDEX_TTL;
+    entre uma construção e outra, atualizado pelos commits deste worker.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock() # Commits chegam também das rotas síncronas (threadpool)
+        self._build_lock: Optional[asyncio.Lock] = None
+        self._tags: Dict[int, Bitmap] = {}
+        self._tag_ids: Dict[str, int] = {} # nome -> id
+        self._all = Bitmap()
+        self._built_at: Optional[float] = None
+        self._replay: Optional[List[tuple]] = None # Mudanças recebidas durante uma reconstrução
+        self.rebuilds = 0
+        self.last_build_seconds = 0.0
+
+    @property
+    def build_lock(self) -> asyncio.Lock:
+        if self._build_lock is None:
+            self._build_lock = asyncio.Lock()
+        return self._build_lock
+
+    def _fresh(self) -> bool:
+        return self._built_at is not None and time.monotonic() - self._built_at < self.ttl
+
+    async def ensure(self, db: AsyncSession):
+        if self._fresh():
+            return
+        async with self.build_lock:
+            if not self._fresh():
+                await self.rebuild(db)
+
+    async def rebuild(self, db: AsyncSession):
+        """Reconstrói todos os bitmaps a partir de `customers`, `system_tags` e da tabela de associação."""
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            tag_rows = (await db.execute(select(tags.c.id, tags.c.name))).all()
+            customer_ids = (await db.execute(select(customers.c.id))).scalars().all()
+            links = (await db.execute(select(customer_tags.c.tag_id, customer_tags.c.customer_id))).all()
+            by_tag: Dict[int, List[int]] = {tag_id: [] for tag_id, _ in tag_rows}
+            for tag_id, customer_id in links:
+                by_tag.setdefault(tag_id, []).append(customer_id)
+            built = {tag_id: Bitmap.from_ids(ids) for tag_id, ids in by_tag.items()}
+            everyone = Bitmap.from_ids(customer_ids)
+        except BaseException:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            self._tags = built
+            self._tag_ids = {name: tag_id for tag_id, name in tag_rows}
+            self._all = everyone
+            # Reaplica o que foi commitado enquanto as consultas acima rodavam (operações idempotentes)
+            replay, self._replay = self._replay, None
+            for change in replay:
+                self._apply(*change)
+            self._built_at = time.monotonic()
+        self.rebuilds += 1
+        self.last_build_seconds = time.perf_counter() - started
+
+    def invalidate(self):
+        self._built_at = None
+
+    # --- Atualização Incremental ---
+    def record(self, *change):
+        """Aplica uma mudança commitada: ("link"|"unlink", cliente, tag), ("customer"|"drop_customer", id, None), ("tag"|"drop_tag", id, nome)."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(change)
+            self._apply(*change)
+
+    def _apply(self, op: str, key: int, value):
+        # Chamado sempre com o lock adquirido
+        if op == "link":
+            self._tags.setdefault(value, Bitmap()).add(key)
+            self._all.add(key)
+        elif op == "unlink":
+            bitmap = self._tags.get(value)
+            if bitmap is not None:
+                bitmap.discard(key)
+        elif op == "customer":
+            self._all.add(key)
+        elif op == "drop_customer":
+            self._all.discard(key)
+            for bitmap in self._tags.values():
+                bitmap.discard(key)
+        elif op == "tag":
+            self._tags.setdefault(key, Bitmap())
+            self._tag_ids = {n: i for n, i in self._tag_ids.items() if i != key}
+            self._tag_ids[value] = key
+        elif op == "drop_tag":
+            self._tags.pop(key, None)
+            self._tag_ids = {n: i for n, i in self._tag_ids.items() if i != key}
+
+    # --- Consulta ---
+    def evaluate(self, expression: dict) -> Bitmap:
+        """Avalia a expressão (ver `query`) sobre um retrato consistente dos bitmaps."""
+        _count_nodes(expression, [0])
+        with self._lock:
+            # Cópia rasa: o resultado pode ser o próprio bitmap de uma tag, que os commits alteram
+            return Bitmap(dict(self._evaluate(expression).chunks))
+
+    def _tag_bitmap(self, ref) -> Bitmap:
+        tag_id = self._tag_ids.get(ref) if isinstance(ref, str) else ref
+        if isinstance(tag_id, bool) or not isinstance(tag_id, int) or tag_id not in self._tags:
+            raise SegmentExpressionError(f"Tag não encontrada: {ref!r}")
+        return self._tags[tag_id]
+
+    def _evaluate(self, node: dict) -> Bitmap:
+        if not isinstance(node, dict) or len(node) != 1:
+            raise SegmentExpressionError("Cada nó deve ter exatamente uma chave: tag, and, or ou not")
+        op, arg = next(iter(node.items()))
+        if op == "tag":
+            return self._tag_bitmap(arg)
+        if op == "not":
+            return self._all - self._evaluate(arg)
+        if op not in ("and", "or"):
+            raise SegmentExpressionError(f"Operador desconhecido: {op!r}")
+        if not isinstance(arg, list) or not arg:
+            raise SegmentExpressionError(f"`{op}` espera uma lista não vazia")
+        if op == "or":
+            result = Bitmap()
+            for child in arg:
+                result = result | self._evaluate(child)
+            return result
+        # AND: intersecta os termos positivos e subtrai os negados, sem passar pelo universo
+        positive, negative = [], []
+        for child in arg:
+            if isinstance(child, dict) and list(child) == ["not"]:
+                negative.append(child["not"])
+            else:
+                positive.append(child)
+        bitmaps = sorted((self._evaluate(c) for c in positive), key=lambda b: len(b.chunks))
+        result = bitmaps[0] if bitmaps else self._all
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap
+        for child in negative:
+            result = result - self._evaluate(child)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tags": len(self._tags),
+                "customers": len(self._all),
+                "memory_bytes": self._all.memory_bytes() + sum(b.memory_bytes() for b in self._tags.values()),
+                "age_seconds": round(time.monotonic() - self._built_at, 1) if self._built_at is not None else None,
+                "ttl_seconds": self.ttl,
+                "rebuilds": self.rebuilds,
+                "last_build_seconds": round(self.last_build_seconds, 3),
+            }
+
+
+def _count_nodes(node, counter: List[int]):
+    counter[0] += 1
+    if counter[0] > SEGMENT_MAX_NODES:
+        raise SegmentExpressionError(f"Expressão com mais de {SEGMENT_MAX_NODES} nós")
+    if isinstance(node, dict):
+        for value in node.values():
+            for child in value if isinstance(value, list) else [value]:
+                if isinstance(child, (dict, list)):
+                    _count_nodes(child, counter)
+
+
+segment_index = SegmentIndex(SEGMENT_INDEX_TTL)
+
+
+async def query(db: AsyncSession, expression: dict, limit: int = 1000, after_id: Optional[int] = None) -> dict:
+    """
+    Clientes que satisfazem uma expressão booleana de tags, ex:
+    `{"and": [{"tag": "VIP"}, {"or": [{"tag": 3}, {"tag": 7}]}, {"not": {"tag": "Inativo"}}]}`.
+    Tags por id ou nome. Retorna o total do segmento e uma página de ids (`limit` 0 = só o total),
+    em ordem crescente a partir de `after_id`.
+    """
+    await segment_index.ensure(db)
+    bitmap = segment_index.evaluate(expression)
+    ids = []
+    if limit:
+        for customer_id in bitmap.iter_from(after_id):
+            ids.append(customer_id)
+            if len(ids) >= limit:
+                break
+    return {
+        "count": len(bitmap),
+        "customer_ids": ids,
+        "next_after_id": ids[-1] if limit and len(ids) == limit else None,
+    }
+
+
+# --- Sincronização com o Banco ---
+# As tags de um cliente mudam pela coleção Customer.tags / SystemTag.customers, que não
+# aparece como mudança de coluna em app/events.py: o histórico das coleções é lido no
+# flush e aplicado só depois do commit.
+def _collection_changes(session) -> List[Tuple[str, int, int]]:
+    changes = []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Customer):
+            history = inspect(obj).attrs.tags.history
+            changes += [("link", obj.id, tag.id) for tag in history.added or ()]
+            changes += [("unlink", obj.id, tag.id) for tag in history.deleted or ()]
+        elif isinstance(obj, models.SystemTag):
+            history = inspect(obj).attrs.customers.history
+            changes += [("link", customer.id, obj.id) for customer in history.added or ()]
+            changes += [("unlink", customer.id, obj.id) for customer in history.deleted or ()]
+    return changes
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_links(session, flush_context):
+    changes = _collection_changes(session)
+    if changes:
+        session.info.setdefault("_segment_changes", []).extend(changes)
+
+
+def record_links(session: Session, pairs: Iterable[Tuple[int, int]]):
+    """Registra vínculos (cliente, tag) gravados fora do ORM (ex: INSERT em lote), aplicados no commit."""
+    session.info.setdefault("_segment_changes", []).extend(("link", c, t) for c, t in pairs)
+
+
+def record_customers(session: Session, customer_ids: Iterable[int]):
+    """Registra clientes inseridos fora do ORM, aplicados no commit."""
+    session.info.setdefault("_segment_changes", []).extend(("customer", c, None) for c in customer_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_links(session):
+    for change in session.info.pop("_segment_changes", ()):
+        segment_index.record(*change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_links(session):
+    session.info.pop("_segment_changes", None)
+
+
+@on_commit(models.Customer)
+def _update_customers(changes: Iterable):
+    for change in changes:
+        if change.op == "insert":
+            segment_index.record("customer", change.values["id"], None)
+        elif change.op == "delete":
+            segment_index.record("drop_customer", change.values["id"], None)
+
+@on_commit(models.SystemTag)
+def _update_tags(changes: Iterable):
+    for change in changes:
+        if change.op == "delete":
+            segment_index.record("drop_tag", change.values["id"], None)
+        else:
+            segment_index.record("tag", change.values["id"], change.values.get("name"))
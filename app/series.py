@@ -0,0 +1,190 @@
+# app/series.py
+
+import asyncio
+import os
+from datetime import date, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .availability import FREE_STATUSES
+
+# Limite de ocorrências por série (ex: 52 = um ano de sessões semanais)
+SERIES_MAX_OCCURRENCES = int(os.getenv("SERIES_MAX_OCCURRENCES", "100"))
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+# SQLite (só desenvolvimento): o pysqlite não abre transação antes dos SELECTs, então duas
+# verificações podem se intercalar; serializa as reservas deste worker
+_sqlite_lock = asyncio.Lock()
+
+
+class SeriesError(ValueError):
+    """Regra de recorrência inválida ou referência inexistente."""
+
+
+def _minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _add_months(day: date, months: int) -> Optional[date]:
+    """Mesmo dia do mês `months` meses depois; None se o mês não tiver esse dia (ex: 31)."""
+    month_index = day.month - 1 + months
+    try:
+        return day.replace(year=day.year + month_index // 12, month=month_index % 12 + 1)
+    except ValueError:
+        return None
+
+
+def expand(
+    start: date,
+    frequency: str,
+    interval: int = 1,
+    count: Optional[int] = None,
+    until: Optional[date] = None,
+    weekdays: Optional[List[int]] = None,
+) -> List[date]:
+    """
+    Datas das ocorrências da regra: a cada `interval` dias, semanas (nos `weekdays`, 0 = segunda;
+    padrão: o dia da semana de `start`) ou meses (mesmo dia do mês; meses sem esse dia são pulados).
+    Termina após `count` ocorrências ou em `until` (inclusive) — exatamente um dos dois.
+    """
+    if frequency not in FREQUENCIES:
+        raise SeriesError(f"Frequência inválida: {frequency!r}")
+    if (count is None) == (until is None):
+        raise SeriesError("Informe `count` ou `until` (apenas um)")
+    if interval < 1:
+        raise SeriesError("`interval` deve ser maior que zero")
+    if until is not None and until < start:
+        raise SeriesError("`until` deve ser maior ou igual à data inicial")
+    if weekdays is not None and (frequency != "weekly" or not weekdays or any(not 0 <= d <= 6 for d in weekdays)):
+        raise SeriesError("`weekdays` (0 = segunda ... 6 = domingo) só vale para frequência semanal")
+    limit = min(count, SERIES_MAX_OCCURRENCES + 1) if count is not None else SERIES_MAX_OCCURRENCES + 1
+
+    dates: List[date] = []
+    step = 0
+    while len(dates) < limit:
+        if frequency == "daily":
+            candidates = [start + timedelta(days=step * interval)]
+        elif frequency == "weekly":
+            week = start - timedelta(days=start.weekday()) + timedelta(weeks=step * interval)
+            days = sorted(set(weekdays)) if weekdays else [start.weekday()]
+            candidates = [week + timedelta(days=d) for d in days]
+        else:
+            candidates = [_add_months(start, step * interval)]
+            if candidates[0] is None:
+                step += 1
+                if step > 12 * SERIES_MAX_OCCURRENCES:
+                    break
+                continue
+        step += 1
+        for day in candidates:
+            if day < start:
+                continue
+            if until is not None and day > until:
+                return _checked(dates)
+            dates.append(day)
+            if len(dates) >= limit:
+                break
+    return _checked(dates)
+
+
+def _checked(dates: List[date]) -> List[date]:
+    if len(dates) > SERIES_MAX_OCCURRENCES:
+        raise SeriesError(f"A série passa do limite de {SERIES_MAX_OCCURRENCES} ocorrências")
+    if not dates:
+        raise SeriesError("A regra não gera nenhuma ocorrência")
+    return dates
+
+
+async def _busy_by_day(db: AsyncSession, professional_id: int, first: date, last: date) -> Dict[date, List[Tuple[int, int, int]]]:
+    """Agendamentos que ocupam a agenda do profissional no intervalo: uma única consulta."""
+    appointment, service = models.Appointment, models.Service
+    rows = await db.execute(
+        select(appointment.id, appointment.date, appointment.start_time, service.duration)
+        .join(service, service.id == appointment.service_id)
+        .where(
+            appointment.professional_id == professional_id,
+            appointment.date >= first,
+            appointment.date <= last,
+            appointment.status.notin_(FREE_STATUSES),
+        )
+    )
+    busy: Dict[date, List[Tuple[int, int, int]]] = {}
+    for appointment_id, day, start_time, duration in rows:
+        start = _minutes(start_time)
+        busy.setdefault(day, []).append((start, start + (duration or 0), appointment_id))
+    return busy
+
+
+async def book_series(db: AsyncSession, series: dict, atomic: bool = True) -> dict:
+    """
+    Expande a regra de `series` (AppointmentSeriesCreate), confere todas as ocorrências contra a
+    agenda do profissional numa única consulta e grava as livres num único flush.
+    `atomic`: qualquer conflito cancela a série inteira (nada é gravado, `committed` = False);
+    senão, grava as ocorrências livres e reporta as demais.
+    """
+    dates = expand(
+        series["start_date"], series["frequency"], series.get("interval") or 1,
+        count=series.get("count"), until=series.get("until"), weekdays=series.get("weekdays"),
+    )
+    if db.get_bind().dialect.name == "sqlite":
+        async with _sqlite_lock:
+            return await _book(db, series, dates, atomic)
+    return await _book(db, series, dates, atomic)
+
+
+async def _book(db: AsyncSession, series: dict, dates: List[date], atomic: bool) -> dict:
+    # Encerra a transação das leituras anteriores na mesma sessão (ex: o usuário autenticado)
+    if db.in_transaction():
+        await db.commit()
+    # Trava a linha do profissional como primeira instrução da transação: duas séries simultâneas
+    # para ele não passam juntas pela verificação. No InnoDB (REPEATABLE READ) o snapshot das
+    # leituras comuns é fixado na primeira delas; vindo depois do lock, já enxerga o que a outra
+    # série gravou antes de liberá-lo
+    locked = await db.execute(
+        select(models.Professional.id).where(models.Professional.id == series["professional_id"]).with_for_update()
+    )
+    if locked.scalar() is None:
+        raise SeriesError("Profissional não encontrado")
+    service = await db.get(models.Service, series["service_id"])
+    if service is None:
+        raise SeriesError("Serviço não encontrado")
+    if await db.get(models.Customer, series["customer_id"]) is None:
+        raise SeriesError("Cliente não encontrado")
+
+    busy = await _busy_by_day(db, series["professional_id"], dates[0], dates[-1])
+    start = _minutes(series["start_time"])
+    end = start + service.duration
+    occurrences, free = [], []
+    for day in dates:
+        conflicts = [i for s, e, i in busy.get(day, ()) if s < end and start < e]
+        occurrence = {"date": day, "start_time": series["start_time"], "status": "conflict" if conflicts else "created",
+                      "appointment_id": None, "conflicts_with": conflicts}
+        occurrences.append(occurrence)
+        if not conflicts:
+            free.append(occurrence)
+
+    conflict_count = len(occurrences) - len(free)
+    if atomic and conflict_count:
+        for occurrence in free:
+            occurrence["status"] = "skipped"
+        await db.rollback() # Libera o lock
+        return {"committed": False, "created": 0, "conflicts": conflict_count, "occurrences": occurrences}
+
+    appointments = [
+        models.Appointment(
+            customer_id=series["customer_id"], service_id=series["service_id"],
+            professional_id=series["professional_id"], date=occurrence["date"],
+            start_time=series["start_time"], status=series.get("status") or "Confirmado", notes=series.get("notes"),
+        )
+        for occurrence in free
+    ]
+    # Um único flush: o ORM agrupa os INSERTs (executemany) e os ganchos de agenda,
+    # faturamento e tempo real continuam valendo para cada agendamento
+    db.add_all(appointments)
+    await db.commit()
+    for occurrence, appointment in zip(free, appointments):
+        occurrence["appointment_id"] = appointment.id
+    return {"committed": True, "created": len(appointments), "conflicts": conflict_count, "occurrences": occurrences}
@@ -0,0 +1,178 @@
+# benchmarks/api_load.py
+"""
+Teste de carga da API contra uma clínica sintética.
+
+Sobe a aplicação no próprio processo (ASGI, sem rede) e dispara requisições
+concorrentes a /token, /users/me e às principais rotas de leitura, medindo
+RPS e p50/p95/p99 por cenário. Com `--baseline`, compara com uma execução
+anterior e falha se algum cenário regrediu além de `--tolerance`.
+
+Uso:
+    python benchmarks/synthetic_clinic.py --database-url sqlite:///./bench.db
+    python benchmarks/api_load.py --database-url sqlite:///./bench.db --requests 2000 \\
+        --concurrency 32 --save-baseline benchmarks/baseline.json
+    python benchmarks/api_load.py --database-url sqlite:///./bench.db --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from login_burst import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample_ids(models, SessionLocal, seed: int) -> dict:
+    """Ids usados pelos cenários: cliente, conversa, serviço e profissional existentes."""
+    from sqlalchemy import func, select
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        def pick(column):
+            low, high = db.execute(select(func.min(column), func.max(column))).one()
+            return [rng.randint(low, high) for _ in range(50)] if low is not None else []
+        return {
+            "conversations": pick(models.Conversation.id),
+            "services": pick(models.Service.id),
+            "professionals": pick(models.Professional.id),
+            "names": [name.split()[0] for (name,) in db.execute(select(models.Customer.name).limit(200))],
+        }
+    finally:
+        db.close()
+
+
+def scenarios(ids: dict, rng: random.Random):
+    """Cenários de leitura: nome -> função que devolve o path da próxima requisição."""
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    return {
+        "users_me": lambda: "/users/me",
+        "customer_search": lambda: f"/customers/search?q={rng.choice(ids['names'] or ['ana'])[:4]}",
+        "calendar_week": lambda: f"/appointments/calendar?start={monday}&end={monday + timedelta(days=6)}"
+                                 f"&professional_id={rng.choice(ids['professionals'] or [1])}",
+        "inbox": lambda: "/conversations?limit=30",
+        "messages": lambda: f"/conversations/{rng.choice(ids['conversations'] or [1])}/messages?limit=50",
+        "availability": lambda: f"/services/{rng.choice(ids['services'] or [1])}/availability?days=7",
+        "reference_services": lambda: "/reference/services",
+        "pipeline": lambda: "/opportunities/pipeline",
+    }
+
+
+async def drive(client, next_request, total, concurrency, headers=None, method="GET", data=None):
+    """Executa `total` requisições com no máximo `concurrency` simultâneas."""
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, next_request(), headers=headers, data=data)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": sum(n for code, n in statuses.items() if code >= 400),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def run(args) -> dict:
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, ROOT)
+    import httpx
+    from app import models
+    from app.database import SessionLocal
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    ids = sample_ids(models, SessionLocal, args.seed)
+    await app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            credentials = {"username": args.email, "password": args.password}
+            results["token"] = await drive(
+                client, lambda: "/token", args.logins, args.concurrency, method="POST", data=credentials,
+            )
+            response = await client.post("/token", data=credentials)
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            selected = scenarios(ids, rng)
+            for name, next_request in selected.items():
+                if args.only and name not in args.only:
+                    continue
+                # Aquecimento: caches (referências, agenda, principals) e planos de consulta
+                await drive(client, next_request, min(args.warmup, args.requests), args.concurrency, headers)
+                results[name] = await drive(client, next_request, args.requests, args.concurrency, headers)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Lista de regressões: RPS abaixo ou p95 acima do baseline além da tolerância."""
+    problems = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            problems.append(f"{name}: RPS {current['rps']:.1f} < {previous['rps']:.1f}")
+        if current["p95"] > previous["p95"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {current['p95'] * 1000:.1f} ms > {previous['p95'] * 1000:.1f} ms")
+        if current["errors"] > previous.get("errors", 0):
+            problems.append(f"{name}: {current['errors']} erros (baseline: {previous.get('errors', 0)})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./bench.db")
+    parser.add_argument("--email", default="admin@estetica.com")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--requests", type=int, default=1000, help="Requisições por cenário de leitura")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", help="Executa só estes cenários de leitura")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Regressão aceita (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="Grava os resultados desta execução neste arquivo")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for name, r in results.items():
+        print(
+            f"{name:>20}: {r['rps']:8.1f} req/s  p50={r['p50'] * 1000:8.2f} ms  p95={r['p95'] * 1000:8.2f} ms  "
+            f"p99={r['p99'] * 1000:8.2f} ms  erros={r['errors']}"
+        )
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline gravado em {args.save_baseline}.")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSÃO {problem}")
+        raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
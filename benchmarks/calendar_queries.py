@@ -0,0 +1,115 @@
+# benchmarks/calendar_queries.py
+"""
+Verificação da listagem de calendário: o número de consultas não cresce com o período.
+
+Cria um SQLite temporário com agendamentos distribuídos ao longo de `--days` dias
+(clientes com tags, serviços e profissionais ligados a usuários) e chama
+app/agenda.py para períodos cada vez maiores, contando as instruções enviadas ao banco.
+A resposta é validada com CalendarResponse, como a rota faz: um carregamento preguiçoso
+esquecido apareceria como consulta extra (ou erro, na sessão assíncrona).
+Falha se algum período usar um número de consultas diferente dos demais.
+
+Uso:
+    python benchmarks/calendar_queries.py --appointments 5000 --days 180
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as day_time, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERIODS = (1, 7, 30, 90, 180)
+
+
+def populate(engine, models, args, first_day: date):
+    rng = random.Random(args.seed)
+    with engine.begin() as connection:
+        connection.execute(models.User.__table__.insert(), [
+            {"id": i, "email": f"prof{i}@bench.example.com", "password_hash": "-", "name": f"Profissional {i}", "role": "professional"}
+            for i in range(1, args.professionals + 1)
+        ])
+        connection.execute(models.Professional.__table__.insert(), [
+            {"id": i, "user_id": i, "name": f"Profissional {i}"} for i in range(1, args.professionals + 1)
+        ])
+        connection.execute(models.Service.__table__.insert(), [
+            {"id": i, "name": f"Serviço {i}", "duration": rng.choice((30, 45, 60)), "price": 100.0}
+            for i in range(1, args.services + 1)
+        ])
+        connection.execute(models.SystemTag.__table__.insert(), [
+            {"id": i, "name": f"Tag {i}", "color": "bg-gray-400"} for i in range(1, 11)
+        ])
+        connection.execute(models.Customer.__table__.insert(), [
+            {"id": i, "name": f"Cliente {i}", "email": f"cliente{i}@bench.example.com"} for i in range(1, args.customers + 1)
+        ])
+        connection.execute(models.customer_tag_association.insert(), [
+            {"customer_id": c, "tag_id": t} for c in range(1, args.customers + 1) for t in rng.sample(range(1, 11), 2)
+        ])
+        connection.execute(models.Appointment.__table__.insert(), [
+            {
+                "customer_id": rng.randint(1, args.customers), "service_id": rng.randint(1, args.services),
+                "professional_id": rng.randint(1, args.professionals),
+                "date": first_day + timedelta(days=rng.randrange(args.days)),
+                "start_time": day_time(rng.randint(8, 18), rng.choice((0, 30))), "status": "Confirmado",
+            }
+            for _ in range(args.appointments)
+        ])
+
+
+async def run(args) -> int:
+    from sqlalchemy import event
+    from app import agenda, init_db, models, schemas
+    from app.database import AsyncSessionLocal, async_engine, engine
+
+    init_db.create_tables()
+    first_day = date(2024, 1, 1)
+    populate(engine, models, args, first_day)
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = {}
+    for days in PERIODS:
+        async with AsyncSessionLocal() as db:
+            statements.clear()
+            started = time.perf_counter()
+            result = await agenda.list_calendar(db, first_day, first_day + timedelta(days=days - 1))
+            schemas.CalendarResponse.model_validate(result)
+            elapsed = time.perf_counter() - started
+        counts[days] = len(statements)
+        print(
+            f"{days:4d} dias: {len(result['appointments']):6d} agendamentos, {len(result['customers']):5d} clientes  "
+            f"{len(statements)} consultas  {elapsed * 1000:7.1f} ms"
+        )
+    await async_engine.dispose()
+    if len(set(counts.values())) != 1:
+        print(f"FALHA: o número de consultas variou com o período: {counts}")
+        return 1
+    print(f"Número de consultas constante ({next(iter(counts.values()))}) em todos os períodos.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--appointments", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=max(PERIODS))
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--professionals", type=int, default=10)
+    parser.add_argument("--services", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'calendar.db')}"
+        sys.path.insert(0, ROOT)
+        raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/cold_start.py
+"""
+Orçamento de cold start de um worker.
+
+Mede, em processos novos, o tempo de `import app.main`, do startup da aplicação
+e da primeira requisição (/health e, com credenciais, /users/me), e falha se a
+mediana passar do orçamento. O banco precisa ter passado pelo bootstrap
+(`python -m app.init_db`): o startup dos workers só confere a versão do esquema.
+
+Uso:
+    DATABASE_URL=sqlite:///./estetica.db python -m app.init_db
+    DATABASE_URL=sqlite:///./estetica.db python benchmarks/cold_start.py --runs 5 \\
+        --import-budget 1.5 --startup-budget 0.3 --first-request-budget 0.2
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado num processo novo para cada medição (nada em cache no interpretador)
+PROBE = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+import httpx
+
+async def run(email, password):
+    await app.router.startup()
+    t2 = time.perf_counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/health")
+        t3 = time.perf_counter()
+        me = None
+        if email:
+            token = (await client.post("/token", data={"username": email, "password": password})).json()["access_token"]
+            t4 = time.perf_counter()
+            await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+            me = time.perf_counter() - t4
+    await app.router.shutdown()
+    return t2, t3, response.status_code, me
+
+t2, t3, status, me = asyncio.run(run(sys.argv[1], sys.argv[2]))
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first_request": t3 - t2, "status": status, "users_me": me}))
+"""
+
+
+def measure(email: str, password: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, email, password],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.5, help="Segundos para `import app.main`")
+    parser.add_argument("--startup-budget", type=float, default=0.3, help="Segundos para os handlers de startup")
+    parser.add_argument("--first-request-budget", type=float, default=0.2, help="Segundos para o primeiro /health")
+    parser.add_argument("--email", default="", help="Se informado, mede também /token + /users/me")
+    parser.add_argument("--password", default="1234")
+    args = parser.parse_args()
+
+    samples = [measure(args.email, args.password) for _ in range(args.runs)]
+    if any(s["status"] != 200 for s in samples):
+        print(f"/health respondeu {[s['status'] for s in samples]}")
+        raise SystemExit(1)
+
+    budgets = {"import": args.import_budget, "startup": args.startup_budget, "first_request": args.first_request_budget}
+    failed = False
+    for name, budget in budgets.items():
+        median = statistics.median(s[name] for s in samples)
+        ok = median <= budget
+        failed |= not ok
+        print(f"{name:>14}: mediana={median * 1000:8.1f} ms  orçamento={budget * 1000:8.1f} ms  {'ok' if ok else 'ESTOUROU'}")
+    if args.email:
+        median = statistics.median(s["users_me"] for s in samples)
+        print(f"{'users_me':>14}: mediana={median * 1000:8.1f} ms")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/list_serialization.py
+"""
+Benchmark das listagens grandes: caminho ORM + Pydantic vs projeção enxuta + orjson.
+
+Cria um SQLite temporário com N clientes (com tags) e N serviços e mede, para
+cada lista, o tempo de consulta + montagem + serialização JSON em dois caminhos:
+- orm: objetos ORM (selectinload das tags), validação com os *Response
+  (from_attributes) e json.dumps, como o FastAPI faz com `response_model`;
+- lean: app/projections.py (tuplas de colunas, dicts sem validação) e orjson.
+
+Uso:
+    python benchmarks/list_serialization.py --rows 10000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def populate(engine, models, rows: int, tags: int, seed: int):
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        connection.execute(models.SystemTag.__table__.insert(), [
+            {"id": i, "name": f"Tag {i}", "color": "bg-gray-400"} for i in range(1, tags + 1)
+        ])
+        connection.execute(models.Customer.__table__.insert(), [
+            {"id": i, "name": f"Cliente {i}", "email": f"cliente{i}@bench.example.com", "phone": f"(11) 9{10**7 + i}", "notes": "Obs."}
+            for i in range(1, rows + 1)
+        ])
+        connection.execute(models.customer_tag_association.insert(), [
+            {"customer_id": c, "tag_id": t}
+            for c in range(1, rows + 1)
+            for t in rng.sample(range(1, tags + 1), rng.randint(0, 3))
+        ])
+        connection.execute(models.Service.__table__.insert(), [
+            {"id": i, "name": f"Serviço {i}", "duration": 60, "price": 150.0, "description": "Descrição do serviço"}
+            for i in range(1, rows + 1)
+        ])
+
+
+async def measure(fn, repeat: int):
+    """Tempos de `repeat` execuções e o tamanho do corpo gerado."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        samples.append(time.perf_counter() - started)
+    return samples, len(body)
+
+
+async def run(args):
+    from fastapi.encoders import jsonable_encoder
+    import orjson
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from app import init_db, models, projections, schemas
+    from app.database import AsyncSessionLocal, async_engine, engine
+
+    init_db.create_tables()
+    populate(engine, models, args.rows, args.tags, args.seed)
+    customers_adapter = TypeAdapter(List[schemas.CustomerResponse])
+    services_adapter = TypeAdapter(List[schemas.ServiceResponse])
+
+    async def orm_customers():
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(models.Customer).options(selectinload(models.Customer.tags)).order_by(models.Customer.id).limit(args.rows)
+            )).scalars().all()
+            validated = customers_adapter.validate_python(rows, from_attributes=True)
+            return json.dumps(jsonable_encoder(validated)).encode()
+
+    async def lean_customers():
+        async with AsyncSessionLocal() as db:
+            return orjson.dumps(await projections.list_customers(db, limit=args.rows))
+
+    async def orm_services():
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(models.Service).order_by(models.Service.name))).scalars().all()
+            validated = services_adapter.validate_python(rows, from_attributes=True)
+            return json.dumps(jsonable_encoder(validated)).encode()
+
+    async def lean_services():
+        async with AsyncSessionLocal() as db:
+            return orjson.dumps(await projections.list_services(db))
+
+    for name, orm_fn, lean_fn in (("customers", orm_customers, lean_customers), ("services", orm_services, lean_services)):
+        # Aquecimento
+        await orm_fn()
+        await lean_fn()
+        orm, orm_size = await measure(orm_fn, args.repeat)
+        lean, lean_size = await measure(lean_fn, args.repeat)
+        print(
+            f"{name:>10}: orm={statistics.median(orm) * 1000:8.1f} ms ({orm_size} bytes)  "
+            f"lean={statistics.median(lean) * 1000:8.1f} ms ({lean_size} bytes)  "
+            f"ganho={statistics.median(orm) / statistics.median(lean):5.1f}x"
+        )
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'lists.db')}"
+        sys.path.insert(0, ROOT)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/login_burst.py
+"""
+Benchmark de rajada de logins.
+
+Dispara logins concorrentes em /token e, ao mesmo tempo, mede a latência de
+/health. Com o bcrypt rodando no pool dedicado, o p99 de /health deve ficar
+praticamente igual ao medido sem carga de login.
+
+Uso (com a API rodando):
+    python benchmarks/login_burst.py --url http://localhost:8000 \\
+        --email admin@estetica.com --password 1234 --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    """Percentil simples (nearest-rank) de uma lista de latências."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(name, samples, statuses=None):
+    print(
+        f"{name:>8}: n={len(samples):5d}  p50={percentile(samples, 50) * 1000:8.2f} ms  "
+        f"p95={percentile(samples, 95) * 1000:8.2f} ms  p99={percentile(samples, 99) * 1000:8.2f} ms  "
+        f"media={statistics.mean(samples) * 1000 if samples else 0:8.2f} ms"
+    )
+    if statuses:
+        print(f"{'':>8}  status: {dict(sorted(statuses.items()))}")
+
+
+async def probe_health(client, stop, samples, interval):
+    """Faz requisições a /health em intervalo fixo até `stop` ser sinalizado."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def hammer_token(client, args, samples, statuses):
+    """Dispara `args.logins` logins com no máximo `args.concurrency` simultâneos."""
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_login():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/token", data={"username": args.email, "password": args.password})
+            samples.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(one_login() for _ in range(args.logins)))
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        # Linha de base: /health sem carga de login
+        baseline, stop = [], asyncio.Event()
+        task = asyncio.create_task(probe_health(client, stop, baseline, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await task
+
+        # /health enquanto /token é martelado
+        loaded, stop = [], asyncio.Event()
+        token_samples, statuses = [], {}
+        task = asyncio.create_task(probe_health(client, stop, loaded, args.interval))
+        started = time.perf_counter()
+        await hammer_token(client, args, token_samples, statuses)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    print(f"Logins: {args.logins} em {elapsed:.2f}s ({args.logins / elapsed:.1f} req/s)")
+    report("health0", baseline)
+    report("health", loaded)
+    report("token", token_samples, statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="admin@estetica.com")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.01, help="Intervalo entre sondas de /health (s)")
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# benchmarks/media_upload.py
+"""
+Verificação do armazenamento de mídia: upload grande em partes com memória constante.
+
+Sobe a aplicação no próprio processo (ASGI, sem rede, SQLite e MEDIA_ROOT temporários) e
+envia um arquivo de `--size-mb` MB gerado em streaming, em partes de `--part-mb` MB, medindo
+o pico de memória alocada pelo Python (tracemalloc) durante o upload. Falha se o pico passar
+de `--max-memory-mb`. Depois confere o SHA-256, a retomada (offset errado = 409), a
+deduplicação (o mesmo conteúdo enviado de novo), os downloads com Range e por link
+assinado, e que nenhum lock de upload fica para trás (ids inexistentes, erros, uploads concluídos).
+
+Uso:
+    python benchmarks/media_upload.py --size-mb 500 --part-mb 100 --max-memory-mb 64
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK = 1024 * 1024
+
+
+def block(i: int) -> bytes:
+    # Blocos diferentes entre si (sem guardar o arquivo inteiro em lugar nenhum)
+    return hashlib.sha256(str(i).encode()).digest() * (BLOCK // 32)
+
+
+async def body(first: int, count: int, digest):
+    for i in range(first, first + count):
+        data = block(i)
+        digest.update(data)
+        yield data
+
+
+async def upload(client, headers, blocks: int, part_blocks: int, digest=None) -> dict:
+    digest = digest or hashlib.sha256()
+    response = await client.post("/media/uploads", json={
+        "filename": "video.mp4", "content_type": "video/mp4", "size": blocks * BLOCK,
+    }, headers=headers)
+    response.raise_for_status()
+    upload_id = response.json()["id"]
+    sent = 0
+    while sent < blocks:
+        count = min(part_blocks, blocks - sent)
+        response = await client.put(
+            f"/media/uploads/{upload_id}", params={"offset": sent * BLOCK},
+            content=body(sent, count, digest), headers=headers,
+        )
+        response.raise_for_status()
+        sent += count
+    response = await client.post(f"/media/uploads/{upload_id}/complete", json={"sha256": digest.hexdigest()}, headers=headers)
+    response.raise_for_status()
+    return {"upload_id": upload_id, **response.json()}
+
+
+async def run(args) -> int:
+    import httpx
+    from app import media
+    from app.main import app
+
+    problems = []
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            response = await client.post("/token", data={"username": args.email, "password": args.password})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            blocks, part_blocks = args.size_mb, args.part_mb
+            tracemalloc.start()
+            started = time.perf_counter()
+            result = await upload(client, headers, blocks, part_blocks)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"upload de {args.size_mb} MB em partes de {args.part_mb} MB: {elapsed:.1f}s "
+                f"({args.size_mb / elapsed:.0f} MB/s)  pico de memória={peak / BLOCK:.1f} MB"
+            )
+            if peak > args.max_memory_mb * BLOCK:
+                problems.append(f"pico de memória {peak / BLOCK:.1f} MB > {args.max_memory_mb} MB")
+            if result["size"] != blocks * BLOCK:
+                problems.append(f"tamanho armazenado {result['size']} != {blocks * BLOCK}")
+
+            # Retomada: offset diferente do recebido é recusado com o offset correto
+            response = await client.post("/media/uploads", json={"filename": "a.bin"}, headers=headers)
+            retry_id = response.json()["id"]
+            await client.put(f"/media/uploads/{retry_id}", params={"offset": 0}, content=block(0), headers=headers)
+            response = await client.put(f"/media/uploads/{retry_id}", params={"offset": 0}, content=block(1), headers=headers)
+            if response.status_code != 409 or response.headers.get("upload-offset") != str(BLOCK):
+                problems.append(f"retomada: {response.status_code} {response.headers.get('upload-offset')}, esperado 409 {BLOCK}")
+
+            # Upload inexistente: 404, sem criar lock
+            response = await client.put("/media/uploads/inexistente", params={"offset": 0}, content=b"x", headers=headers)
+            if response.status_code != 404:
+                problems.append(f"upload inexistente: {response.status_code}, esperado 404")
+
+            # Deduplicação: o mesmo conteúdo não é gravado de novo
+            small = await upload(client, headers, 2, 1)
+            again = await upload(client, headers, 2, 1)
+            if small["sha256"] != again["sha256"] or not again["deduplicated"]:
+                problems.append("deduplicação: segundo upload idêntico não foi reconhecido")
+
+            if media._upload_locks:
+                problems.append(f"locks de upload não removidos: {sorted(media._upload_locks)}")
+
+            # Range: primeiros bytes, intervalo no meio e sufixo, comparados com os blocos gerados
+            url = result["url"]
+            expected = {
+                "bytes=0-1023": block(0)[:1024],
+                f"bytes={BLOCK - 10}-{BLOCK + 9}": block(0)[-10:] + block(1)[:10],
+                "bytes=-100": block(blocks - 1)[-100:],
+            }
+            for range_header, data in expected.items():
+                response = await client.get(url, headers={**headers, "Range": range_header})
+                if response.status_code != 206 or response.content != data:
+                    problems.append(f"Range {range_header}: {response.status_code}, {len(response.content)} bytes")
+            response = await client.get(url, headers={**headers, "Range": f"bytes={blocks * BLOCK}-"})
+            if response.status_code != 416:
+                problems.append(f"Range fora do arquivo: {response.status_code}, esperado 416")
+            response = await client.get(url, headers={**headers, "If-None-Match": f'"{result["sha256"]}"'})
+            if response.status_code != 304:
+                problems.append(f"If-None-Match: {response.status_code}, esperado 304")
+
+            # Link assinado: baixa sem cabeçalho; assinatura alterada ou token na URL são recusados
+            response = await client.get(f"{url}/url", headers=headers)
+            signed = response.json()["url"]
+            response = await client.get(signed, headers={"Range": "bytes=0-1023"})
+            if response.status_code != 206 or response.content != block(0)[:1024]:
+                problems.append(f"link assinado: {response.status_code}, esperado 206")
+            if response.headers.get("x-content-type-options") != "nosniff":
+                problems.append("download sem X-Content-Type-Options: nosniff")
+            response = await client.get(signed[:-1] + ("0" if signed[-1] != "0" else "1"))
+            if response.status_code != 401:
+                problems.append(f"assinatura alterada: {response.status_code}, esperado 401")
+            # HTML enviado pelo usuário nunca é servido inline (XSS pela origem da API)
+            html = b"<script>alert(1)</script>"
+            response = await client.post("/media/uploads", json={"filename": "x.html", "content_type": "text/html"}, headers=headers)
+            html_id = response.json()["id"]
+            await client.put(f"/media/uploads/{html_id}", params={"offset": 0}, content=html, headers=headers)
+            response = await client.post(f"/media/uploads/{html_id}/complete", json={}, headers=headers)
+            response = await client.get(response.json()["url"], headers=headers)
+            if (response.headers.get("content-type") != "application/octet-stream"
+                    or response.headers.get("content-disposition") != "attachment"):
+                problems.append(f"HTML servido como {response.headers.get('content-type')}, {response.headers.get('content-disposition')}")
+
+            response = await client.get(url, params={"token": headers["Authorization"][7:]})
+            if response.status_code != 401:
+                problems.append(f"token na URL: {response.status_code}, esperado 401")
+    finally:
+        await app.router.shutdown()
+    for problem in problems:
+        print(f"FALHA {problem}")
+    print("Armazenamento de mídia OK." if not problems else f"{len(problems)} falhas.")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--part-mb", type=int, default=100)
+    parser.add_argument("--max-memory-mb", type=float, default=64)
+    parser.add_argument("--email", default="admin@estetica.com")
+    parser.add_argument("--password", default="1234")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'media.db')}"
+        os.environ["DB_AUTO_BOOTSTRAP"] = "true"
+        os.environ["MEDIA_ROOT"] = os.path.join(tmp, "media")
+        os.environ["ADMIN_EMAIL"] = args.email
+        os.environ["ADMIN_PASSWORD"] = args.password
+        sys.path.insert(0, ROOT)
+        raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/segments.py
+"""
+Benchmark da segmentação por tags: SQL sobre a tabela de associação vs bitmaps em memória.
+
+Cria um SQLite temporário com N clientes e tags aleatórias e mede, para a expressão
+"tag 1 AND tag 2 AND NOT tag 3", o total e a primeira página de ids em dois caminhos:
+- sql: um EXISTS/NOT EXISTS por tag sobre `customer_tag_association`;
+- bitmap: app/segments.py (índice já construído; o tempo de construção é mostrado à parte).
+Confere que os dois caminhos devolvem o mesmo segmento.
+
+Uso:
+    python benchmarks/segments.py --customers 300000 --tags 40 --repeat 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def populate(engine, models, customers: int, tags: int, per_customer: int, seed: int):
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        connection.execute(models.SystemTag.__table__.insert(), [
+            {"id": i, "name": f"Tag {i}", "color": "bg-gray-400"} for i in range(1, tags + 1)
+        ])
+        connection.execute(models.Customer.__table__.insert(), [
+            {"id": i, "name": f"Cliente {i}", "email": f"cliente{i}@bench.local"} for i in range(1, customers + 1)
+        ])
+        # Tags com popularidade desigual, como em campanhas reais
+        weights = [1 / t for t in range(1, tags + 1)]
+        connection.execute(models.customer_tag_association.insert(), [
+            {"customer_id": c, "tag_id": t}
+            for c in range(1, customers + 1)
+            for t in set(rng.choices(range(1, tags + 1), weights, k=rng.randint(0, per_customer)))
+        ])
+
+
+async def measure(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+async def run(args):
+    from sqlalchemy import exists, func, select
+    from app import init_db, models, segments
+    from app.database import AsyncSessionLocal, async_engine, engine
+
+    init_db.create_tables()
+    populate(engine, models, args.customers, args.tags, args.per_customer, args.seed)
+    link = models.customer_tag_association
+    customer = models.Customer.__table__
+
+    def has_tag(tag_id):
+        return exists().where(link.c.customer_id == customer.c.id, link.c.tag_id == tag_id)
+
+    condition = has_tag(1) & has_tag(2) & ~has_tag(3)
+    expression = {"and": [{"tag": 1}, {"tag": 2}, {"not": {"tag": 3}}]}
+
+    async def sql():
+        async with AsyncSessionLocal() as db:
+            count = (await db.execute(select(func.count()).select_from(customer).where(condition))).scalar()
+            ids = (await db.execute(
+                select(customer.c.id).where(condition).order_by(customer.c.id).limit(args.page)
+            )).scalars().all()
+            return count, list(ids)
+
+    async def bitmap():
+        async with AsyncSessionLocal() as db:
+            result = await segments.query(db, expression, limit=args.page)
+            return result["count"], result["customer_ids"]
+
+    async with AsyncSessionLocal() as db:
+        await segments.segment_index.ensure(db)
+    stats = segments.segment_index.stats()
+    print(
+        f"índice: {stats['customers']} clientes, {stats['tags']} tags, {stats['memory_bytes'] / 1024:.0f} KiB, "
+        f"construído em {stats['last_build_seconds'] * 1000:.0f} ms"
+    )
+    sql_time, sql_result = await measure(sql, args.repeat)
+    bitmap_time, bitmap_result = await measure(bitmap, args.repeat)
+    print(f"   sql: {sql_time * 1000:8.1f} ms  (total={sql_result[0]})")
+    print(f"bitmap: {bitmap_time * 1000:8.1f} ms  (total={bitmap_result[0]})  ganho={sql_time / bitmap_time:5.1f}x")
+    await async_engine.dispose()
+    if sql_result != bitmap_result:
+        print("DIVERGÊNCIA entre SQL e bitmap")
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=300000)
+    parser.add_argument("--tags", type=int, default=40)
+    parser.add_argument("--per-customer", type=int, default=4)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'segments.db')}"
+        sys.path.insert(0, ROOT)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
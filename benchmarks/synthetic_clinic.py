@@ -0,0 +1,182 @@
+# benchmarks/synthetic_clinic.py
+"""
+Gera uma clínica sintética para benchmarks.
+
+Cria o esquema (bootstrap) e preenche usuários, profissionais, serviços, tags,
+clientes com tags, agendamentos, conversas e mensagens com INSERTs em lote
+(Core, executemany), sem passar pelo ORM. Os índices derivados que o ORM
+manteria (busca de clientes) são gravados junto de cada lote. Os ids são
+explícitos, então o banco precisa estar vazio. A geração é determinística
+para a mesma `--seed`.
+
+Uso:
+    python benchmarks/synthetic_clinic.py --database-url sqlite:///./bench.db \\
+        --customers 50000 --appointments 1000000 --messages 2000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_NAMES = ["Ana", "Beatriz", "Carla", "Daniela", "Eduarda", "Fernanda", "Gabriela", "Helena", "Isabela", "Júlia",
+               "Larissa", "Mariana", "Natália", "Patrícia", "Renata", "Sofia", "Tatiane", "Vanessa", "João", "Lucas"]
+LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+              "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo", "Barbosa", "Rocha", "Dias", "Conceição"]
+SERVICES = ["Limpeza de Pele", "Peeling", "Drenagem Linfática", "Massagem Modeladora", "Depilação a Laser",
+            "Microagulhamento", "Radiofrequência", "Botox", "Preenchimento", "Criolipólise"]
+STATUSES = ["Confirmado"] * 3 + ["Concluído"] * 5 + ["Cancelado", "Pendente"]
+
+
+def chunks(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(args):
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, ROOT)
+    from app import auth, customer_search, init_db, models, revenue
+    from app.database import SessionLocal, engine
+
+    rng = random.Random(args.seed)
+    init_db.bootstrap()
+    started = time.perf_counter()
+    today = date.today()
+    counts = {}
+
+    def insert(connection, table, rows, on_batch=None):
+        total = 0
+        for batch in chunks(rows, args.batch_size):
+            connection.execute(table.insert(), batch)
+            if on_batch is not None:
+                on_batch(connection, batch)
+            total += len(batch)
+        counts[table.name] = counts.get(table.name, 0) + total
+
+    with engine.begin() as connection:
+        # Um único hash para todos os usuários sintéticos: bcrypt é lento de propósito
+        password_hash = auth.get_password_hash(args.password)
+        insert(connection, models.User.__table__, (
+            {"id": 1000 + i, "email": f"staff{i}@bench.example.com", "password_hash": password_hash,
+             "name": f"Equipe {i}", "role": "professional"}
+            for i in range(args.users)
+        ))
+        insert(connection, models.Service.__table__, (
+            {"id": i + 1, "name": f"{SERVICES[i % len(SERVICES)]} {i // len(SERVICES) + 1}",
+             "duration": rng.choice([30, 45, 60, 90]), "price": float(rng.randrange(80, 900, 10))}
+            for i in range(args.services)
+        ))
+        insert(connection, models.Professional.__table__, (
+            {"id": i + 1, "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+             "user_id": 1000 + i if i < args.users else None, "color": "bg-pink-400"}
+            for i in range(args.professionals)
+        ))
+        offered = {
+            p: sorted(rng.sample(range(1, args.services + 1), min(args.services, rng.randint(2, 5))))
+            for p in range(1, args.professionals + 1)
+        }
+        insert(connection, models.professional_service_association, (
+            {"professional_id": p, "service_id": s} for p, services in offered.items() for s in services
+        ))
+        insert(connection, models.SystemTag.__table__, (
+            {"id": i + 1, "name": f"Tag {i + 1}", "color": "bg-gray-400"} for i in range(args.tags)
+        ))
+
+        def customers():
+            for i in range(1, args.customers + 1):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+                yield {"id": i, "name": name, "email": f"cliente{i}@bench.example.com",
+                       "phone": f"(11) 9{rng.randrange(10**7, 10**8)}", "notes": None}
+
+        def index_customers(conn, batch):
+            customer_search.index_customers(conn, [(c["id"], c["name"], c["email"], c["phone"]) for c in batch])
+
+        insert(connection, models.Customer.__table__, customers(), on_batch=index_customers)
+        if args.tags:
+            insert(connection, models.customer_tag_association, (
+                {"customer_id": c, "tag_id": t}
+                for c in range(1, args.customers + 1)
+                for t in rng.sample(range(1, args.tags + 1), min(args.tags, rng.randint(0, args.tags_per_customer)))
+            ))
+
+        def appointments():
+            for i in range(1, args.appointments + 1):
+                professional_id = rng.randint(1, args.professionals)
+                yield {
+                    "id": i,
+                    "customer_id": rng.randint(1, args.customers),
+                    "service_id": rng.choice(offered[professional_id]),
+                    "professional_id": professional_id,
+                    "date": today + timedelta(days=rng.randint(-args.days_back, args.days_ahead)),
+                    "start_time": dtime(rng.randint(8, 17), rng.choice([0, 15, 30, 45])),
+                    "status": rng.choice(STATUSES),
+                }
+
+        insert(connection, models.Appointment.__table__, appointments())
+
+        conversations = min(args.conversations, args.customers)
+        now = datetime.now()
+        insert(connection, models.Conversation.__table__, (
+            {"id": i, "customer_id": i, "last_message_at": now - timedelta(minutes=i), "unread_count": rng.randint(0, 5)}
+            for i in range(1, conversations + 1)
+        ))
+
+        def messages():
+            if not conversations:
+                return
+            for i in range(1, args.messages + 1):
+                conversation_id = (i - 1) % conversations + 1
+                step = (i - 1) // conversations
+                yield {
+                    "id": i,
+                    "conversation_id": conversation_id,
+                    "sender": rng.choice(["clinic", "customer"]),
+                    "message_type": "text",
+                    "content": {"text": f"Mensagem {i}"},
+                    "timestamp": now - timedelta(minutes=conversation_id, seconds=step),
+                }
+
+        insert(connection, models.Message.__table__, messages())
+
+    # Os INSERTs em massa não passam pela sessão: o resumo de faturamento é recalculado de uma vez
+    with SessionLocal() as db:
+        counts[models.AppointmentDailyRollup.__tablename__] = revenue.rebuild(db)
+
+    elapsed = time.perf_counter() - started
+    for table, total in counts.items():
+        print(f"{table:>36}: {total:10d} linhas")
+    print(f"Clínica sintética gerada em {elapsed:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./bench.db")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--password", default="1234", help="Senha dos usuários sintéticos (staffN@bench.example.com)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--professionals", type=int, default=20)
+    parser.add_argument("--services", type=int, default=30)
+    parser.add_argument("--tags", type=int, default=40)
+    parser.add_argument("--tags-per-customer", type=int, default=4)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--appointments", type=int, default=200000)
+    parser.add_argument("--days-back", type=int, default=365)
+    parser.add_argument("--days-ahead", type=int, default=60)
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=200000)
+    generate(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/tenants_concurrency.py
+"""
+Verificação do modo multi-clínica: várias clínicas servidas pelo mesmo worker.
+
+Cria um SQLite por clínica (TENANT_DATABASE_URL_TEMPLATE + TENANT_AUTO_BOOTSTRAP),
+faz login em cada uma, cadastra um serviço com o nome da clínica e dispara leituras
+concorrentes intercaladas entre as clínicas, conferindo que cada resposta só contém
+os dados da própria clínica. Também confere que um token não abre outra clínica, que as
+métricas do worker (/admin/metrics/*) exigem o token de operador, e
+mede RPS/p95 com `--max-engines` menor que o número de clínicas (evicção do LRU).
+
+Uso:
+    python benchmarks/tenants_concurrency.py --tenants 8 --requests 2000 --concurrency 32 --max-engines 4
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from login_burst import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run(args) -> int:
+    import httpx
+    from app import models
+    from app.main import app
+
+    tenants = [f"clinica{i + 1}" for i in range(args.tenants)]
+    await app.router.startup()
+    problems = []
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            headers = {}
+            for tenant in tenants:
+                response = await client.post(
+                    "/token", data={"username": args.email, "password": args.password}, headers={"X-Tenant": tenant},
+                )
+                response.raise_for_status()
+                headers[tenant] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            # Um serviço por clínica, gravado direto no banco dela
+            from app.tenancy import registry
+            for tenant in tenants:
+                entry = await registry.acquire(tenant)
+                try:
+                    async with entry.sessionmaker() as db:
+                        db.add(models.Service(name=f"Serviço {tenant}", duration=60, price=100.0))
+                        await db.commit()
+                finally:
+                    registry.release(entry)
+
+            response = await client.get("/services", headers={**headers[tenants[0]], "X-Tenant": tenants[-1]})
+            if response.status_code != 403:
+                problems.append(f"token de {tenants[0]} com X-Tenant {tenants[-1]}: {response.status_code}, esperado 403")
+
+            # Métricas do worker: o admin de uma clínica não vê; o operador (METRICS_TOKEN) vê
+            for path in ("/admin/metrics/tenants", "/admin/metrics/routes"):
+                response = await client.get(path, headers=headers[tenants[0]])
+                if response.status_code != 403:
+                    problems.append(f"{path} com admin de {tenants[0]}: {response.status_code}, esperado 403")
+                response = await client.get(path, headers={"Authorization": f"Bearer {args.operator_token}"})
+                if response.status_code != 200:
+                    problems.append(f"{path} com token de operador: {response.status_code}, esperado 200")
+
+            rng = random.Random(args.seed)
+            latencies, errors = [], 0
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one():
+                nonlocal errors
+                tenant = rng.choice(tenants)
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get("/services", headers=headers[tenant])
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                    return
+                names = {s["name"] for s in response.json()}
+                if names != {f"Serviço {tenant}"}:
+                    problems.append(f"{tenant} recebeu {sorted(names)}")
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            stats = registry.stats()
+            print(
+                f"{args.requests} leituras em {len(tenants)} clínicas: {args.requests / elapsed:8.1f} req/s  "
+                f"p50={percentile(latencies, 50) * 1000:7.2f} ms  p95={percentile(latencies, 95) * 1000:7.2f} ms  "
+                f"erros={errors}  motores={stats['engines']}  criados={stats['created']}  evictos={stats['evicted']}"
+            )
+            if errors:
+                problems.append(f"{errors} respostas com erro")
+    finally:
+        await app.router.shutdown()
+    for problem in problems[:20]:
+        print(f"FALHA {problem}")
+    print("Isolamento entre clínicas OK." if not problems else f"{len(problems)} falhas.")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-engines", type=int, default=4)
+    parser.add_argument("--email", default="admin@estetica.com")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--operator-token", default="bench-operator")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'primary.db')}"
+        os.environ["DB_AUTO_BOOTSTRAP"] = "true"
+        os.environ["TENANT_DATABASE_URL_TEMPLATE"] = f"sqlite:///{os.path.join(tmp, '{tenant}.db')}"
+        os.environ["TENANT_AUTO_BOOTSTRAP"] = "true"
+        os.environ["TENANT_MAX_ENGINES"] = str(args.max_engines)
+        os.environ["ADMIN_EMAIL"] = args.email
+        os.environ["ADMIN_PASSWORD"] = args.password
+        os.environ["METRICS_TOKEN"] = args.operator_token
+        sys.path.insert(0, ROOT)
+        raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()